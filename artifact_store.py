@@ -0,0 +1,179 @@
+"""
+Shared, size-bounded store for the large values a Streamlit session works with
+(uploaded HTML, parsed brand lists, brand / comparison frames).
+
+Session state keeps only the handle `put()` returns: a content hash, so the
+same page or frame loaded in several browser tabs is held once per process.
+In-memory entries are evicted least-recently-used once their estimated size
+exceeds `max_bytes`; with a `spill_dir` evicted entries are pickled to disk
+(itself capped at `spill_max_bytes`, oldest files first) and read back on the
+next `get()`. A handle whose value is gone everywhere returns the default, so
+callers treat it like an empty session.
+"""
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from comparison_engine import content_hash, frame_hash
+from html_cache import content_digest
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_SPILL_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'combined_extractor', 'artifacts')
+DEFAULT_SPILL_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def artifact_handle(value, digest: str = None) -> str:
+    """Content-hash handle of `value` ('html-<sha256>' / 'frame-<sha256>' / 'data-<sha256>'); `digest` skips rehashing a string."""
+    if isinstance(value, str):
+        return f"html-{digest or content_digest(value)}"
+    if isinstance(value, pd.DataFrame):
+        return f"frame-{content_hash(frame_hash(value), [str(dtype) for dtype in value.dtypes])}"
+    return f"data-{content_hash(value)}"
+
+
+def artifact_size(value) -> int:
+    """Estimated in-memory size in bytes."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ArtifactStore:
+    """Thread-safe, content-addressed LRU of handle -> value with optional spill to disk."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, spill_dir: str = None, spill_max_bytes: int = DEFAULT_SPILL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.spilled = 0
+        self._entries = OrderedDict()  # handle -> (value, size)
+        self._sizes = {}  # handle -> size, kept for spilled entries too (session gauge)
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _spill_path(self, handle: str) -> str:
+        return os.path.join(self.spill_dir, f"{handle}.pkl")
+
+    def put(self, value, digest: str = None) -> str:
+        """Store `value` (not copied; treat it as read-only) and return its handle."""
+        handle = artifact_handle(value, digest)
+        with self._lock:
+            if handle in self._entries:
+                self._entries.move_to_end(handle)
+                return handle
+        size = artifact_size(value)
+        self._insert(handle, value, size)
+        return handle
+
+    def get(self, handle: str, default=None):
+        if not handle:
+            return default
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(handle)
+                return entry[0]
+            self.misses += 1
+        if not self.spill_dir:
+            return default
+        try:
+            with open(self._spill_path(handle), 'rb') as fh:
+                value = pickle.load(fh)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return default
+        self._insert(handle, value, self._sizes.get(handle) or artifact_size(value))
+        return value
+
+    def size_of(self, handle: str) -> int:
+        """Estimated size of a handle's value (0 when unknown)."""
+        return self._sizes.get(handle, 0) if handle else 0
+
+    def _insert(self, handle: str, value, size: int) -> None:
+        evicted = []
+        with self._lock:
+            if handle not in self._entries:
+                self._entries[handle] = (value, size); self.size += size; self._sizes[handle] = size
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                evicted_handle, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                evicted.append((evicted_handle, evicted_value))
+        if not self.spill_dir:
+            for evicted_handle, _ in evicted: self._sizes.pop(evicted_handle, None)
+            return
+        for evicted_handle, evicted_value in evicted:
+            self._spill(evicted_handle, evicted_value)
+        if evicted:
+            self._prune_spill_dir()
+
+    def _spill(self, handle: str, value) -> None:
+        path = self._spill_path(handle)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self.spilled += 1
+        except OSError as e:
+            print(f"Warning: Could not spill artifact {handle}: {e}")
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+    def _prune_spill_dir(self) -> None:
+        files = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith('.pkl'):
+                try: stat = entry.stat()
+                except OSError: continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.spill_max_bytes:
+                break
+            try: os.remove(path); total -= size
+            except OSError: continue
+            self._sizes.pop(os.path.basename(path)[:-len('.pkl')], None)
+
+    def stats(self) -> dict:
+        """In-memory entry count and size, hit / miss / spill counters."""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'spilled': self.spilled}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> ArtifactStore:
+    """
+    Process-wide store (shared by every session) configured from ARTIFACT_STORE_MAX_MB
+    and ARTIFACT_STORE_SPILL_DIR; set ARTIFACT_STORE_SPILL_DIR to an empty string to keep
+    everything in memory (also the fallback, with a warning, when it cannot be created).
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            max_bytes = int(float(os.environ.get('ARTIFACT_STORE_MAX_MB', DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024)
+            spill_dir = os.environ.get('ARTIFACT_STORE_SPILL_DIR', DEFAULT_SPILL_DIR) or None
+            try:
+                _default_store = ArtifactStore(max_bytes, spill_dir=spill_dir)
+            except OSError as e:
+                print(f"Warning: Artifact spill disabled, could not use {spill_dir}: {e}")
+                _default_store = ArtifactStore(max_bytes)
+        return _default_store
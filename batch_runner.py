@@ -0,0 +1,309 @@
+"""
+Headless batch runner: compare many Ounass / competitor PLP pairs without Streamlit.
+
+Manifest (CSV or JSON list of objects) columns:
+  ounass_url        – Ounass PLP URL (the full designer list parameter is added automatically)
+  competitor        – a competitor registered in extractor_registry, e.g. "Level Shoes" or "Sephora"
+  competitor_input  – competitor PLP URL, or a path to a saved HTML file
+
+Usage:
+  python batch_runner.py manifest.csv --parquet out/            # write a Parquet file per run
+  python batch_runner.py manifest.json --postgres               # save snapshots to DATABASE_URL
+  python batch_runner.py manifest.csv --parquet out/ --postgres --fetch-batch 40 --per-host 4
+  python batch_runner.py manifest.csv --postgres --fuzzy 90     # fuzzy second pass; alias suggestions listed
+  python batch_runner.py manifest.csv --postgres --fuzzy 90 --accept-aliases  # ...and stored as aliases
+  python batch_runner.py manifest.csv --postgres --incremental  # reuse the last snapshot's brand keys, store deltas
+  python batch_runner.py manifest.csv --postgres --multi        # one multi-site snapshot per Ounass URL
+  python batch_runner.py manifest.csv --postgres --metrics-file run.prom  # per-stage totals, Prometheus text format
+
+Pages are downloaded concurrently in windows of --fetch-batch pairs (each
+distinct URL once per window, per-host caps from --per-host), then parsed.
+
+With --incremental each pair is diffed against the latest saved snapshot of
+the same pair. When that snapshot was built with the same matching settings
+(its match_settings, i.e. the --fuzzy threshold), brand names seen there keep
+their stored merge key (cleaning and confirmed-alias decisions included), only
+new names and names the fuzzy pass paired are cleaned, and the fuzzy pass only
+runs when such a brand is left unmatched; otherwise the pair is compared from scratch. Either way the changed
+brands are stored in snapshot_changes next to the full snapshot (see db_utils
+for why both are kept).
+
+With --multi all manifest rows sharing an Ounass URL become one run: the
+Ounass page is fetched and parsed once, every competitor page alongside it,
+and the result is a single brand x site matrix (comparison.build_multi_comparison)
+saved as one snapshot named comparison.MULTI_SITE_NAME.
+
+Every stage (fetch, parse, clean, match, merge, DB save/load) is logged to
+stderr as one JSON line (pipeline_metrics; PIPELINE_METRICS_LOG=0 disables);
+--metrics-file writes the run's per-stage totals for a Prometheus textfile collector.
+
+Parquet output needs `pyarrow` (or `fastparquet`) installed.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+import db_utils
+from brand_aliases import get_alias_index
+from comparison import (MULTI_SITE_NAME, build_brand_frame, build_multi_comparison, match_settings, snapshot_brand_keys, snapshot_changes,
+                        snapshot_fuzzy_pairs, to_multi_snapshot_rows, to_saved_frame, to_snapshot_rows)
+from comparison_engine import compare_brand_lists
+from extractor_registry import OUNASS_SITE, competitor_names, get_site
+from fetcher import DEFAULT_PER_HOST_LIMIT, fetch_all
+from pipeline_metrics import render_prometheus, stage
+MANIFEST_COLUMNS = ['ounass_url', 'competitor', 'competitor_input']
+DEFAULT_FETCH_BATCH = 20
+
+
+def load_manifest(path: str) -> list[dict]:
+    """Read a CSV or JSON manifest into a list of {'ounass_url', 'competitor', 'competitor_input'} dicts."""
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as fh:
+            rows = json.load(fh)
+    else:
+        rows = pd.read_csv(path, dtype=str).fillna('').to_dict(orient='records')
+    pairs = []
+    for line_no, row in enumerate(rows, start=1):
+        missing = [col for col in MANIFEST_COLUMNS if not str(row.get(col) or '').strip()]
+        if missing:
+            print(f"Warning (Batch): Manifest row {line_no} is missing {', '.join(missing)}. Skipping.")
+            continue
+        pairs.append({col: str(row[col]).strip() for col in MANIFEST_COLUMNS})
+    return pairs
+
+
+def read_html_file(path: str) -> str:
+    with open(path, 'rb') as fh:
+        return fh.read().decode('utf-8', errors='ignore')
+
+
+def group_multi_site(pairs: list[dict]) -> list[dict]:
+    """
+    Fold manifest pairs into one multi-site run per Ounass URL: {'ounass_url', 'competitor':
+    MULTI_SITE_NAME, 'competitor_input': JSON of the inputs, 'inputs': {competitor: input}}.
+    """
+    groups = {}
+    for pair in pairs:
+        inputs = groups.setdefault(pair['ounass_url'], {})
+        if pair['competitor'] in inputs:
+            print(f"Warning (Batch): {pair['competitor']} is listed twice for {pair['ounass_url']}; using {pair['competitor_input']}.")
+        inputs[pair['competitor']] = pair['competitor_input']
+    return [{'ounass_url': ounass_url, 'competitor': MULTI_SITE_NAME, 'competitor_input': json.dumps(inputs, sort_keys=True), 'inputs': inputs}
+            for ounass_url, inputs in groups.items()]
+
+
+def pair_urls(pair: dict) -> list[str]:
+    """URLs that must be downloaded for a manifest pair or multi-site run (competitor files on disk are read directly)."""
+    urls = [get_site(OUNASS_SITE).normalize_url(pair['ounass_url'])]
+    for competitor, competitor_input in (pair.get('inputs') or {pair['competitor']: pair['competitor_input']}).items():
+        if not os.path.isfile(competitor_input):
+            urls.append(get_site(competitor).normalize_url(competitor_input))
+    return urls
+
+
+def _page_or_raise(page):
+    if isinstance(page, Exception):
+        raise page
+    return page
+
+
+def _site_html(site: str, site_input: str, pages: dict) -> str:
+    """HTML of a site's input: a saved file on disk, or the pre-downloaded page."""
+    if os.path.isfile(site_input):
+        return read_html_file(site_input)
+    return _page_or_raise(pages[get_site(site).normalize_url(site_input)])
+
+
+def _parse(site: str, html: str) -> list:
+    """Parse a page inline, recorded as a 'parse' stage."""
+    with stage('parse', site=site, bytes=len(html or '')) as rec:
+        brands = get_site(site).parse(html)
+        rec['brands'] = len(brands)
+    return brands
+
+
+def run_pair(ounass_url: str, competitor: str, competitor_input: str, pages: dict = None,
+             fuzzy_threshold: float = None, aliases=None, previous_rows=None, previous_fuzzy_pairs=None) -> pd.DataFrame:
+    """
+    Run one Ounass vs competitor comparison end to end and return the sorted
+    comparison frame (same layout the app builds). `pages` maps URL -> HTML
+    (or the fetch exception) for pre-downloaded pages; `fuzzy_threshold` /
+    `aliases` are passed to comparison_engine.compare_brand_lists. `previous_rows`
+    (snapshot_brands rows of the pair's last snapshot) makes the run incremental;
+    names in its `previous_fuzzy_pairs` are matched again rather than reused.
+    Raises on any failure.
+    """
+    if competitor not in competitor_names():
+        raise ValueError(f"Unknown competitor '{competitor}'. Expected one of: {', '.join(competitor_names())}")
+    ounass_site = get_site(OUNASS_SITE)
+    pair = {'ounass_url': ounass_url, 'competitor': competitor, 'competitor_input': competitor_input}
+    if pages is None:
+        urls = pair_urls(pair)
+        pages = dict(zip(urls, fetch_all(urls)))
+
+    ounass_records = _parse(OUNASS_SITE, _page_or_raise(pages[ounass_site.normalize_url(ounass_url)]))
+    competitor_records = _parse(competitor, _site_html(competitor, competitor_input, pages))
+    result = compare_brand_lists(ounass_records, competitor_records, competitor, fuzzy_threshold=fuzzy_threshold, aliases=aliases,
+                                 known_keys=snapshot_brand_keys(previous_rows, previous_fuzzy_pairs) if previous_rows else None)
+    if result.df_ounass.empty:
+        raise ValueError("No Ounass brands extracted.")
+    if result.df_competitor.empty:
+        raise ValueError(f"No {competitor} brands extracted.")
+    return result.df_comparison
+
+
+def run_multi(ounass_url: str, inputs: dict, pages: dict = None, aliases=None, previous_rows=None) -> pd.DataFrame:
+    """
+    Compare Ounass against every competitor in `inputs` ({competitor: URL or file path})
+    in one run and return the brand x site matrix (sites in attrs['sites']). A competitor
+    that yields no brands is kept as an all-zero column; raises when Ounass or every
+    competitor yields nothing.
+    """
+    unknown = [competitor for competitor in inputs if competitor not in competitor_names()]
+    if unknown:
+        raise ValueError(f"Unknown competitor(s) {', '.join(unknown)}. Expected any of: {', '.join(competitor_names())}")
+    if pages is None:
+        urls = pair_urls({'ounass_url': ounass_url, 'competitor': MULTI_SITE_NAME, 'inputs': inputs})
+        pages = dict(zip(urls, fetch_all(urls)))
+
+    known_keys = snapshot_brand_keys(previous_rows) if previous_rows else {}
+    frames = {}
+    for site, site_input in [(OUNASS_SITE, ounass_url), *inputs.items()]:
+        frames[site] = build_brand_frame(_parse(site, _site_html(site, site_input, pages)), site, known_keys=known_keys.get(site))
+        if frames[site].empty and site != OUNASS_SITE: print(f"Warning (Batch): No {site} brands extracted for {ounass_url}.")
+    if frames[OUNASS_SITE].empty:
+        raise ValueError("No Ounass brands extracted.")
+    if all(frames[site].empty for site in inputs):
+        raise ValueError("No competitor brands extracted.")
+    return build_multi_comparison(frames, aliases=aliases)
+
+
+def run_manifest(pairs: list[dict], parquet_dir: str = None, save_postgres: bool = False,
+                 fetch_batch: int = DEFAULT_FETCH_BATCH, per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 fuzzy_threshold: float = None, incremental: bool = False, accept_aliases: bool = False) -> list[dict]:
+    """
+    Run every manifest pair, write the requested outputs and return a per-pair status list.
+    With Postgres, known brand aliases are applied; fuzzy matches are only listed as
+    suggestions unless `accept_aliases` stores them. `incremental` diffs each pair
+    against its latest saved snapshot.
+    """
+    conn = None; aliases = None
+    if save_postgres:
+        db_url = db_utils.get_database_url()
+        if not db_url:
+            raise RuntimeError("DATABASE_URL is not set; cannot write to Postgres.")
+        conn = db_utils.get_pool(db_url, maxconn=1).getconn()
+        db_utils.migrate(conn)
+        aliases = get_alias_index(conn)
+
+    run_timestamp = db_utils.snapshot_timestamp()
+    statuses, saved_frames, unsaved_suggestions = [], [], {}
+    try:
+        pages = {}
+        for idx, pair in enumerate(pairs, start=1):
+            if (idx - 1) % fetch_batch == 0:
+                # Download the next window of pairs concurrently; earlier pages are released.
+                window_urls = [url for p in pairs[idx - 1:idx - 1 + fetch_batch] for url in pair_urls(p)]
+                pages = dict(zip(window_urls, fetch_all(window_urls, per_host_limit=per_host_limit)))
+            label = f"[{idx}/{len(pairs)}] Ounass vs {pair['competitor']}"
+            status = dict({key: value for key, value in pair.items() if key != 'inputs'}, ok=False, brands=0, snapshot_id=None, changed=None, error=None)
+            try:
+                base_id, previous_rows, base_settings, base_fuzzy_pairs = None, [], None, None
+                is_multi = pair['competitor'] == MULTI_SITE_NAME
+                settings = match_settings(None if is_multi else fuzzy_threshold)
+                if conn is not None and incremental:
+                    base_id, previous_rows, base_settings, base_fuzzy_pairs = db_utils.load_latest_snapshot(conn, *db_utils.snapshot_group_key(pair['ounass_url'], pair['competitor'], pair['competitor_input']))
+                # Keys judged under other settings are not reused, nor those of a fuzzy snapshot that did not record its fuzzy pairs.
+                reusable = base_settings == settings and (settings['fuzzy_threshold'] is None or base_fuzzy_pairs is not None)
+                known_rows = previous_rows if reusable else None
+                if is_multi: df_comparison = run_multi(pair['ounass_url'], pair['inputs'], pages=pages, aliases=aliases, previous_rows=known_rows)
+                else: df_comparison = run_pair(pair['ounass_url'], pair['competitor'], pair['competitor_input'], pages=pages,
+                                               fuzzy_threshold=fuzzy_threshold, aliases=aliases, previous_rows=known_rows, previous_fuzzy_pairs=base_fuzzy_pairs)
+                status['brands'] = len(df_comparison)
+                suggestions = df_comparison.attrs.get('alias_suggestions', [])
+                if accept_aliases and aliases is not None: aliases.confirm(suggestions)
+                else: unsaved_suggestions.update({(site, alias_key): (site, alias_key, canonical_key, score) for site, alias_key, canonical_key, _, score in suggestions})
+                if conn is not None:
+                    if aliases.pending: aliases.flush(conn)
+                    if is_multi: brand_rows = to_multi_snapshot_rows(df_comparison, df_comparison.attrs['sites'])
+                    else: brand_rows = to_snapshot_rows(df_comparison, pair['competitor'])
+                    changes = snapshot_changes(previous_rows, brand_rows) if base_id is not None else None
+                    if changes is not None: status['changed'] = len(changes)
+                    status['snapshot_id'] = db_utils.insert_comparison(conn, pair['ounass_url'], pair['competitor'], pair['competitor_input'], brand_rows,
+                                                                       timestamp=run_timestamp, base_snapshot_id=base_id, changes=changes, match_settings=settings,
+                                                                       fuzzy_pairs=snapshot_fuzzy_pairs(df_comparison))
+                if parquet_dir:
+                    df_saved = df_comparison.copy() if is_multi else to_saved_frame(df_comparison, pair['competitor'])
+                    df_saved.insert(0, 'competitor_input', pair['competitor_input'])
+                    df_saved.insert(0, 'competitor_name', pair['competitor'])
+                    df_saved.insert(0, 'ounass_url', pair['ounass_url'])
+                    saved_frames.append(df_saved)
+                status['ok'] = True
+                changed_note = f", {status['changed']} changed since snapshot {base_id}" if status['changed'] is not None else ""
+                print(f"{label}: {status['brands']} brands{changed_note}.")
+            except Exception as e:
+                if conn is not None:
+                    conn.rollback()
+                status['error'] = str(e)
+                print(f"Error (Batch) {label}: {e}")
+            statuses.append(status)
+    finally:
+        if conn is not None:
+            conn.close()
+    if unsaved_suggestions:
+        print(f"{len(unsaved_suggestions)} fuzzy alias suggestions not saved (rerun with --postgres --accept-aliases to store them):")
+        for site, alias_key, canonical_key, score in sorted(unsaved_suggestions.values(), key=lambda item: -(item[3] or 0)):
+            print(f"  {site}: {alias_key} -> {canonical_key} ({score:.0f})")
+
+    if parquet_dir and saved_frames:
+        os.makedirs(parquet_dir, exist_ok=True)
+        df_all = pd.concat(saved_frames, ignore_index=True)
+        df_all.insert(0, 'run_timestamp', run_timestamp)
+        out_path = os.path.join(parquet_dir, f"comparisons_{datetime.now():%Y%m%d_%H%M%S}.parquet")
+        df_all.to_parquet(out_path, index=False)
+        print(f"Wrote {len(df_all)} rows to {out_path}")
+    return statuses
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run Ounass vs competitor PLP comparisons from a manifest.")
+    parser.add_argument('manifest', help="CSV or JSON manifest (ounass_url, competitor, competitor_input)")
+    parser.add_argument('--parquet', metavar='DIR', help="directory to write a Parquet file of all comparisons")
+    parser.add_argument('--postgres', action='store_true', help="save each comparison to the history DB (DATABASE_URL)")
+    parser.add_argument('--fetch-batch', type=int, default=DEFAULT_FETCH_BATCH, help="pairs downloaded concurrently per window (default: %(default)s)")
+    parser.add_argument('--fuzzy', type=float, metavar='THRESHOLD', help="fuzzy-match brands left unmatched by the exact merge (e.g. 90)")
+    parser.add_argument('--multi', action='store_true', help="compare each Ounass URL against all its manifest competitors in one multi-site run")
+    parser.add_argument('--accept-aliases', action='store_true', help="with --postgres, store this run's fuzzy matches as permanent brand aliases")
+    parser.add_argument('--incremental', action='store_true', help="with --postgres, diff each pair against its latest saved snapshot")
+    parser.add_argument('--metrics-file', metavar='PATH', help="write per-stage timing totals in the Prometheus text format")
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST_LIMIT, help="max concurrent requests per host (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if not args.parquet and not args.postgres:
+        parser.error("choose at least one output: --parquet DIR and/or --postgres")
+    if args.incremental and not args.postgres:
+        parser.error("--incremental needs --postgres (the previous snapshots live in the history DB)")
+
+    pairs = load_manifest(args.manifest)
+    if not pairs:
+        print("Manifest contains no valid rows.")
+        return 1
+    if args.multi:
+        pairs = group_multi_site(pairs)
+    statuses = run_manifest(pairs, parquet_dir=args.parquet, save_postgres=args.postgres,
+                            fetch_batch=max(1, args.fetch_batch), per_host_limit=max(1, args.per_host),
+                            fuzzy_threshold=args.fuzzy, incremental=args.incremental, accept_aliases=args.accept_aliases)
+    if args.metrics_file:
+        with open(args.metrics_file, 'w', encoding='utf-8') as f:
+            f.write(render_prometheus())
+    failed = [s for s in statuses if not s['ok']]
+    print(f"Finished: {len(statuses) - len(failed)} succeeded, {len(failed)} failed.")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
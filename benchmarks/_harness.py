@@ -0,0 +1,31 @@
+"""Timing / peak-memory helpers shared by the benchmark scripts."""
+import json
+import resource
+import subprocess
+import sys
+import time
+
+
+def best_time(func, *args, repeat: int = 5, **kwargs) -> float:
+    """Best wall-clock seconds over `repeat` calls (the minimum is the least noisy estimate)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (Linux reports ru_maxrss in KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(module: str, *args) -> dict:
+    """
+    Run `python -m <module> --worker <args…>` in a fresh interpreter and return
+    the JSON object it prints, so each measurement gets its own RSS high-water mark.
+    """
+    completed = subprocess.run([sys.executable, '-m', module, '--worker', *map(str, args)],
+                               capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
@@ -0,0 +1,86 @@
+"""
+Fuzzy second-pass benchmark: per-row process.extractOne + frame scan (the old
+utils.merge_brand_frames loop) vs brand_matching.match_brands.
+
+  python -m benchmarks.bench_brand_matching
+  python -m benchmarks.bench_brand_matching --unmatched 500 2000 --threshold 90
+
+Both sides get `n` unmatched names; the right side holds variants of the left
+names (suffix dropped/added, designer first name dropped, typos) plus unrelated
+names, so precision/recall against the known pairing are reported too.
+"""
+import argparse
+import random
+import sys
+
+import pandas as pd
+
+from benchmarks._harness import best_time
+from benchmarks.corpus import brand_names
+
+
+def variant(name: str, rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.3: return name.upper()
+    if roll < 0.5: return name.split(' ', 1)[-1]  # drop the first word ("Maison X" -> "X")
+    if roll < 0.7: return f"{name} Beauty"
+    if roll < 0.85:
+        i = rng.randrange(len(name))
+        return name[:i] + name[i + 1:]  # typo: one character dropped
+    return name.replace(' ', '-')
+
+
+def make_sides(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    left = brand_names(n, seed)
+    paired = rng.sample(range(n), int(n * 0.6))
+    right, truth = [], {}
+    for i in paired:
+        truth[len(right)] = i; right.append(variant(left[i], rng))
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    right += [' '.join(''.join(rng.choice(letters) for _ in range(rng.randint(3, 8))).title() for _ in range(rng.randint(1, 3)))
+              for _ in range(n - len(paired))]  # unrelated names
+    return left, right, truth
+
+
+def old_loop(left, right, threshold):
+    from thefuzz import process
+    df_l = pd.DataFrame({'Designer': left}); matches = []
+    choices = df_l['Designer'].tolist()
+    for j, name in enumerate(right):
+        cand, score = process.extractOne(name, choices)
+        if score >= threshold:
+            row_match = df_l.loc[df_l['Designer'] == cand].iloc[0]
+            matches.append((int(row_match.name), j, score))
+    return matches
+
+
+def new_engine(left, right, threshold):
+    from brand_matching import match_brands
+    return match_brands(left, right, threshold=threshold)
+
+
+def quality(matches, truth):
+    correct = sum(1 for i, j, _ in matches if truth.get(j) == i)
+    return correct / max(len(matches), 1), correct / max(len(truth), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--unmatched', type=int, nargs='+', default=[200, 1000], help="one-sided rows per side")
+    parser.add_argument('--threshold', type=float, default=90)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'n':>6} {'engine':<14} {'ms':>10} {'pairs':>6} {'precision':>10} {'recall':>7}")
+    for n in args.unmatched:
+        left, right, truth = make_sides(n)
+        for label, func in (('extractOne', old_loop), ('match_brands', new_engine)):
+            matches = func(left, right, args.threshold)
+            seconds = best_time(func, left, right, args.threshold, repeat=args.repeat)
+            precision, recall = quality(matches, truth)
+            print(f"{n:>6} {label:<14} {seconds * 1000:>10.1f} {len(matches):>6} {precision:>10.2f} {recall:>7.2f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
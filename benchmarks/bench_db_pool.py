@@ -0,0 +1,61 @@
+"""
+Per-call latency of the history store: a fresh connection per call (old
+get_db_connection) vs a pooled connection (db_utils.ConnectionPool).
+
+  DATABASE_URL=postgresql://... python -m benchmarks.bench_db_pool
+  DATABASE_URL=... DATABASE_SSLMODE=require python -m benchmarks.bench_db_pool --calls 200
+
+Each "call" is what the app does per DB helper: get a connection, run the
+sidebar's history listing query, give the connection back. The TLS share of
+the handshake only shows up with DATABASE_SSLMODE=require against a TLS server.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import db_utils
+
+LIST_SQL = "SELECT id, timestamp, ounass_url, levelshoes_url, comparison_name, competitor_name, competitor_input FROM comparisons ORDER BY timestamp DESC"
+
+
+def one_call(get_conn) -> float:
+    start = time.perf_counter()
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(LIST_SQL)
+            cur.fetchall()
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def summarize(label: str, samples: list[float]) -> None:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"{label:<22} {statistics.mean(ms):>9.2f} {statistics.median(ms):>9.2f} {p95:>9.2f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    db_url = db_utils.get_database_url()
+    if not db_url:
+        print("Set DATABASE_URL to a (local) Postgres to run this benchmark.")
+        return 1
+    conn = db_utils.connect(db_url); db_utils.migrate(conn); conn.close()
+
+    pool = db_utils.ConnectionPool(db_url)
+    one_call(pool.getconn)  # warm the pool
+    print(f"{'per call (ms)':<22} {'mean':>9} {'median':>9} {'p95':>9}")
+    summarize("new connection", [one_call(lambda: db_utils.connect(db_url)) for _ in range(args.calls)])
+    summarize("pooled connection", [one_call(pool.getconn) for _ in range(args.calls)])
+    pool.closeall()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
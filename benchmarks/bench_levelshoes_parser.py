@@ -0,0 +1,70 @@
+"""
+Level Shoes __NEXT_DATA__ parser benchmark: full DOM vs payload slice (json.loads / incremental walk).
+
+  python -m benchmarks.bench_levelshoes_parser                       # synthetic pages
+  python -m benchmarks.bench_levelshoes_parser saved/levelshoes_*.html   # saved pages
+  python -m benchmarks.bench_levelshoes_parser --brands 500 5000 --products 40000 --json levelshoes.json
+
+Every (page, mode) pair runs in a fresh interpreter so peak RSS is not
+shared between measurements; RSS is reported as the increase over the
+process state right after the page was loaded.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks._harness import best_time, peak_rss_mb, run_worker
+from benchmarks.corpus import levelshoes_page, write_synthetic_page
+
+MODULE = 'benchmarks.bench_levelshoes_parser'
+MODES = ('soup', 'json', 'stream')
+
+
+def load_page(path: str) -> str:
+    with open(path, 'rb') as fh:
+        return fh.read().decode('utf-8', errors='ignore')
+
+
+def worker(path: str, mode: str, repeat: int) -> dict:
+    import levelshoes_extractor
+    html = load_page(path)
+    rss_before = peak_rss_mb()
+    result = levelshoes_extractor._process_levelshoes_html_internal(html, mode=mode)
+    seconds = best_time(levelshoes_extractor._process_levelshoes_html_internal, html, mode=mode, repeat=repeat)
+    return {'page': os.path.basename(path), 'mode': mode, 'bytes': len(html.encode('utf-8')), 'brands': len(result),
+            'seconds': seconds, 'peak_rss_delta_mb': round(peak_rss_mb() - rss_before, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pages', nargs='*', help="saved Level Shoes PLP HTML files (default: synthetic pages)")
+    parser.add_argument('--brands', type=int, nargs='+', default=[200, 2000], help="synthetic brand facet sizes")
+    parser.add_argument('--products', type=int, default=20000, help="synthetic products in the Apollo state")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--worker', nargs=3, metavar=('PATH', 'MODE', 'REPEAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        path, mode, repeat = args.worker
+        print(json.dumps(worker(path, mode, int(repeat))))
+        return
+
+    # Synthetic pages are written to disk first so generating them never inflates a worker's RSS.
+    sources = args.pages or [write_synthetic_page(levelshoes_page, n, args.products, tempfile.gettempdir()) for n in args.brands]
+    results = []
+    print(f"{'page':<40} {'mode':<7} {'KiB':>8} {'brands':>7} {'ms':>9} {'peak RSS +MiB':>14}")
+    for source in sources:
+        for mode in MODES:
+            r = run_worker(MODULE, source, mode, args.repeat)
+            results.append(r)
+            print(f"{r['page'][-40:]:<40} {mode:<7} {r['bytes'] / 1024:>8.0f} {r['brands']:>7} {r['seconds'] * 1000:>9.1f} {r['peak_rss_delta_mb']:>14.1f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
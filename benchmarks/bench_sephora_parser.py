@@ -0,0 +1,72 @@
+"""
+Sephora hitCount label scanner benchmark.
+
+  python -m benchmarks.bench_sephora_parser                          # synthetic pages
+  python -m benchmarks.bench_sephora_parser saved/sephora_*.html     # saved pages
+  python -m benchmarks.bench_sephora_parser --labels 300 3000 --matches 100000 --json sephora.json
+
+Every page runs in a fresh interpreter so peak RSS is not shared between
+measurements; RSS is reported as the increase over the process state right
+after the page was loaded.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks._harness import best_time, peak_rss_mb, run_worker
+from benchmarks.corpus import sephora_page, write_synthetic_page
+
+MODULE = 'benchmarks.bench_sephora_parser'
+
+
+def load_page(path: str) -> str:
+    with open(path, 'rb') as fh:
+        return fh.read().decode('utf-8', errors='ignore')
+
+
+def worker(path: str, repeat: int) -> dict:
+    import sephora_extractor
+    html = load_page(path)
+    labels = [m.group(2) for m in sephora_extractor.HIT_COUNT_PATTERN.finditer(html)]
+    n_matches, n_unique = len(labels), len(set(labels))
+    del labels
+    rss_before = peak_rss_mb()
+    result = sephora_extractor._process_sephora_html_internal(html)
+    seconds = best_time(sephora_extractor._process_sephora_html_internal, html, repeat=repeat)
+    return {'page': os.path.basename(path), 'bytes': len(html.encode('utf-8')), 'matches': n_matches,
+            'unique_labels': n_unique, 'brands': len(result), 'seconds': seconds,
+            'peak_rss_delta_mb': round(peak_rss_mb() - rss_before, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pages', nargs='*', help="saved Sephora PLP HTML files (default: synthetic pages)")
+    parser.add_argument('--labels', type=int, nargs='+', default=[300, 3000], help="synthetic distinct labels")
+    parser.add_argument('--matches', type=int, default=50000, help="synthetic hitCount fragments per page")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--worker', nargs=2, metavar=('PATH', 'REPEAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        path, repeat = args.worker
+        print(json.dumps(worker(path, int(repeat))))
+        return
+
+    # Synthetic pages are written to disk first so generating them never inflates a worker's RSS.
+    sources = args.pages or [write_synthetic_page(sephora_page, n, args.matches, tempfile.gettempdir()) for n in args.labels]
+    results = []
+    print(f"{'page':<40} {'KiB':>8} {'matches':>8} {'unique':>7} {'brands':>7} {'ms':>9} {'peak RSS +MiB':>14}")
+    for source in sources:
+        r = run_worker(MODULE, source, args.repeat)
+        results.append(r)
+        print(f"{r['page'][-40:]:<40} {r['bytes'] / 1024:>8.0f} {r['matches']:>8} {r['unique_labels']:>7} {r['brands']:>7} {r['seconds'] * 1000:>9.1f} {r['peak_rss_delta_mb']:>14.1f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
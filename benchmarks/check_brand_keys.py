@@ -0,0 +1,85 @@
+"""
+Golden-corpus check and micro-benchmark for utils.clean_brand_name / clean_brand_names.
+
+  python -m benchmarks.check_brand_keys                 # verify keys, then time .apply vs vectorized
+  python -m benchmarks.check_brand_keys --rows 500000   # bigger synthetic frame for the timing
+
+benchmarks/golden/brand_keys.jsonl holds {"name", "key"} pairs produced by the
+original (pre-memoization) implementation; every key must match byte for byte.
+Exits non-zero on any mismatch.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+import pandas as pd
+
+from benchmarks._harness import best_time
+from benchmarks.corpus import brand_names
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden', 'brand_keys.jsonl')
+
+
+def load_golden(path: str = GOLDEN_PATH) -> list[dict]:
+    with open(path, encoding='utf-8') as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def check(golden: list[dict]) -> list[str]:
+    """Mismatch descriptions for both the scalar and the Series entry point (empty when all keys agree)."""
+    from utils import clean_brand_name, clean_brand_names
+    errors = []
+    for row in golden:
+        key = clean_brand_name(row['name'])
+        if key != row['key']:
+            errors.append(f"clean_brand_name({row['name']!r}) = {key!r}, expected {row['key']!r}")
+    vectorized = clean_brand_names(pd.Series([row['name'] for row in golden]))
+    for row, key in zip(golden, vectorized):
+        if key != row['key']:
+            errors.append(f"clean_brand_names[{row['name']!r}] = {key!r}, expected {row['key']!r}")
+    for value in (None, float('nan'), 5, ''):
+        if clean_brand_name(value) != "":
+            errors.append(f"clean_brand_name({value!r}) should be ''")
+    return errors
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help="rows in the synthetic timing frame")
+    parser.add_argument('--vocab', type=int, default=3000, help="distinct brand names in the timing frame")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    golden = load_golden()
+    errors = check(golden)
+    for error in errors[:20]:
+        print(error)
+    print(f"Golden corpus: {len(golden)} names, {len(errors)} mismatches.")
+    if errors:
+        return 1
+
+    from utils import _clean_brand_name_cached, clean_brand_name, clean_brand_names
+    rng = random.Random(0)
+    vocab = brand_names(args.vocab) + [row['name'] for row in golden]
+    names = pd.Series([rng.choice(vocab) for _ in range(args.rows)])
+
+    def cold(func):
+        _clean_brand_name_cached.cache_clear()
+        return func()
+
+    timings = {
+        'apply (cold memo)': best_time(cold, lambda: names.apply(clean_brand_name), repeat=args.repeat),
+        'apply (warm memo)': best_time(names.apply, clean_brand_name, repeat=args.repeat),
+        'clean_brand_names (cold memo)': best_time(cold, lambda: clean_brand_names(names), repeat=args.repeat),
+        'clean_brand_names (warm memo)': best_time(clean_brand_names, names, repeat=args.repeat),
+    }
+    print(f"{args.rows} rows, {names.nunique()} distinct names:")
+    for label, seconds in timings.items():
+        print(f"  {label:<32} {seconds * 1000:>9.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
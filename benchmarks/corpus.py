@@ -0,0 +1,87 @@
+"""Synthetic PLP pages for benchmarks (deterministic for a given size and seed)."""
+import os
+import random
+
+
+def brand_names(n: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    stems = ['Maison', 'Atelier', 'Studio', 'Casa', 'House of', 'Le', 'La', 'The']
+    words = ['Rouge', 'Noir', 'Bleu', 'Lumière', 'Étoile', 'Ocean', 'Cedar', 'Amber', 'Iris', 'Vetiver', 'Musk', 'Oud']
+    suffixes = ['', '', '', ' Beauty', ' Parfums', ' Cosmetics', ' Paris', ' & Co.', ' London']
+    return [f"{rng.choice(stems)} {rng.choice(words)} {i}{rng.choice(suffixes)}" for i in range(n)]
+
+
+def ounass_page(n_brands: int, n_products: int = 60, seed: int = 0) -> str:
+    """Ounass-style PLP: a few facet sections (Designer with `n_brands` links) plus a product grid."""
+    rng = random.Random(seed)
+    designer_items = ''.join(
+        f'<li><a class="FacetLink" href="/designers/{i}"><span class="FacetLink-name">{name} '
+        f'<span class="FacetLink-count">({rng.randint(1, 400)})</span></span></a></li>'
+        for i, name in enumerate(brand_names(n_brands, seed)))
+    other_facets = ''.join(
+        f'<section class="Facet"><header><h3>{title}</h3></header><ul>'
+        + ''.join(f'<li><a class="FacetLink" href="/{title}/{v}"><span class="FacetLink-name">{title} {v} '
+                  f'<span class="FacetLink-count">({rng.randint(1, 99)})</span></span></a></li>' for v in range(25))
+        + '</ul></section>'
+        for title in ('Category', 'Colour', 'Size'))
+    products = ''.join(
+        f'<div class="Product"><a href="/p/{i}"><img src="/img/{i}.jpg" alt="Product {i}">'
+        f'<div class="Product-brand">Brand {i}</div><div class="Product-name">Item {i}</div>'
+        f'<span class="Price">AED {rng.randint(100, 9000)}</span></a></div>'
+        for i in range(n_products))
+    return (f'<!DOCTYPE html><html><head><title>PLP</title><script>var state = {{}};</script></head><body>'
+            f'<aside>{other_facets}<section class="Facet"><header><h3>Designer</h3></header><ul>{designer_items}'
+            f'<li><a class="FacetLink" href="#"><span class="FacetLink-name">Show Less</span></a></li></ul></section></aside>'
+            f'<main>{products}</main></body></html>')
+
+
+def levelshoes_page(n_brands: int, n_products: int = 2000, seed: int = 0) -> str:
+    """Level Shoes-style Next.js page: products in the Apollo state, brand facet under ROOT_QUERY._productList."""
+    import json
+    rng = random.Random(seed)
+    names = brand_names(n_brands, seed)
+    apollo = {
+        f"Product:{i}": {"__typename": "Product", "id": i, "name": f"Item {i}", "brand": {"__ref": f"Brand:{i % max(n_brands, 1)}"},
+                         "images": [f"https://cdn.example.com/{i}/{j}.jpg" for j in range(6)],
+                         "price": {"amount": round(rng.uniform(100, 9000), 2), "currency": "AED"}}
+        for i in range(n_products)}
+    facets = [
+        {"key": "size", "label": "Size", "options": [{"name": str(s), "count": rng.randint(1, 99)} for s in range(34, 46)]},
+        {"key": "brand", "label": "Designer", "options": [{"name": name.upper(), "count": rng.randint(1, 400)} for name in names]
+         + [{"name": "View All", "count": 1}]},
+    ]
+    apollo["ROOT_QUERY"] = {"__typename": "Query", '_productList:({"categoryId":"1"})': {"facets": facets, "total": n_products}}
+    next_data = {"props": {"pageProps": {"__APOLLO_STATE__": apollo}}, "page": "/[...slug]", "buildId": "bench"}
+    return (f'<!DOCTYPE html><html><head><title>PLP</title></head><body><div id="__next">{"<div class=tile></div>" * 200}</div>'
+            f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(next_data)}</script></body></html>')
+
+
+def write_synthetic_page(generator, n_brands: int, n_products: int, directory: str) -> str:
+    """Render `generator(n_brands, n_products)` to <directory>/<generator>_<brands>_<products>.html and return the path."""
+    path = os.path.join(directory, f"{generator.__name__}_{n_brands}_{n_products}.html")
+    if not os.path.exists(path):
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(generator(n_brands, n_products))
+    return path
+
+
+def sephora_page(n_labels: int, n_matches: int = 20000, seed: int = 0) -> str:
+    """
+    Sephora-style page: `n_matches` escaped `\\"hitCount\\":N,\\"label\\":\\"…\\"` fragments
+    drawn (with heavy repetition) from `n_labels` distinct labels – brands in caps, some with
+    \\uXXXX escapes or UTF-8-as-Latin-1 mojibake, plus non-brand filter values.
+    """
+    rng = random.Random(seed)
+    labels = []
+    to_letters = str.maketrans('0123456789', 'ABCDEFGHIJ')  # brand heuristic rejects digits
+    for i, name in enumerate(brand_names(n_labels, seed)):
+        name = name.upper().translate(to_letters)
+        if i % 7 == 0: name = name.replace(' & ', ' \\\\u0026 ').replace('LUMIÈRE', 'LUMI\\\\u00c8RE')
+        elif i % 11 == 0: name = name.encode('utf-8').decode('latin-1')  # mojibake as served
+        elif i % 5 == 0: name = f"{name.title()} 50ml"  # filter value, fails the brand heuristic
+        labels.append(name.replace('"', ''))
+    fragments = ''.join(
+        f'\\"hitCount\\":{rng.randint(1, 500)},\\"label\\":\\"{rng.choice(labels)}\\"}},{{' for _ in range(n_matches))
+    filler = '<div class="product-tile"><img src="/img.jpg"><span>Product</span></div>' * (n_matches // 20)
+    return (f'<!DOCTYPE html><html><head><title>Sephora</title></head><body>{filler}'
+            f'<script>self.__next_f.push([1,"{{{fragments}}}"])</script></body></html>')
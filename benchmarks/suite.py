@@ -0,0 +1,227 @@
+"""
+Offline benchmark suite: every extractor, brand key cleaning and the merge over a versioned corpus.
+
+  python -m benchmarks.suite --json results.json                        # full suite
+  python -m benchmarks.suite --only parse --sizes 500 10000             # a subset
+  python -m benchmarks.suite --json new.json --compare results.json     # fail on regressions
+
+Corpus: synthetic Ounass / Level Shoes / Sephora PLP pages (benchmarks.corpus)
+at each --sizes brand count, up to 10k brands, rendered once into a directory
+named after CORPUS_VERSION, plus any saved real pages found under
+benchmarks/saved/<site>/*.html. Bump CORPUS_VERSION whenever a generator
+changes; every result records its input's sha256, so a comparison only
+matches cases whose input is byte-identical.
+
+Targets:
+  parse:<site>           _process_<site>_html_internal on each page
+  clean_brand_name       scalar key per name (cold memo), n distinct names
+  clean_brand_names      vectorized Series entry point (cold memo)
+  merge_brand_frames     utils.merge_brand_frames, exact keys only
+  build_comparison       the app's merge / sort block (comparison.build_comparison)
+
+Each (target, case) runs in a fresh interpreter (see _harness.run_worker), so
+peak RSS is per measurement; it is reported as the increase over the worker's
+state right after its input was loaded. Nothing touches the network.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from benchmarks._harness import best_time, peak_rss_mb, run_worker
+from benchmarks.corpus import brand_names, levelshoes_page, ounass_page, sephora_page
+
+MODULE = 'benchmarks.suite'
+CORPUS_VERSION = 1
+DEFAULT_SIZES = [50, 500, 2000, 10000]
+SAVED_DIR = os.path.join(os.path.dirname(__file__), 'saved')
+# site -> (extractor module, page generator, content items per page for a given brand count)
+SITES = {
+    'ounass': ('ounass_extractor', ounass_page, lambda n: 500),
+    'levelshoes': ('levelshoes_extractor', levelshoes_page, lambda n: 2000),
+    'sephora': ('sephora_extractor', sephora_page, lambda n: max(20000, 3 * n)),
+}
+TARGETS = ('parse', 'clean_brand_name', 'clean_brand_names', 'merge_brand_frames', 'build_comparison')
+
+
+def corpus_dir() -> str:
+    path = os.path.join(tempfile.gettempdir(), f"plp_bench_corpus_v{CORPUS_VERSION}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def sha256_of(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_cases(sizes) -> list[dict]:
+    """Synthetic pages at every size (rendered on first use) plus saved pages, as worker cases."""
+    cases = []
+    for site, (_, generator, items) in SITES.items():
+        for n in sizes:
+            path = os.path.join(corpus_dir(), f"{site}_{n}.html")
+            if not os.path.exists(path):
+                with open(path, 'w', encoding='utf-8') as fh:
+                    fh.write(generator(n, items(n)))
+            cases.append({'site': site, 'case': f"synthetic_{n}", 'path': path})
+        for path in sorted(glob.glob(os.path.join(SAVED_DIR, site, '*.html'))):
+            cases.append({'site': site, 'case': f"saved_{os.path.basename(path)}", 'path': path})
+    return cases
+
+
+def name_pair(n: int) -> tuple[list[str], list[str]]:
+    """Two brand lists of `n` names sharing ~70%, with the competitor side upper-cased as Level Shoes serves it."""
+    left = brand_names(n, seed=0)
+    right = [name.upper() for name in left[: int(n * 0.7)]] + brand_names(n - int(n * 0.7), seed=1)
+    return left, right
+
+
+def _result(target, case, items, seconds, rss_before, nbytes=None, sha256=None) -> dict:
+    return {'target': target, 'case': case, 'items': items, 'bytes': nbytes, 'sha256': sha256,
+            'seconds': seconds, 'items_per_s': round(items / seconds, 1) if seconds else None,
+            'mb_per_s': round(nbytes / seconds / 1e6, 2) if nbytes and seconds else None,
+            'peak_rss_delta_mb': round(peak_rss_mb() - rss_before, 1)}
+
+
+def worker(target: str, case: str, arg: str, repeat: int) -> dict:
+    """Measure one (target, case); `arg` is a page path for parse targets, else the brand count."""
+    if target.startswith('parse:'):
+        import importlib
+        site = target.split(':', 1)[1]
+        module = importlib.import_module(SITES[site][0])
+        parse = getattr(module, f"_process_{site}_html_internal")
+        with open(arg, 'rb') as fh:
+            raw = fh.read()
+        html = raw.decode('utf-8', errors='ignore')
+        rss_before = peak_rss_mb()
+        brands = parse(html)
+        seconds = best_time(parse, html, repeat=repeat)
+        result = _result(target, case, len(brands), seconds, rss_before, nbytes=len(raw), sha256=sha256_of(arg))
+        result['brands'] = len(brands)
+        return result
+
+    import pandas as pd
+    from utils import _clean_brand_name_cached, clean_brand_name, clean_brand_names
+    n = int(arg)
+    left, right = name_pair(n)
+    sha256 = hashlib.sha256(json.dumps([left, right]).encode('utf-8')).hexdigest()
+
+    def cold(func, *args):
+        _clean_brand_name_cached.cache_clear()
+        return func(*args)
+
+    if target == 'clean_brand_name':
+        rss_before = peak_rss_mb()
+        seconds = best_time(cold, lambda: [clean_brand_name(name) for name in left], repeat=repeat)
+        return _result(target, case, n, seconds, rss_before, sha256=sha256)
+    if target == 'clean_brand_names':
+        names = pd.Series(left)
+        rss_before = peak_rss_mb()
+        seconds = best_time(cold, clean_brand_names, names, repeat=repeat)
+        return _result(target, case, n, seconds, rss_before, sha256=sha256)
+    counts = [(i * 37) % 400 + 1 for i in range(n)]
+    if target == 'merge_brand_frames':
+        from utils import merge_brand_frames
+        df_left = pd.DataFrame({'Designer': left, 'Count': counts}); df_right = pd.DataFrame({'Designer': right, 'Count': counts[::-1]})
+        rss_before = peak_rss_mb()
+        seconds = best_time(merge_brand_frames, df_left, df_right, fuzzy_threshold=None, repeat=repeat)
+        return _result(target, case, 2 * n, seconds, rss_before, sha256=sha256)
+    if target == 'build_comparison':
+        from comparison import build_brand_frame, build_comparison
+        df_ounass = build_brand_frame([{'Brand': b, 'Count': c} for b, c in zip(left, counts)], 'Ounass')
+        df_competitor = build_brand_frame([{'Brand': b, 'Count': c} for b, c in zip(right, counts[::-1])], 'Level Shoes')
+        rss_before = peak_rss_mb()
+        seconds = best_time(build_comparison, df_ounass, df_competitor, 'Level Shoes', repeat=repeat)
+        return _result(target, case, 2 * n, seconds, rss_before, sha256=sha256)
+    raise ValueError(f"Unknown target '{target}'. Expected one of: {', '.join(TARGETS)}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """Regression lines for cases slower than `tolerance` x the baseline (same target, case and input hash)."""
+    with open(baseline_path, encoding='utf-8') as fh:
+        baseline = json.load(fh)
+    if baseline.get('corpus_version') != CORPUS_VERSION:
+        print(f"Warning: baseline corpus v{baseline.get('corpus_version')} != v{CORPUS_VERSION}; synthetic cases will not match.")
+    previous = {(r['target'], r['case'], r['sha256']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nvs {baseline_path} ({baseline.get('commit')}):")
+    for r in results:
+        old = previous.get((r['target'], r['case'], r['sha256']))
+        if old is None or not old['seconds']:
+            continue
+        ratio = r['seconds'] / old['seconds']
+        flag = ' REGRESSION' if ratio > tolerance else ''
+        print(f"  {r['target']:<20} {r['case']:<28} {old['seconds'] * 1000:>9.1f} -> {r['seconds'] * 1000:>9.1f} ms  x{ratio:.2f}{flag}")
+        if flag:
+            regressions.append(f"{r['target']} {r['case']}: x{ratio:.2f}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=TARGETS, default=list(TARGETS), help="targets to run (default: all)")
+    parser.add_argument('--sites', nargs='+', choices=list(SITES), default=list(SITES), help="sites for the parse target")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="brand counts (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against a previous --json file; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="slowdown ratio counted as a regression (default: %(default)s)")
+    parser.add_argument('--worker', nargs=4, metavar=('TARGET', 'CASE', 'ARG', 'REPEAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        target, case, arg, repeat = args.worker
+        print(json.dumps(worker(target, case, arg, int(repeat))))
+        return 0
+
+    # (target, case, worker arg); pages are rendered to disk first so generating them never inflates a worker's RSS.
+    jobs = []
+    if 'parse' in args.only:
+        jobs += [(f"parse:{c['site']}", c['case'], c['path']) for c in page_cases(args.sizes) if c['site'] in args.sites]
+    jobs += [(target, f"names_{n}", n) for target in args.only if target != 'parse' for n in args.sizes]
+
+    results = []
+    print(f"{'target':<20} {'case':<28} {'items':>7} {'ms':>9} {'items/s':>11} {'MB/s':>7} {'peak RSS +MiB':>14}")
+    for target, case, arg in jobs:
+        try:
+            r = run_worker(MODULE, target, case, arg, args.repeat)
+        except subprocess.CalledProcessError as e:
+            error_lines = (e.stderr or '').strip().splitlines()
+            print(f"{target:<20} {case[-28:]:<28} FAILED: {error_lines[-1] if error_lines else e}")
+            continue
+        results.append(r)
+        mb_per_s = f"{r['mb_per_s']:.1f}" if r['mb_per_s'] is not None else '-'
+        print(f"{target:<20} {case[-28:]:<28} {r['items']:>7} {r['seconds'] * 1000:>9.1f} {r['items_per_s'] or 0:>11.0f} {mb_per_s:>7} {r['peak_rss_delta_mb']:>14.1f}")
+
+    report = {'corpus_version': CORPUS_VERSION, 'commit': git_commit(), 'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'platform': platform.platform(), 'repeat': args.repeat, 'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond x{args.tolerance}.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Persistent brand alias dictionary (no Streamlit dependency).
+
+Postgres holds canonical brands and, per site, which cleaned brand keys are
+aliases of them:
+
+  brands        (id, canonical_key UNIQUE, display_name, created_at)
+  brand_aliases (site, alias_key) -> brand_id, source ('fuzzy' / 'manual'), score
+
+`BrandAliasIndex` mirrors the alias table as an in-memory hash map, loaded once
+per process and shared by every session, so resolving a key before the merge
+is an O(1) lookup. It holds confirmed aliases only: fuzzy matches found during a
+run are suggestions returned with that run's result (build_comparison
+attrs['alias_suggestions']). They pair the rows of that run but are neither
+applied to later runs nor stored until someone confirms them (`confirm()`, the
+app's review panel, `batch_runner.py --accept-aliases`). `flush(conn)` writes
+confirmed aliases back so later sweeps resolve them exactly.
+"""
+import threading
+
+from psycopg2.extras import execute_values
+
+ALIAS_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS brands (
+        id SERIAL PRIMARY KEY, canonical_key TEXT NOT NULL UNIQUE, display_name TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS brand_aliases (
+        site TEXT NOT NULL, alias_key TEXT NOT NULL,
+        brand_id INTEGER NOT NULL REFERENCES brands(id) ON DELETE CASCADE,
+        source TEXT NOT NULL DEFAULT 'fuzzy', score REAL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (site, alias_key)
+    );
+"""
+
+
+class BrandAliasIndex:
+    """(site, cleaned key) -> canonical key map with a write-back queue. Thread-safe."""
+
+    def __init__(self, aliases: dict = None):
+        self._aliases = dict(aliases or {})
+        self._pending = {}  # (site, alias_key) -> (canonical_key, display_name, source, score)
+        self._lock = threading.Lock()
+        self.version = 0  # bumped whenever learn() changes a mapping (part of comparison cache keys)
+
+    @classmethod
+    def load(cls, conn) -> 'BrandAliasIndex':
+        """Read every stored alias into memory."""
+        with conn.cursor() as cur:
+            cur.execute("SELECT a.site, a.alias_key, b.canonical_key FROM brand_aliases a JOIN brands b ON b.id = a.brand_id")
+            rows = cur.fetchall()
+        return cls({(site, alias_key): canonical_key for site, alias_key, canonical_key in rows})
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def lookup(self, site: str, key: str):
+        """Canonical key for a site's cleaned brand key, or None when it is not a known alias."""
+        return self._aliases.get((site, key))
+
+    def resolve(self, site: str, keys, targets=None):
+        """
+        Map an iterable / Series of cleaned keys to canonical keys (unknown keys unchanged).
+        With `targets` (the other side's keys), only keys missing from it are rewritten,
+        and only to a canonical key it contains – an alias never breaks an exact match.
+        """
+        aliases = self._aliases
+        if targets is None:
+            rewrite = lambda key: aliases.get((site, key), key)
+        else:
+            targets = set(targets)
+            def rewrite(key):
+                if key in targets: return key
+                canonical = aliases.get((site, key))
+                return canonical if canonical in targets else key
+        if hasattr(keys, 'map'):
+            return keys.map(rewrite)
+        return [rewrite(key) for key in keys]
+
+    def learn(self, site: str, alias_key: str, canonical_key: str, display_name: str = None, source: str = 'manual', score: float = None) -> None:
+        """Record a confirmed alias: usable immediately, persisted on the next flush()."""
+        if not alias_key or not canonical_key or alias_key == canonical_key:
+            return
+        with self._lock:
+            if self._aliases.get((site, alias_key)) != canonical_key: self.version += 1
+            self._aliases[(site, alias_key)] = canonical_key
+            self._pending[(site, alias_key)] = (canonical_key, display_name, source, score)
+
+    def confirm(self, suggestions) -> int:
+        """Learn reviewed fuzzy suggestions – (site, alias_key, canonical_key, display_name, score) – as aliases; returns how many."""
+        suggestions = list(suggestions)
+        for site, alias_key, canonical_key, display_name, score in suggestions:
+            self.learn(site, alias_key, canonical_key, display_name=display_name, source='fuzzy', score=score)
+        return len(suggestions)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self, conn) -> int:
+        """Upsert queued aliases (and their canonical brands); returns rows written. Commits on success."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with conn.cursor() as cur:
+                brands = {canonical_key: display_name for canonical_key, display_name, _, _ in pending.values()}
+                execute_values(cur, """INSERT INTO brands (canonical_key, display_name) VALUES %s
+                                       ON CONFLICT (canonical_key) DO UPDATE SET display_name = COALESCE(brands.display_name, EXCLUDED.display_name)""",
+                               list(brands.items()))
+                execute_values(cur, """INSERT INTO brand_aliases (site, alias_key, brand_id, source, score)
+                                       SELECT v.site, v.alias_key, b.id, v.source, v.score
+                                       FROM (VALUES %s) AS v (site, alias_key, canonical_key, source, score)
+                                       JOIN brands b ON b.canonical_key = v.canonical_key
+                                       ON CONFLICT (site, alias_key) DO UPDATE SET brand_id = EXCLUDED.brand_id,
+                                           source = EXCLUDED.source, score = EXCLUDED.score""",
+                               [(site, alias_key, canonical_key, source, score)
+                                for (site, alias_key), (canonical_key, _, source, score) in pending.items()],
+                               template="(%s, %s, %s, %s, %s::real)")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            with self._lock:
+                for key, value in pending.items(): self._pending.setdefault(key, value)  # retry on the next flush
+            raise
+        return len(pending)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_alias_index(conn) -> BrandAliasIndex:
+    """Process-wide index, loaded from `conn` on first use and shared afterwards."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = BrandAliasIndex.load(conn)
+        return _default_index
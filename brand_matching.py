@@ -0,0 +1,139 @@
+"""
+Fuzzy second-pass brand matching for rows the exact `Brand_Cleaned` merge left one-sided.
+
+Candidates are blocked with a character-trigram index over the cleaned keys,
+scored in one batch per scorer (rapidfuzz `cpdist`, C-level, multi-threaded)
+and resolved into one-to-one pairs greedily by descending score. No Streamlit
+dependency; used by comparison.build_comparison and utils.merge_brand_frames.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz as rf_fuzz, process as rf_process, utils as rf_utils
+    _HAS_RAPIDFUZZ = True
+except ModuleNotFoundError:
+    _HAS_RAPIDFUZZ = False
+try:
+    from thefuzz import fuzz, utils as fuzz_utils
+    _HAS_FUZZ = True
+except ModuleNotFoundError:
+    _HAS_FUZZ = False
+
+DEFAULT_THRESHOLD = 90
+NGRAM_SIZE = 3
+MIN_SHARED_NGRAMS = 0.5  # fraction of the shorter key's trigrams a candidate must share
+MAX_CANDIDATES = 50      # per query, keeping the ones sharing the most trigrams
+# partial_ratio is 100 for any substring ("DIOR" in "DIORA"), so as in WRatio it only
+# counts, scaled down, when one name is much longer than the other.
+PARTIAL_MIN_LENGTH_RATIO = 1.5
+PARTIAL_WEIGHT = 0.9
+
+
+def _partial_weights(len1, len2):
+    """PARTIAL_WEIGHT where the longer name is >= PARTIAL_MIN_LENGTH_RATIO times the shorter, else 0."""
+    len1 = np.asarray(len1, dtype=float); len2 = np.asarray(len2, dtype=float)
+    longer = np.maximum(len1, len2); shorter = np.maximum(np.minimum(len1, len2), 1)
+    return np.where(longer / shorter >= PARTIAL_MIN_LENGTH_RATIO, PARTIAL_WEIGHT, 0.0)
+
+
+def custom_scorer(s1, s2):
+    """
+    Best of ratio / token-set / token-sort and length-gated, weighted partial similarity (0-100)
+    of the processed names (lowercased, non-alphanumerics to spaces, trimmed), as score_pairs
+    computes it with rapidfuzz.
+    """
+    s1 = fuzz_utils.full_process(s1); s2 = fuzz_utils.full_process(s2)
+    partial = fuzz.partial_ratio(s1, s2) * float(_partial_weights(len(s1), len(s2)))
+    return max(fuzz.ratio(s1, s2), partial, fuzz.token_set_ratio(s1, s2), fuzz.token_sort_ratio(s1, s2))
+
+
+def _ngrams(key: str) -> set:
+    if len(key) <= NGRAM_SIZE:
+        return {key} if key else set()
+    return {key[i:i + NGRAM_SIZE] for i in range(len(key) - NGRAM_SIZE + 1)}
+
+
+def candidate_pairs(left_keys, right_keys) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Block the left x right cross product down to pairs sharing enough trigrams of
+    their cleaned keys. Returns aligned (left_idx, right_idx) int arrays.
+    """
+    right_grams = [_ngrams(key) for key in right_keys]
+    index = defaultdict(list)
+    for j, grams in enumerate(right_grams):
+        for gram in grams:
+            index[gram].append(j)
+
+    left_idx, right_idx = [], []
+    for i, key in enumerate(left_keys):
+        grams = _ngrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for j in index.get(gram, ()):
+                shared[j] += 1
+        kept = [(count, j) for j, count in shared.items()
+                if count >= math.ceil(MIN_SHARED_NGRAMS * min(len(grams), len(right_grams[j])))]
+        kept.sort(key=lambda item: (-item[0], item[1]))
+        for _, j in kept[:MAX_CANDIDATES]:
+            left_idx.append(i); right_idx.append(j)
+    return np.asarray(left_idx, dtype=np.intp), np.asarray(right_idx, dtype=np.intp)
+
+
+def score_pairs(left_names, right_names, left_idx: np.ndarray, right_idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    custom_scorer for every (left_idx[k], right_idx[k]) pair, plus the plain ratio
+    used to break ties (partial / token-set scores saturate at 100 easily).
+    """
+    if not len(left_idx):
+        return np.zeros(0), np.zeros(0)
+    queries = [left_names[i] for i in left_idx]; choices = [right_names[j] for j in right_idx]
+    if _HAS_RAPIDFUZZ:
+        # Same scorers as custom_scorer, evaluated pairwise in C across all candidate pairs at once
+        # and rounded to whole numbers as thefuzz does, so both backends make the same decisions.
+        per_scorer = [np.rint(rf_process.cpdist(queries, choices, scorer=scorer, processor=rf_utils.default_process, workers=-1))
+                      for scorer in (rf_fuzz.ratio, rf_fuzz.partial_ratio, rf_fuzz.token_set_ratio, rf_fuzz.token_sort_ratio)]
+        per_scorer[1] = per_scorer[1] * _partial_weights([len(rf_utils.default_process(q)) for q in queries],
+                                                         [len(rf_utils.default_process(c)) for c in choices])
+        return np.max(per_scorer, axis=0), per_scorer[0]
+    return (np.array([custom_scorer(q, c) for q, c in zip(queries, choices)], dtype=float),
+            np.array([fuzz.ratio(fuzz_utils.full_process(q), fuzz_utils.full_process(c)) for q, c in zip(queries, choices)], dtype=float))
+
+
+def resolve_one_to_one(left_idx: np.ndarray, right_idx: np.ndarray, scores: np.ndarray, threshold: float, tiebreak: np.ndarray = None) -> list[tuple[int, int, float]]:
+    """Greedy assignment: highest score first (then highest tiebreak, then position), each side used at most once."""
+    if tiebreak is None:
+        tiebreak = np.zeros_like(scores)
+    keep = scores >= threshold
+    left_idx, right_idx, scores, tiebreak = left_idx[keep], right_idx[keep], scores[keep], tiebreak[keep]
+    order = np.lexsort((right_idx, left_idx, -tiebreak, -scores))
+    used_left, used_right, matches = set(), set(), []
+    for k in order:
+        i, j = int(left_idx[k]), int(right_idx[k])
+        if i in used_left or j in used_right:
+            continue
+        used_left.add(i); used_right.add(j)
+        matches.append((i, j, float(scores[k])))
+    return matches
+
+
+def match_brands(left_names, right_names, left_keys=None, right_keys=None, threshold: float = DEFAULT_THRESHOLD) -> list[tuple[int, int, float]]:
+    """
+    One-to-one fuzzy matches between two lists of brand names.
+    `*_keys` are the cleaned merge keys used for blocking (default: the names,
+    uppercased with non-alphanumerics dropped). Returns [(left_pos, right_pos, score)]
+    with score >= threshold, best matches first.
+    """
+    if not _HAS_RAPIDFUZZ and not _HAS_FUZZ:
+        print("Warning (Brand Matching): rapidfuzz/thefuzz not installed; skipping fuzzy matching.")
+        return []
+    left_names = [str(name) for name in left_names]; right_names = [str(name) for name in right_names]
+    if not left_names or not right_names:
+        return []
+    left_keys = [str(key) for key in left_keys] if left_keys is not None else [''.join(c for c in name.upper() if c.isalnum()) for name in left_names]
+    right_keys = [str(key) for key in right_keys] if right_keys is not None else [''.join(c for c in name.upper() if c.isalnum()) for name in right_names]
+    left_idx, right_idx = candidate_pairs(left_keys, right_keys)
+    scores, tiebreak = score_pairs(left_names, right_names, left_idx, right_idx)
+    return resolve_one_to_one(left_idx, right_idx, scores, threshold, tiebreak)
@@ -2,24 +2,31 @@
 
 import streamlit as st
 import pandas as pd
+import functools
 import io
-from thefuzz import process, fuzz
-import unicodedata
-import requests
-from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
-import plotly.express as px
-import numpy as np
+import json
+from urllib.parse import urlparse
 import psycopg2 # For PostgreSQL connection
 import psycopg2.extras # For dictionary cursor
 from datetime import datetime
-from collections import defaultdict
 import os # Potentially useful for local testing with env vars
-import re # Needed for enhanced clean_brand_name
+import time
+import uuid
 
 # --- NEW IMPORTS ---
-import ounass_extractor
-import levelshoes_extractor
-import sephora_extractor # <-- Added Sephora extractor
+import db_utils
+from brand_aliases import get_alias_index
+from brand_matching import DEFAULT_THRESHOLD
+from comparison import (MULTI_SITE_NAME, build_multi_comparison, competitor_count_column, empty_brand_frame, from_multi_snapshot_rows,
+                        from_snapshot_rows, match_settings, snapshot_fuzzy_pairs, to_multi_snapshot_rows, to_snapshot_rows)
+from comparison_engine import brand_frame, compare_brand_lists, comparison_stats
+import comparison_charts
+from extractor_registry import OUNASS_SITE, competitor_names, get_site
+from fetcher import FetchError, fetch_all
+from artifact_store import get_default_store
+from html_cache import get_default_cache
+from parse_pool import ParseError, page_digest, parse_all
+from pipeline_metrics import pipeline_run, record, start_metrics_server
 
 # Try importing pytz for timezone handling, but don't fail if it's not installed
 try:
@@ -33,29 +40,69 @@ except ImportError:
 # --- App Configuration ---
 APP_VERSION = "3.1.0" # Updated version: Improved cleaning/matching
 st.set_page_config(layout="wide", page_title="Ounass vs Competitor PLP Comparison")
+app_render_start = time.perf_counter() # Full-script rerun latency, recorded as the 'render' stage for panel 'app' at the end of the script
 
 # --- App Title and Info ---
 st.title(f"Ounass vs Competitor PLP Designer Comparison (v{APP_VERSION})")
 st.write("Enter a Product Listing Page (PLP) URL from Ounass. Then, select a competitor (Level Shoes or Sephora). For Level Shoes, provide the PLP URL. For Sephora, upload the saved HTML file of the PLP. The tool compares designer/brand counts.")
 st.info("Ensure URLs point to relevant listing pages. Ounass URL loads all designers. Level Shoes uses __NEXT_DATA__. Sephora uses uploaded HTML. Comparison history is stored.")
 
+# --- Session Artifacts ---
+# Uploaded HTML, parsed brand lists and frames live in the process-wide artifact store (shared by all sessions, size-bounded, spilled to disk);
+# session_state only holds their content-hash handles under '<key>_handle'.
+SESSION_ARTIFACTS = ('uploaded_competitor_html', 'ounass_data', 'competitor_data', 'df_ounass', 'df_competitor', 'df_comparison_sorted', 'df_time_comparison', 'df_multi_comparison')
+
+def load_artifact(key, default=None):
+    """Session value `key` from the artifact store, or `default` when unset / evicted. Frames are copies, so callers may modify them."""
+    value = get_default_store().get(st.session_state.get(f"{key}_handle"))
+    if value is None: return default
+    return value.copy() if isinstance(value, pd.DataFrame) else value
+
+def save_artifact(key, value, digest=None):
+    """Put `value` in the artifact store and keep only its handle in session state (None clears it)."""
+    st.session_state[f"{key}_handle"] = None if value is None else get_default_store().put(value, digest=digest)
+
+def session_artifact_sizes():
+    """{label: estimated bytes} of the artifacts this session references (All Competitors uploads included)."""
+    store = get_default_store()
+    sizes = {key: store.size_of(st.session_state.get(f"{key}_handle")) for key in SESSION_ARTIFACTS}
+    for site, site_input in st.session_state.get('multi_inputs', {}).items():
+        if site_input and not is_url_site(site): sizes[f"multi_inputs[{site}]"] = store.size_of(site_input)
+    return {label: size for label, size in sizes.items() if size}
+
+@st.cache_resource
+def session_memory_registry():
+    """Process-wide {session tag: (last seen, {label: bytes})}, so the memory gauge can show every active session."""
+    return {}
+
+SESSION_MEMORY_TTL = 3600 # seconds; sessions not seen for this long drop out of the gauge
+
+def display_session_memory():
+    """Sidebar gauge: this session's artifact bytes, the shared store's usage and the largest sessions on this server."""
+    sizes = session_artifact_sizes(); registry = session_memory_registry(); now = time.time()
+    registry[st.session_state.session_tag] = (now, sizes)
+    for tag in [tag for tag, (seen, _) in list(registry.items()) if now - seen > SESSION_MEMORY_TTL]: registry.pop(tag, None)
+    store_stats = get_default_store().stats()
+    st.sidebar.caption(f"Session memory: {sum(sizes.values()) / 1_048_576:.1f} MB in {len(sizes)} artifacts · shared store {store_stats['bytes'] / 1_048_576:.0f} / {store_stats['max_bytes'] / 1_048_576:.0f} MB ({store_stats['entries']:,} entries, {store_stats['spilled']:,} spilled)")
+    with st.sidebar.expander("Session memory details"):
+        if sizes: st.dataframe(pd.DataFrame({'Artifact': list(sizes), 'MB': [round(size / 1_048_576, 2) for size in sizes.values()]}), hide_index=True, use_container_width=True)
+        else: st.caption("This session holds no artifacts.")
+        sessions = sorted(((tag, sum(tag_sizes.values())) for tag, (_, tag_sizes) in list(registry.items())), key=lambda item: item[1], reverse=True)
+        st.caption("Active sessions (artifacts may be shared between sessions):")
+        st.dataframe(pd.DataFrame({'Session': [f"{tag}{' (you)' if tag == st.session_state.session_tag else ''}" for tag, _ in sessions], 'MB': [round(size / 1_048_576, 2) for _, size in sessions]}), hide_index=True, use_container_width=True)
+
 # --- Session State Initialization ---
-# Site specific data holders (before processing)
-if 'ounass_data' not in st.session_state: st.session_state.ounass_data = []
-if 'competitor_data' not in st.session_state: st.session_state.competitor_data = []
-if 'uploaded_sephora_html' not in st.session_state: st.session_state.uploaded_sephora_html = None
+if 'session_tag' not in st.session_state: st.session_state.session_tag = uuid.uuid4().hex[:8] # Identifies this session in the memory gauge
+for artifact_key in SESSION_ARTIFACTS: # ounass_data / competitor_data: parsed brand lists; uploaded_competitor_html: HTML of upload-type competitors
+    if f"{artifact_key}_handle" not in st.session_state: st.session_state[f"{artifact_key}_handle"] = None
+if 'uploaded_competitor_digest' not in st.session_state: st.session_state.uploaded_competitor_digest = None # (upload file_id, sha256 of uploaded_competitor_html), computed once per upload (parse cache key)
 
-# Processed DataFrames
-if 'df_ounass' not in st.session_state: st.session_state.df_ounass = pd.DataFrame(columns=['Brand', 'Count', 'Brand_Cleaned'])
-if 'df_competitor' not in st.session_state: st.session_state.df_competitor = pd.DataFrame(columns=['Brand', 'Count', 'Brand_Cleaned'])
 
 # Comparison results
-if 'df_comparison_sorted' not in st.session_state: st.session_state.df_comparison_sorted = pd.DataFrame()
-if 'df_time_comparison' not in st.session_state: st.session_state.df_time_comparison = pd.DataFrame()
 
 # Input fields and selections
 if 'ounass_url_input' not in st.session_state: st.session_state.ounass_url_input = ''
-if 'levelshoes_url_input' not in st.session_state: st.session_state.levelshoes_url_input = '' # Keep for LS convenience
+if 'competitor_url_input' not in st.session_state: st.session_state.competitor_url_input = '' # URL of URL-type competitors
 if 'competitor_selection' not in st.session_state: st.session_state.competitor_selection = "Level Shoes" # Default competitor
 
 # State tracking
@@ -66,26 +113,60 @@ if 'time_comp_meta2' not in st.session_state: st.session_state.time_comp_meta2 =
 if 'df_ounass_processed' not in st.session_state: st.session_state.df_ounass_processed = False
 if 'df_competitor_processed' not in st.session_state: st.session_state.df_competitor_processed = False
 if 'selections_by_group' not in st.session_state: st.session_state.selections_by_group = {}
+if 'trend_group' not in st.session_state: st.session_state.trend_group = None # (ounass_url, competitor, input) shown in the trend view
 if 'show_saved_comparisons' not in st.session_state: st.session_state.show_saved_comparisons = False
 if 'competitor_input_identifier' not in st.session_state: st.session_state.competitor_input_identifier = '' # Stores URL or filename
+if 'fuzzy_match_enabled' not in st.session_state: st.session_state.fuzzy_match_enabled = False # Opt-in second merge pass
+if 'fuzzy_threshold' not in st.session_state: st.session_state.fuzzy_threshold = DEFAULT_THRESHOLD
+if 'multi_inputs' not in st.session_state: st.session_state.multi_inputs = {} # competitor -> URL or artifact handle of the uploaded HTML (All Competitors mode)
+if 'multi_input_identifiers' not in st.session_state: st.session_state.multi_input_identifiers = {} # competitor -> URL or filename
+if 'multi_input_digests' not in st.session_state: st.session_state.multi_input_digests = {} # competitor -> (upload file_id, sha256 of its HTML)
+if 'last_run_metrics' not in st.session_state: st.session_state.last_run_metrics = [] # Stage records (pipeline_metrics) of the last Process run
+if 'alias_suggestions' not in st.session_state: st.session_state.alias_suggestions = [] # Unconfirmed fuzzy pairs of this session's last comparison (site, alias_key, canonical_key, display_name, score)
 
 # --- Competitor Selection ---
-competitor_options = ["Level Shoes", "Sephora"]
+competitor_options = competitor_names() # Every competitor registered in extractor_registry
+competitor_radio_options = competitor_options + [MULTI_SITE_NAME] # One run against every competitor
 st.session_state.competitor_selection = st.radio(
     "Select Competitor to Compare Against Ounass:",
-    options=competitor_options,
+    options=competitor_radio_options,
     key="competitor_radio",
     horizontal=True,
-    index=competitor_options.index(st.session_state.get('competitor_selection', "Level Shoes")) # Persist selection
+    index=competitor_radio_options.index(st.session_state.get('competitor_selection', "Level Shoes")) # Persist selection
 )
 competitor_name = st.session_state.competitor_selection # Use this variable throughout
+if st.session_state.get('competitor_input_site') != competitor_name: # Inputs belong to the previously selected competitor
+    st.session_state.competitor_url_input = ''; save_artifact('uploaded_competitor_html', None); st.session_state.uploaded_competitor_digest = None
+    st.session_state.competitor_input_identifier = ''; st.session_state.competitor_input_site = competitor_name
+
+def is_url_site(site_name):
+    """True for registered URL-input sites (saved snapshots may name a site that is no longer registered)."""
+    try: return not get_site(site_name).is_upload
+    except ValueError: return False
+
+def live_competitor_input(site_name):
+    """The current URL or uploaded HTML for `site_name`, depending on its input type."""
+    return st.session_state.get('competitor_url_input') if is_url_site(site_name) else load_artifact('uploaded_competitor_html')
 
 # --- URL / File Input Section (Conditional) ---
+# Each panel below is an st.fragment: interacting with one reruns only that panel. Panels take small keys / handles
+# (never frames) as arguments and read their data from the artifact store or the cached DB loaders.
 viewing_saved_id_check = st.query_params.get("view_id", [None])[0]
-process_button = False # Default value
-uploaded_file = None # Initialize
 
-if not viewing_saved_id_check and st.session_state.get('df_time_comparison', pd.DataFrame()).empty:
+def timed_panel(panel):
+    """st.fragment whose every run (full or fragment-only) is recorded as a 'render' stage for `panel` (rerun latency per panel)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            start = time.perf_counter()
+            try: return func(*args, **kwargs)
+            finally: record({'stage': 'render', 'panel': panel, 'seconds': round(time.perf_counter() - start, 6)})
+        return st.fragment(run)
+    return decorate
+
+@timed_panel('inputs')
+def live_input_panel(competitor_name):
+    """URL / upload inputs and matching options. Only 'Process' reruns the whole app (via process_requested)."""
     st.markdown("---") # Separator
     st.subheader("Provide Inputs for Comparison")
     col1, col2 = st.columns(2)
@@ -97,42 +178,77 @@ if not viewing_saved_id_check and st.session_state.get('df_time_comparison', pd.
             placeholder="https://www.ounass.ae/..."
         )
     with col2:
-        if competitor_name == "Level Shoes":
-            st.session_state.levelshoes_url_input = st.text_input(
-                "Level Shoes URL",
-                key="levelshoes_url_widget_main",
-                value=st.session_state.levelshoes_url_input,
-                placeholder="https://www.levelshoes.com/..."
+        competitor_site = None if competitor_name == MULTI_SITE_NAME else get_site(competitor_name)
+        if competitor_site is None:
+            for multi_site_name in competitor_options:
+                multi_site = get_site(multi_site_name); multi_widget_suffix = multi_site_name.replace(' ', '_')
+                if not multi_site.is_upload:
+                    multi_url = st.text_input(f"{multi_site_name} URL", key=f"multi_url_widget_{multi_widget_suffix}", value=st.session_state.multi_inputs.get(multi_site_name) or '', placeholder=multi_site.placeholder)
+                    st.session_state.multi_inputs[multi_site_name] = multi_url; st.session_state.multi_input_identifiers[multi_site_name] = multi_url
+                else:
+                    multi_file = st.file_uploader(f"Upload {multi_site_name} HTML File", type=list(multi_site.upload_types), key=f"multi_file_uploader_{multi_widget_suffix}", help=multi_site.help)
+                    if multi_file is not None:
+                        try:
+                            if st.session_state.multi_input_digests.get(multi_site_name, (None,))[0] != multi_file.file_id:
+                                multi_html = multi_file.getvalue().decode("utf-8", errors="ignore"); multi_digest = page_digest(multi_html)
+                                st.session_state.multi_inputs[multi_site_name] = get_default_store().put(multi_html, digest=multi_digest); st.session_state.multi_input_digests[multi_site_name] = (multi_file.file_id, multi_digest)
+                            st.session_state.multi_input_identifiers[multi_site_name] = multi_file.name
+                        except Exception as e: st.error(f"Error reading uploaded file: {e}"); st.session_state.multi_inputs.pop(multi_site_name, None); st.session_state.multi_input_identifiers.pop(multi_site_name, None); st.session_state.multi_input_digests.pop(multi_site_name, None)
+                    elif st.session_state.multi_inputs.get(multi_site_name): st.info(f"Using previously uploaded file: {st.session_state.multi_input_identifiers.get(multi_site_name)}")
+            st.caption("Competitors left empty are skipped.")
+        elif not competitor_site.is_upload:
+            st.session_state.competitor_url_input = st.text_input(
+                f"{competitor_name} URL",
+                key=f"competitor_url_widget_{competitor_name.replace(' ', '_')}",
+                value=st.session_state.competitor_url_input,
+                placeholder=competitor_site.placeholder
             )
-            st.session_state.uploaded_sephora_html = None # Clear file if switching back
-        elif competitor_name == "Sephora":
+        else:
             uploaded_file = st.file_uploader(
-                "Upload Sephora HTML File",
-                type=["html", "htm"],
-                key="sephora_file_uploader_main",
-                help="Save the Sephora PLP page (Ctrl+S or Cmd+S -> 'Webpage, HTML Only') and upload it here."
+                f"Upload {competitor_name} HTML File",
+                type=list(competitor_site.upload_types),
+                key=f"competitor_file_uploader_{competitor_name.replace(' ', '_')}",
+                help=competitor_site.help
             )
             if uploaded_file is not None:
                 # Store content immediately if a new file is uploaded
                 try:
-                    st.session_state.uploaded_sephora_html = uploaded_file.read().decode("utf-8", errors="ignore")
+                    # Decode and hash only when the file changes; reruns reuse the stored HTML and digest.
+                    if (st.session_state.uploaded_competitor_digest or (None,))[0] != uploaded_file.file_id:
+                        uploaded_html = uploaded_file.getvalue().decode("utf-8", errors="ignore"); uploaded_digest = page_digest(uploaded_html)
+                        save_artifact('uploaded_competitor_html', uploaded_html, digest=uploaded_digest); st.session_state.uploaded_competitor_digest = (uploaded_file.file_id, uploaded_digest)
                     st.session_state.competitor_input_identifier = uploaded_file.name # Store filename
                     st.success(f"File '{uploaded_file.name}' uploaded successfully.")
                 except Exception as e:
                     st.error(f"Error reading uploaded file: {e}")
-                    st.session_state.uploaded_sephora_html = None
+                    save_artifact('uploaded_competitor_html', None); st.session_state.uploaded_competitor_digest = None
                     st.session_state.competitor_input_identifier = ''
 
-            elif st.session_state.uploaded_sephora_html and st.session_state.competitor_input_identifier:
+            elif st.session_state.uploaded_competitor_html_handle and st.session_state.competitor_input_identifier:
                  # If no new file is uploaded, but we have one in state, keep it.
                  st.info(f"Using previously uploaded file: {st.session_state.competitor_input_identifier}")
             # else: No file uploaded and none in state
 
-            st.session_state.levelshoes_url_input = '' # Clear URL if switching
+    col_fuzzy, col_threshold = st.columns(2)
+    with col_fuzzy:
+        st.session_state.fuzzy_match_enabled = st.checkbox(
+            "Fuzzy-match unmatched brands",
+            key="fuzzy_match_checkbox",
+            value=st.session_state.fuzzy_match_enabled,
+            help="Second pass after the exact match: pairs one-sided brands such as 'DIOR' / 'CHRISTIAN DIOR' (one-to-one, best score first). Accepted pairs are remembered and matched exactly next time."
+        )
+    with col_threshold:
+        st.session_state.fuzzy_threshold = st.slider(
+            "Fuzzy match threshold", min_value=70, max_value=100,
+            value=int(st.session_state.fuzzy_threshold), key="fuzzy_threshold_slider",
+            disabled=not st.session_state.fuzzy_match_enabled
+        )
 
-    process_button_label = f"Process Ounass vs {competitor_name}"
-    process_button = st.button(process_button_label, key="process_button_main")
+    if st.button(f"Process Ounass vs {competitor_name}", key="process_button_main"): st.session_state.process_requested = True; st.rerun()
     st.markdown("---") # Separator before results
+
+if not viewing_saved_id_check and not st.session_state.df_time_comparison_handle and not st.session_state.get('trend_group'): live_input_panel(competitor_name)
+process_button = st.session_state.pop('process_requested', False) # Set by live_input_panel right before its full-app rerun
 # --- End Input Section ---
 
 
@@ -151,11 +267,18 @@ def get_connection_details():
         st.error(f"Error accessing connection details: {e}")
         return None
 
-def get_db_connection():
+# One pool per server process, shared by all sessions; conn.close() hands the connection back.
+@st.cache_resource
+def get_db_pool():
     db_url = get_connection_details()
     if not db_url: return None
+    return db_utils.ConnectionPool(db_url)
+
+def get_db_connection():
     try:
-        conn = psycopg2.connect(db_url, sslmode='require')
+        pool = get_db_pool()
+        if pool is None: return None
+        conn = pool.getconn()
         return conn
     except psycopg2.OperationalError as e:
         if "authentication failed" in str(e): st.error("Database Connection Error: Authentication failed. Check credentials.")
@@ -166,40 +289,44 @@ def get_db_connection():
         st.error(f"Unexpected Database Connection Error: {e}")
         return None
 
+# Schema migrations run once per server process (or ahead of time via `python db_utils.py migrate`), not on every rerun.
+# A failure raises out of the cached function, so nothing is cached and the next rerun tries again.
+@st.cache_resource(show_spinner=False)
+def run_schema_migrations():
+    conn = get_db_connection()
+    if conn is None: raise ConnectionError("No database connection.")
+    try: return db_utils.migrate(conn)
+    finally: conn.close()
+
 def init_db():
+    try: run_schema_migrations()
+    except ConnectionError: pass # get_db_connection already reported it
+    except Exception as e: st.error(f"Fatal DB Init Error: {e}")
+
+# Prometheus-style /metrics endpoint, started once per server process when METRICS_PORT is set.
+@st.cache_resource
+def start_metrics_endpoint():
+    port = os.environ.get("METRICS_PORT")
+    if not port: return None
+    try: return start_metrics_server(int(port))
+    except (OSError, ValueError) as e: print(f"Warning: could not start metrics endpoint on port {port}: {e}"); return None
+
+def load_brand_alias_index():
+    """Process-wide brand alias map (loaded from the DB once); None when the DB is unavailable."""
+    conn = get_db_connection()
+    if conn is None: return None
+    try: return get_alias_index(conn)
+    except Exception as e: print(f"Warning: Could not load brand aliases: {e}"); return None
+    finally: conn.close()
+
+def save_learned_aliases(aliases):
+    """Write confirmed brand aliases back to the alias store."""
+    if aliases is None or not aliases.pending: return
     conn = get_db_connection()
     if conn is None: return
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                DO $$
-                BEGIN
-                    CREATE TABLE IF NOT EXISTS comparisons (
-                        id SERIAL PRIMARY KEY, timestamp TIMESTAMPTZ NOT NULL, ounass_url TEXT NOT NULL,
-                        levelshoes_url TEXT, comparison_data JSONB NOT NULL, comparison_name TEXT,
-                        competitor_name TEXT, competitor_input TEXT
-                    );
-                    ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS competitor_name TEXT;
-                    ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS competitor_input TEXT;
-                    IF EXISTS (
-                        SELECT 1 FROM information_schema.columns
-                        WHERE table_name='comparisons' AND column_name='levelshoes_url' AND is_nullable='NO'
-                    ) THEN
-                       ALTER TABLE comparisons ALTER COLUMN levelshoes_url DROP NOT NULL;
-                    END IF;
-                 EXCEPTION
-                    WHEN duplicate_object THEN RAISE NOTICE 'Table comparisons already exists.';
-                    WHEN others THEN RAISE WARNING 'Error during DB init: %', SQLERRM;
-                END $$;
-            """)
-        conn.commit()
-        print("Database initialized/checked successfully.")
-    except Exception as e:
-        st.error(f"Fatal DB Init Error: {e}")
-        try: conn.rollback()
-        except Exception as rb_e: st.error(f"Rollback failed after init error: {rb_e}")
-    finally:
-        if conn: conn.close()
+    try: print(f"Saved {aliases.flush(conn)} learned brand aliases.")
+    except Exception as e: st.warning(f"Could not save learned brand aliases: {e}")
+    finally: conn.close()
 
 # Updated save_comparison
 def save_comparison(ounass_url, competitor_name_arg, competitor_input_arg, df_comparison):
@@ -209,45 +336,11 @@ def save_comparison(ounass_url, competitor_name_arg, competitor_input_arg, df_co
     conn = get_db_connection()
     if conn is None: return False
     try:
-      # ------------------------------------------------------------------
-# Choose a clock that always ticks in Dubai 🇦🇪  (UTC+4, no DST)
-# ------------------------------------------------------------------
-        if pytz is not None:                             # <- 4 spaces
-            timestamp = datetime.now(                    # <- 8 spaces
-            pytz.timezone("Asia/Dubai")
-            )
-        else:                                            # <- 4 spaces
-            timestamp = datetime.now()                   # <- 8 spaces
-    
-        df_to_save = df_comparison.copy()
-        generic_cols = ['Display_Brand', 'Ounass_Count', 'Competitor_Count', 'Difference', 'Brand_Cleaned', 'Brand_Ounass', 'Brand_Competitor']
-        rename_map = {}
-        actual_competitor_count_col = f"{competitor_name_arg.replace(' ', '')}_Count"
-        actual_competitor_brand_col = f"Brand_{competitor_name_arg.replace(' ', '')}"
-
-        if actual_competitor_count_col in df_to_save.columns: rename_map[actual_competitor_count_col] = 'Competitor_Count'
-        elif 'Competitor_Count' not in df_to_save.columns:
-             found_comp_col = next((col for col in df_to_save.columns if col.endswith('_Count') and col not in ['Ounass_Count', 'Total_Count']), None)
-             if found_comp_col: rename_map[found_comp_col] = 'Competitor_Count'
-             else: st.error(f"Save Error: Cannot find competitor count column."); return False
-
-        if actual_competitor_brand_col in df_to_save.columns: rename_map[actual_competitor_brand_col] = 'Brand_Competitor'
-        elif 'Brand_Competitor' not in df_to_save.columns:
-             found_brand_comp_col = next((col for col in df_to_save.columns if col.startswith('Brand_') and col not in ['Brand_Ounass', 'Brand_Cleaned']), None)
-             if found_brand_comp_col: rename_map[found_brand_comp_col] = 'Brand_Competitor'
-             else: df_to_save['Brand_Competitor'] = np.nan
-
-        df_to_save.rename(columns=rename_map, inplace=True)
-        for col in generic_cols:
-            if col not in df_to_save.columns: df_to_save[col] = np.nan
-
-        data_json = df_to_save[generic_cols].to_json(orient="records", date_format="iso", default_handler=str)
-        ls_url_to_save = competitor_input_arg if competitor_name_arg == "Level Shoes" else None
-        with conn.cursor() as cur:
-            sql = """INSERT INTO comparisons (timestamp, ounass_url, levelshoes_url, comparison_data, comparison_name, competitor_name, competitor_input) VALUES (%s, %s, %s, %s, %s, %s, %s)"""
-            cur.execute(sql, (timestamp, ounass_url, ls_url_to_save, data_json, None, competitor_name_arg, competitor_input_arg))
-        conn.commit()
-        load_saved_comparisons_meta.clear()
+        try: brand_rows = to_multi_snapshot_rows(df_comparison, df_comparison.attrs['sites']) if competitor_name_arg == MULTI_SITE_NAME else to_snapshot_rows(df_comparison, competitor_name_arg)
+        except ValueError as ve: st.error(f"Save Error: {ve}"); return False
+        db_utils.insert_comparison(conn, ounass_url, competitor_name_arg, competitor_input_arg, brand_rows, match_settings=match_settings(df_comparison.attrs.get('fuzzy_threshold')),
+                                   fuzzy_pairs=snapshot_fuzzy_pairs(df_comparison))
+        clear_history_caches(); load_group_trend.clear(*db_utils.snapshot_group_key(ounass_url, competitor_name_arg, competitor_input_arg))
         return True
     except Exception as e:
         st.error(f"Database Error: Could not save comparison - {e}")
@@ -257,28 +350,45 @@ def save_comparison(ounass_url, competitor_name_arg, competitor_input_arg, df_co
     finally:
         if conn: conn.close()
 
-# Updated load_saved_comparisons_meta
+# History sidebar pages: groups are built and counted in SQL and paged by keyset, so each page is cached on its own.
 @st.cache_data(ttl=300)
-def load_saved_comparisons_meta():
+def load_history_groups_page(search, competitor, after):
     conn = get_db_connection()
-    if conn is None: return []
-    comparisons_list = []
+    if conn is None: return [], None
     try:
-        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute("""SELECT id, timestamp, ounass_url, levelshoes_url, comparison_name, competitor_name, competitor_input FROM comparisons ORDER BY timestamp DESC""")
-            comparisons = cur.fetchall()
-            comparisons_list = [dict(row) for row in comparisons] if comparisons else []
+        rows, next_after = db_utils.load_history_groups(conn, search=search, competitor=competitor, after=after)
+        return [dict(zip(db_utils.HISTORY_GROUP_COLUMNS, row)) for row in rows], next_after
     except psycopg2.Error as e:
         st.error(f"Database Error loading comparisons list: {e}")
-        if "relation" in str(e) and "does not exist" in str(e): init_db()
-        elif "column" in str(e) and "does not exist" in str(e): init_db()
-        comparisons_list = []
+        return [], None
     except Exception as e:
         st.error(f"Unexpected Error loading comparisons list: {e}")
-        comparisons_list = []
+        return [], None
     finally:
         if conn: conn.close()
-    return comparisons_list
+
+# Snapshots of one group, only queried once its expander has been opened.
+@st.cache_data(ttl=300)
+def load_group_snapshots_page(ounass_url, comp_name, comp_input, before):
+    conn = get_db_connection()
+    if conn is None: return [], None
+    try:
+        rows, next_before = db_utils.load_group_snapshots(conn, ounass_url, comp_name, comp_input, before=before)
+        return [{'id': comp_id, 'timestamp': ts} for comp_id, ts in rows], next_before
+    except Exception as e: st.error(f"Database Error loading snapshots: {e}"); return [], None
+    finally: conn.close()
+
+# Chart figures keyed by the content hash of the frame they are drawn from, so reruns from unrelated widgets reuse them.
+@st.cache_data(max_entries=16, show_spinner=False)
+def comparison_chart_figures(content_key, _df_comparison, competitor_name):
+    return comparison_charts.comparison_figures(_df_comparison, competitor_name)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def multi_site_chart_figure(content_key, _df_matrix, sites):
+    return comparison_charts.multi_site_figure(_df_matrix, sites)
+
+def clear_history_caches():
+    load_history_groups_page.clear(); load_group_snapshots_page.clear()
 
 # Updated load_specific_comparison
 @st.cache_data(ttl=600)
@@ -289,7 +399,7 @@ def load_specific_comparison(comp_id):
     meta, df = None, None
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            sql = """SELECT id, timestamp, ounass_url, levelshoes_url, comparison_data, comparison_name, competitor_name, competitor_input FROM comparisons WHERE id = %s"""
+            sql = """SELECT id, timestamp, ounass_url, levelshoes_url, comparison_name, competitor_name, competitor_input FROM comparisons WHERE id = %s"""
             cur.execute(sql, (comp_id,))
             comp = cur.fetchone()
             if comp:
@@ -302,10 +412,14 @@ def load_specific_comparison(comp_id):
                 elif not saved_competitor_input: saved_competitor_input = 'N/A'
                 fallback_name = f"ID {comp_dict['id']} ({comp_dict['timestamp']})"
                 meta = {"timestamp": comp_dict["timestamp"], "ounass_url": comp_dict["ounass_url"], "competitor_name": saved_competitor_name, "competitor_input": saved_competitor_input, "name": comp_dict["comparison_name"] or fallback_name, "id": comp_dict["id"], "levelshoes_url_raw": comp_dict.get("levelshoes_url")}
-                json_data = comp_dict["comparison_data"]
-                if isinstance(json_data, str): df = pd.read_json(io.StringIO(json_data), orient="records")
-                elif isinstance(json_data, (list, dict)): df = pd.DataFrame(json_data)
-                else: st.error(f"Unexpected data type for comparison_data: {type(json_data)}"); df = pd.DataFrame()
+                brand_rows = db_utils.load_snapshot_brands(conn, comp_id)
+                if saved_competitor_name == MULTI_SITE_NAME: return meta, from_multi_snapshot_rows(brand_rows) # Wide brand x site matrix, no pairwise columns
+                if brand_rows: df = from_snapshot_rows(brand_rows)
+                else: # Legacy snapshot the backfill could not normalize: decode the JSONB blob
+                    cur.execute("SELECT comparison_data FROM comparisons WHERE id = %s", (comp_id,)); json_data = cur.fetchone()[0]
+                    if isinstance(json_data, str): df = pd.read_json(io.StringIO(json_data), orient="records")
+                    elif isinstance(json_data, (list, dict)): df = pd.DataFrame(json_data)
+                    else: st.error(f"Unexpected data type for comparison_data: {type(json_data)}"); df = pd.DataFrame()
 
                 if not df.empty:
                     competitor_col_generic = 'Competitor_Count'; competitor_col_specific = f"{saved_competitor_name.replace(' ', '')}_Count"
@@ -333,6 +447,15 @@ def load_specific_comparison(comp_id):
         if conn: conn.close()
     return meta, df
 
+# Brand counts of every snapshot in a sidebar group, cached per group; save/delete clear only the affected group.
+@st.cache_data(ttl=600)
+def load_group_trend(ounass_url, comp_name, comp_input):
+    conn = get_db_connection()
+    if conn is None: return pd.DataFrame(columns=db_utils.BRAND_TREND_COLUMNS)
+    try: return pd.DataFrame(db_utils.load_brand_trend(conn, ounass_url, comp_name, comp_input), columns=db_utils.BRAND_TREND_COLUMNS)
+    except Exception as e: st.error(f"Database Error: Could not load brand trend - {e}"); return pd.DataFrame(columns=db_utils.BRAND_TREND_COLUMNS)
+    finally: conn.close()
+
 # Delete function remains the same structurally
 def delete_comparison(comp_id):
     conn = get_db_connection()
@@ -340,11 +463,11 @@ def delete_comparison(comp_id):
     success = False
     try:
         with conn.cursor() as cur:
-            sql = "DELETE FROM comparisons WHERE id = %s"
+            sql = "DELETE FROM comparisons WHERE id = %s RETURNING ounass_url, competitor_name, competitor_input, levelshoes_url"
             cur.execute(sql, (comp_id,))
-            success = cur.rowcount > 0
+            deleted = cur.fetchone(); success = deleted is not None
         conn.commit()
-        if success: load_saved_comparisons_meta.clear(); load_specific_comparison.clear()
+        if success: clear_history_caches(); load_specific_comparison.clear(); load_group_trend.clear(*db_utils.snapshot_group_key(*deleted))
     except Exception as e:
         st.error(f"Database Error: Could not delete comparison ID {comp_id} - {e}")
         success = False
@@ -356,93 +479,8 @@ def delete_comparison(comp_id):
 
 # --- Helper Functions ---
 
-# ----- Replace this function in combined_extractor_app.py -----
-def clean_brand_name(brand_name):
-    """Cleans brand names for better matching across sources."""
-    if not isinstance(brand_name, str) or not brand_name:
-        return "" # Return empty string for non-strings or empty input
-
-    # 1. NFKC Normalization: Handles compatibility characters and improves standardization.
-    try:
-        normalized = unicodedata.normalize('NFKC', brand_name)
-    except Exception as e:
-        print(f"Warning: NFKC normalization failed for '{brand_name}': {e}")
-        normalized = brand_name # Fallback to original on error
-
-    # 2. Convert to Uppercase for case-insensitive operations
-    cleaned_upper = normalized.upper()
-
-    # 3. Define common suffixes/qualifiers to remove
-    suffixes_to_remove = [
-        "BEAUTY", "PERFUMES", "PARFUMS", "FRAGRANCES", "FRAGRANCE",
-        "COSMETICS", "MAKEUP", "MAQUILLAGE", "SKINCARE", "HAIRCARE",
-        "COLLECTION", "BEAUTE", "PROFESSIONAL", "PROFESSIONNEL",
-        # Add more specific ones if needed, e.g., "COUTURE"
-        "COUTURE"
-    ]
-    suffixes_to_remove = sorted(list(set(suffixes_to_remove)), key=len, reverse=True) # Ensure unique and sorted
-
-    # 4. Remove suffixes if they appear as the last word(s)
-    words = cleaned_upper.split()
-    words_processed = []
-    # Iterate backwards to potentially remove multiple suffixes
-    temp_words = list(words) # Work on a copy
-    removed_suffix = False
-    while len(temp_words) > 1:
-         last_word = temp_words[-1]
-         is_suffix = False
-         # Check if the last word IS one of the suffixes
-         if last_word in suffixes_to_remove:
-             is_suffix = True
-         # Check if last word ENDS WITH a suffix (e.g. "SKINCARE.") - less common but possible
-         # else:
-         #     for suffix in suffixes_to_remove:
-         #         if last_word.endswith(suffix): # requires punctuation removal first maybe?
-         #             is_suffix = True; break
-
-         if is_suffix:
-             temp_words.pop() # Remove it
-             removed_suffix = True
-         else:
-             break # Stop if last word isn't a suffix
-
-    # Use the potentially shortened word list
-    cleaned_suffix_removed = " ".join(temp_words) if removed_suffix else " ".join(words)
-
-
-    # 5. Basic punctuation and symbol removal (keep spaces for now)
-    # Replace hyphen with space, remove common symbols
-    cleaned_punct = cleaned_suffix_removed.replace('.', ' ').replace("'", '').replace('&', ' ')
-    cleaned_punct = re.sub(r'[-]', ' ', cleaned_punct) # Hyphen to space
-    cleaned_punct = re.sub(r'[®™©]', '', cleaned_punct) # Remove Trademarks/Copyright symbols
-    cleaned_punct = re.sub(r'[()\[\]{}<>/"?]', ' ', cleaned_punct) # Remove brackets/slashes/quotes/qmarks
-    cleaned_punct = re.sub(r'\s+', ' ', cleaned_punct).strip() # Consolidate multiple spaces
-
-    # 6. Decompose accents and remove non-ASCII characters (NFKD method)
-    try:
-        # Normalize again after punctuation changes, then encode/decode
-        cleaned_ascii = unicodedata.normalize('NFKD', cleaned_punct).encode('ascii', 'ignore').decode('utf-8')
-    except Exception as e:
-        print(f"Warning: ASCII conversion failed for '{cleaned_punct}': {e}")
-        cleaned_ascii = cleaned_punct # Fallback
-
-    # 7. Final step: Remove ALL remaining spaces and non-alphanumeric characters for the merge key
-    final_key = ''.join(c for c in cleaned_ascii if c.isalnum())
-
-    # Handle edge case: if result is empty string after all cleaning
-    if not final_key:
-        # Fallback: just alphanumeric from the original uppercase name
-        return ''.join(c for c in brand_name.upper() if c.isalnum())
-
-    return final_key
-# ----- End of function replacement -----
 
 
-# Keep custom_scorer as is
-def custom_scorer(s1, s2):
-    scores = [fuzz.ratio(s1, s2), fuzz.partial_ratio(s1, s2), fuzz.token_set_ratio(s1, s2), fuzz.token_sort_ratio(s1, s2)]
-    return max(scores)
-
 # Keep handle_checkbox_change as is
 def handle_checkbox_change(group_key, comp_id):
     checkbox_state_key = f"cb_{comp_id}"
@@ -456,35 +494,36 @@ def handle_checkbox_change(group_key, comp_id):
         else: selections.add(comp_id)
     else: selections.discard(comp_id)
 
-# Fetch HTML function remains the same
-@st.cache_data(ttl=600)
-def fetch_html_content(url):
-    if not url: print("Fetch error: URL cannot be empty."); return None
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36', 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9', 'Accept-Language': 'en-US,en;q=0.9', 'Connection': 'keep-alive', 'DNT': '1', 'Upgrade-Insecure-Requests': '1'}
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.Timeout: st.error(f"Error: Timeout fetching {url}"); return None
-    except requests.exceptions.HTTPError as http_err: st.error(f"HTTP error occurred fetching {url}: {http_err} (Status code: {http_err.response.status_code})"); return None
-    except requests.exceptions.RequestException as e: st.error(f"Error fetching {url}: {e}"); return None
-    except Exception as e: st.error(f"Unexpected error during fetch for {url}: {e}"); return None
-
-# Ounass URL parameter function remains the same
-def ensure_ounass_full_list_parameter(url):
-    param_key = 'fh_maxdisplaynrvalues_designer'; param_value = '-1'
-    try:
-        if not url or 'ounass' not in urlparse(url).netloc.lower(): return url
-    except Exception: st.warning(f"Could not parse Ounass URL: {url}"); return url
+# Fetch HTML pages in parallel through the pooled async fetcher.
+# No st.cache_data here: repeat fetches are served by the on-disk HTML cache after a 304 revalidation.
+def fetch_html_pages(urls):
+    """Download all `urls` concurrently; returns a tuple aligned with `urls` holding HTML or None on failure."""
+    pages = []
+    for url, result in zip(urls, fetch_all(list(urls))):
+        if isinstance(result, ValueError): print(f"Fetch error: {result}"); pages.append(None)
+        elif isinstance(result, FetchError): st.error(f"Error fetching {url}: {result}"); pages.append(None)
+        elif isinstance(result, Exception): st.error(f"Unexpected error during fetch for {url}: {result}"); pages.append(None)
+        else: pages.append(result)
+    return tuple(pages)
+
+# Parse downloaded pages in the parser worker pool so BeautifulSoup never holds the GIL on the script thread.
+# No st.cache_data here: parse_pool caches brand lists by (site, parser version, page digest), so multi-MB pages are never hashed by Streamlit.
+def parse_html_pages(jobs):
+    """Parse [(site, html, digest), ...] concurrently (digest None: hashed once by parse_pool); returns {site: brand list}, [] for a page that failed."""
+    parsed = {}
+    for (site, *_), result in zip(jobs, parse_all(jobs)):
+        if isinstance(result, ParseError): st.error(f"Error parsing {site} page: {result}"); parsed[site] = []
+        else: print(f"{site} processing finished. Found {len(result)} brands."); parsed[site] = result
+    return parsed
+
+# One extract step for every registered site: count coercion, filtering and brand keys live in comparison.build_brand_frame (memoized by comparison_engine).
+def build_site_frame(site_name, records):
+    """Brand frame for a parsed page, or None when nothing usable was extracted."""
+    if not records: return None
     try:
-        parsed_url = urlparse(url); query_params = parse_qs(parsed_url.query, keep_blank_values=True)
-        needs_update = (param_key not in query_params or not query_params[param_key] or query_params[param_key][0] != param_value)
-        if needs_update:
-            query_params[param_key] = [param_value]; new_query_string = urlencode(query_params, doseq=True)
-            url_components = list(parsed_url); url_components[4] = new_query_string
-            new_url = urlunparse(url_components); print(f"Updated Ounass URL with param: {new_url}"); return new_url
-        else: return url
-    except Exception as e: st.warning(f"Error processing Ounass URL parameters: {e}"); return url
+        df_site = brand_frame(records, site_name)
+        return None if df_site.empty else df_site
+    except Exception as e: st.error(f"Error creating {site_name} DF: {e}"); return None
 
 # URL info extraction function remains the same
 def extract_info_from_url(url):
@@ -518,108 +557,149 @@ def extract_info_from_url(url):
 # --- Sidebar ---
 st.sidebar.title("Options & History")
 st.sidebar.caption(f"App Version: {APP_VERSION}")
-if viewing_saved_id_check or not st.session_state.get('df_time_comparison', pd.DataFrame()).empty:
+html_cache_for_stats = get_default_cache()
+if html_cache_for_stats is not None:
+    try: cache_stats = html_cache_for_stats.stats(); st.sidebar.caption(f"HTML cache: {cache_stats['hits']:,} hits / {cache_stats['misses']:,} misses · {cache_stats['entries']:,} pages ({cache_stats['bytes'] / 1_048_576:.1f} MB)")
+    except Exception as e: print(f"Warning: Could not read HTML cache stats: {e}")
+display_session_memory()
+if viewing_saved_id_check or st.session_state.df_time_comparison_handle or st.session_state.get('trend_group'):
     if st.sidebar.button("<< Back to Live Processing", key="back_live", use_container_width=True):
-        st.query_params.clear(); st.session_state.confirm_delete_id = None
-        st.session_state.df_time_comparison = pd.DataFrame(); st.session_state.time_comp_meta1 = {}; st.session_state.time_comp_meta2 = {}
+        st.query_params.clear(); st.session_state.confirm_delete_id = None; st.session_state.trend_group = None
+        save_artifact('df_time_comparison', None); st.session_state.time_comp_meta1 = {}; st.session_state.time_comp_meta2 = {}
         st.session_state.show_saved_comparisons = False; st.session_state.selections_by_group = {}
-        st.session_state.levelshoes_url_input = ''; st.session_state.uploaded_sephora_html = None
-        st.session_state.competitor_input_identifier = ''; st.session_state.df_competitor = pd.DataFrame(columns=['Brand', 'Count', 'Brand_Cleaned'])
+        st.session_state.competitor_url_input = ''; save_artifact('uploaded_competitor_html', None); st.session_state.uploaded_competitor_digest = None
+        st.session_state.competitor_input_identifier = ''; save_artifact('df_competitor', None)
         st.session_state.df_competitor_processed = False; st.session_state.ounass_url_input = ''
-        st.session_state.df_ounass = pd.DataFrame(columns=['Brand', 'Count', 'Brand_Cleaned']); st.session_state.df_ounass_processed = False
-        st.session_state.df_comparison_sorted = pd.DataFrame(); st.rerun()
-st.sidebar.markdown("---")
-st.sidebar.subheader("Saved Comparisons")
-if not st.session_state.get('show_saved_comparisons', False):
-    if st.sidebar.button("Load Saved Comparisons", key="load_saved_btn", use_container_width=True): st.session_state.show_saved_comparisons = True; st.rerun()
-else:
-    if st.sidebar.button("Hide Saved Comparisons", key="hide_saved_btn", use_container_width=True): st.session_state.show_saved_comparisons = False; st.session_state.selections_by_group = {}; st.rerun()
-    saved_comps_meta = load_saved_comparisons_meta()
-    if not saved_comps_meta: st.sidebar.caption("No comparisons found in the database.")
+        save_artifact('df_ounass', None); st.session_state.df_ounass_processed = False
+        save_artifact('df_comparison_sorted', None); st.session_state.alias_suggestions = []; st.rerun()
+# Saved-comparison browser: checkboxes, paging, open/close and delete confirmations rerun only this panel;
+# buttons that change the main view (view, trend, compare) rerun the app.
+@timed_panel('history')
+def history_browser_panel():
+    st.markdown("---")
+    st.subheader("Saved Comparisons")
+    if not st.session_state.get('show_saved_comparisons', False):
+        if st.button("Load Saved Comparisons", key="load_saved_btn", use_container_width=True): st.session_state.show_saved_comparisons = True; st.rerun(scope="fragment")
     else:
-        grouped_comps = defaultdict(list)
-        for comp_meta in saved_comps_meta:
-            comp_name = comp_meta.get('competitor_name'); comp_input = comp_meta.get('competitor_input')
-            if not comp_name and comp_meta.get('levelshoes_url'): comp_name = 'Level Shoes'
-            if not comp_input and comp_name == 'Level Shoes': comp_input = comp_meta.get('levelshoes_url')
-            if not comp_name: comp_name = "Unknown"; comp_input = "N/A"
-            url_key = (comp_meta.get('ounass_url',''), comp_name, comp_input); grouped_comps[url_key].append(comp_meta)
-        if 'selections_by_group' not in st.session_state: st.session_state.selections_by_group = {}
-        st.sidebar.caption("Select two snapshots from the *same group* below to compare changes over time.")
-        url_group_keys = sorted(list(grouped_comps.keys()), key=lambda x: (x[0] or '', x[1] or ''))
-        for idx, url_key in enumerate(url_group_keys):
-            comps_list = grouped_comps[url_key]; ounass_url_grp, comp_name_grp, comp_input_grp = url_key
-            g, c = extract_info_from_url(ounass_url_grp); cat_info = f"{g or '?'} / {c or '?'}" if (g or c) else "Category N/A"
-            input_display = '';
-            if comp_name_grp == "Level Shoes": input_display = f": {urlparse(comp_input_grp or '').path}"
-            elif comp_name_grp == "Sephora": input_display = f": {os.path.basename(comp_input_grp or '')}" if comp_input_grp else ""
-            else: input_display = f": {comp_input_grp[:20]}..." if comp_input_grp and len(comp_input_grp)>20 else f": {comp_input_grp}"
-            input_display = input_display[:30] + '...' if len(input_display) > 33 else input_display
-            expander_label = f"Ounass vs {comp_name_grp} ({cat_info}) - {len(comps_list)} snapshots"
-            if not (g or c): oun_path_part = urlparse(ounass_url_grp or '').path.split('/')[-1].replace('.html','') or "Ounass"; expander_label = f"{oun_path_part} vs {comp_name_grp}{input_display} ({len(comps_list)} snapshots)"
-            with st.sidebar.expander(expander_label, expanded=True):
-                st.session_state.selections_by_group.setdefault(url_key, set()); current_selections = st.session_state.selections_by_group[url_key]; st.write("Select two snapshots:")
-                for comp_meta in sorted(comps_list, key=lambda x: x.get('timestamp', datetime.min)):
-                     comp_id = comp_meta['id']; ts = comp_meta['timestamp']; display_ts_str="Invalid Date"
-                     try:
-                         if pytz:
-                              dt = ts; tz_name = 'Asia/Dubai'
-                              if isinstance(ts, str): dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
-                              if isinstance(dt, datetime):
-                                   if dt.tzinfo is None: dt = pytz.utc.localize(dt)
-                                   display_ts_str = dt.astimezone(pytz.timezone(tz_name)).strftime('%Y-%m-%d %H:%M')
-                         else:
-                              if isinstance(ts, datetime): display_ts_str = ts.strftime('%Y-%m-%d %H:%M')
-                              elif isinstance(ts, str): display_ts_str = ts[:16].replace('T', ' ')
-                     except Exception as ts_e: print(f"Timestamp formatting error for ID {comp_id}: {ts_e}"); display_ts_str = str(ts)[:16]
-                     display_label = f"{display_ts_str} (ID: {comp_id})"; is_currently_selected_in_state = comp_id in current_selections
-                     col_cb, col_view, col_del = st.columns([0.15, 0.7, 0.15])
-                     with col_cb: st.checkbox(" ", key=f"cb_{comp_id}", value=is_currently_selected_in_state, on_change=handle_checkbox_change, args=(url_key, comp_id), label_visibility="collapsed")
-                     with col_view:
-                          is_being_viewed = str(comp_id) == viewing_saved_id_check; button_type = "primary" if is_being_viewed else "secondary"
-                          if st.button(display_label, key=f"view_detail_{comp_id}", type=button_type, use_container_width=True): st.query_params["view_id"] = str(comp_id); st.session_state.confirm_delete_id = None; st.session_state.df_time_comparison = pd.DataFrame(); st.rerun()
-                     with col_del:
-                          if st.button("🗑️", key=f"del_detail_{comp_id}", help=f"Delete snapshot from {display_ts_str}", use_container_width=True): st.session_state.confirm_delete_id = comp_id; st.query_params.clear(); st.rerun()
-                st.markdown("---")
-                selected_ids_list = list(current_selections); compare_button_disabled = (len(selected_ids_list) != 2)
-                if st.button("Compare Selected Snapshots", key=f"compare_chk_{idx}", disabled=compare_button_disabled, use_container_width=True):
-                     if len(selected_ids_list) == 2:
-                         id1, id2 = selected_ids_list[0], selected_ids_list[1]
-                         meta1, df1 = load_specific_comparison(id1); meta2, df2 = load_specific_comparison(id2); valid_load = True
-                         if not (meta1 and df1 is not None and not df1.empty): st.error(f"Failed to load valid data for snapshot ID: {id1}."); valid_load = False
-                         if not (meta2 and df2 is not None and not df2.empty): st.error(f"Failed to load valid data for snapshot ID: {id2}."); valid_load = False
-                         if valid_load and meta1.get('competitor_name') != meta2.get('competitor_name'): st.error(f"Cannot compare snapshots: Competitors mismatch."); valid_load = False
-                         if valid_load:
-                             ts1 = meta1['timestamp']; ts2 = meta2['timestamp']
-                             try:
-                                 if isinstance(ts1, str): ts1 = datetime.fromisoformat(ts1.replace('Z', '+00:00'))
-                                 if isinstance(ts2, str): ts2 = datetime.fromisoformat(ts2.replace('Z', '+00:00'))
-                                 if pytz:
-                                     if ts1.tzinfo is None: ts1 = pytz.utc.localize(ts1)
-                                     if ts2.tzinfo is None: ts2 = pytz.utc.localize(ts2)
-                                 if ts1 > ts2: id1, id2, meta1, df1, meta2, df2 = id2, id1, meta2, df2, meta1, df1
-                             except Exception as ts_parse_e: st.error(f"Error parsing timestamps for comparison: {ts_parse_e}"); valid_load = False
+        if st.button("Hide Saved Comparisons", key="hide_saved_btn", use_container_width=True): st.session_state.show_saved_comparisons = False; st.session_state.selections_by_group = {}; st.rerun(scope="fragment")
+        hist_col_search, hist_col_comp = st.columns([0.6, 0.4])
+        with hist_col_search: history_search = st.text_input("Filter", key="history_search", placeholder="URL or file name")
+        with hist_col_comp: history_competitor = st.selectbox("Competitor", ["All"] + competitor_radio_options, key="history_competitor")
+        history_filter = (history_search.strip(), None if history_competitor == "All" else history_competitor)
+        history_group_pages = st.session_state.setdefault('history_group_pages', {}); open_groups = st.session_state.setdefault('open_history_groups', set())
+        group_pages_loaded = history_group_pages.get(history_filter, 1); groups_meta = []; next_group_cursor = None
+        for _ in range(group_pages_loaded):
+            page_rows, next_group_cursor = load_history_groups_page(*history_filter, next_group_cursor); groups_meta.extend(page_rows)
+            if next_group_cursor is None: break
+        if not groups_meta: st.caption("No comparisons match the filter." if any(history_filter) else "No comparisons found in the database.")
+        else:
+            if 'selections_by_group' not in st.session_state: st.session_state.selections_by_group = {}
+            st.caption("Select two snapshots from the *same group* below to compare changes over time.")
+            for idx, group_meta in enumerate(groups_meta):
+                url_key = (group_meta['ounass_url'], group_meta['competitor_name'], group_meta['competitor_input']); ounass_url_grp, comp_name_grp, comp_input_grp = url_key
+                snapshot_count = group_meta['snapshot_count']; is_group_open = url_key in open_groups
+                g, c = extract_info_from_url(ounass_url_grp); cat_info = f"{g or '?'} / {c or '?'}" if (g or c) else "Category N/A"
+                input_display = '';
+                if is_url_site(comp_name_grp): input_display = f": {urlparse(comp_input_grp or '').path}"
+                elif comp_name_grp in competitor_options: input_display = f": {os.path.basename(comp_input_grp or '')}" if comp_input_grp else ""
+                else: input_display = f": {comp_input_grp[:20]}..." if comp_input_grp and len(comp_input_grp)>20 else f": {comp_input_grp}"
+                input_display = input_display[:30] + '...' if len(input_display) > 33 else input_display
+                expander_label = f"Ounass vs {comp_name_grp} ({cat_info}) - {snapshot_count} snapshots"
+                if not (g or c): oun_path_part = urlparse(ounass_url_grp or '').path.split('/')[-1].replace('.html','') or "Ounass"; expander_label = f"{oun_path_part} vs {comp_name_grp}{input_display} ({snapshot_count} snapshots)"
+                with st.expander(expander_label, expanded=is_group_open):
+                    is_trend_shown = st.session_state.get('trend_group') == url_key
+                    if st.button(f"📈 Brand Trend ({snapshot_count} snapshots)", key=f"trend_{idx}", type="primary" if is_trend_shown else "secondary", disabled=snapshot_count < 2, use_container_width=True):
+                        st.session_state.trend_group = url_key; st.query_params.clear(); st.session_state.confirm_delete_id = None; save_artifact('df_time_comparison', None); st.rerun()
+                    # Members are only queried for groups the user has opened.
+                    if st.button("Hide snapshots" if is_group_open else "Show snapshots", key=f"open_grp_{idx}", use_container_width=True):
+                        open_groups.symmetric_difference_update({url_key}); st.rerun(scope="fragment")
+                    if not is_group_open: continue
+                    snapshot_pages = st.session_state.setdefault('snapshot_pages_by_group', {}); comps_list = []; next_snapshot_cursor = None
+                    for _ in range(snapshot_pages.get(url_key, 1)):
+                        page_rows, next_snapshot_cursor = load_group_snapshots_page(ounass_url_grp, comp_name_grp, comp_input_grp, next_snapshot_cursor); comps_list.extend(page_rows)
+                        if next_snapshot_cursor is None: break
+                    st.session_state.selections_by_group.setdefault(url_key, set()); current_selections = st.session_state.selections_by_group[url_key]; st.write("Select two snapshots:")
+                    for comp_meta in comps_list:
+                         comp_id = comp_meta['id']; ts = comp_meta['timestamp']; display_ts_str="Invalid Date"
+                         try:
+                             if pytz:
+                                  dt = ts; tz_name = 'Asia/Dubai'
+                                  if isinstance(ts, str): dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+                                  if isinstance(dt, datetime):
+                                       if dt.tzinfo is None: dt = pytz.utc.localize(dt)
+                                       display_ts_str = dt.astimezone(pytz.timezone(tz_name)).strftime('%Y-%m-%d %H:%M')
+                             else:
+                                  if isinstance(ts, datetime): display_ts_str = ts.strftime('%Y-%m-%d %H:%M')
+                                  elif isinstance(ts, str): display_ts_str = ts[:16].replace('T', ' ')
+                         except Exception as ts_e: print(f"Timestamp formatting error for ID {comp_id}: {ts_e}"); display_ts_str = str(ts)[:16]
+                         display_label = f"{display_ts_str} (ID: {comp_id})"; is_currently_selected_in_state = comp_id in current_selections
+                         col_cb, col_view, col_del = st.columns([0.15, 0.7, 0.15])
+                         with col_cb: st.checkbox(" ", key=f"cb_{comp_id}", value=is_currently_selected_in_state, on_change=handle_checkbox_change, args=(url_key, comp_id), label_visibility="collapsed")
+                         with col_view:
+                              is_being_viewed = str(comp_id) == viewing_saved_id_check; button_type = "primary" if is_being_viewed else "secondary"
+                              if st.button(display_label, key=f"view_detail_{comp_id}", type=button_type, use_container_width=True): st.query_params["view_id"] = str(comp_id); st.session_state.confirm_delete_id = None; save_artifact('df_time_comparison', None); st.session_state.trend_group = None; st.rerun()
+                         with col_del:
+                              if st.button("🗑️", key=f"del_detail_{comp_id}", help=f"Delete snapshot from {display_ts_str}", use_container_width=True): st.session_state.confirm_delete_id = comp_id; st.rerun(scope="fragment")
+                         if st.session_state.confirm_delete_id == comp_id:
+                              # Confirmed inline, so a delete only reruns the history panel unless the main view shows the deleted snapshot.
+                              st.warning(f"Delete snapshot ID {comp_id}?"); col_confirm, col_cancel = st.columns(2)
+                              with col_confirm:
+                                   if st.button("Yes, Delete", type="primary", key=f"confirm_delete_{comp_id}", use_container_width=True):
+                                        shown_in_main = str(comp_id) == viewing_saved_id_check or st.session_state.get('trend_group') == url_key or comp_id in (st.session_state.time_comp_meta1.get('id'), st.session_state.time_comp_meta2.get('id'))
+                                        if delete_comparison(comp_id): st.toast(f"Comparison ID {comp_id} deleted.")
+                                        else: st.error(f"Deletion failed for ID {comp_id}.")
+                                        st.session_state.confirm_delete_id = None; current_selections.discard(comp_id)
+                                        if shown_in_main: st.query_params.clear(); st.session_state.trend_group = None; save_artifact('df_time_comparison', None); st.rerun()
+                                        st.rerun(scope="fragment")
+                              with col_cancel:
+                                   if st.button("Cancel", key=f"cancel_delete_{comp_id}", use_container_width=True): st.session_state.confirm_delete_id = None; st.rerun(scope="fragment")
+                    if next_snapshot_cursor is not None and st.button("Older snapshots…", key=f"more_snaps_{idx}", use_container_width=True):
+                        snapshot_pages[url_key] = snapshot_pages.get(url_key, 1) + 1; st.rerun(scope="fragment")
+                    st.markdown("---")
+                    selected_ids_list = list(current_selections); compare_button_disabled = (len(selected_ids_list) != 2)
+                    if st.button("Compare Selected Snapshots", key=f"compare_chk_{idx}", disabled=compare_button_disabled, use_container_width=True):
+                         if len(selected_ids_list) == 2:
+                             id1, id2 = selected_ids_list[0], selected_ids_list[1]
+                             meta1, df1 = load_specific_comparison(id1); meta2, df2 = load_specific_comparison(id2); valid_load = True
+                             if not (meta1 and df1 is not None and not df1.empty): st.error(f"Failed to load valid data for snapshot ID: {id1}."); valid_load = False
+                             if not (meta2 and df2 is not None and not df2.empty): st.error(f"Failed to load valid data for snapshot ID: {id2}."); valid_load = False
+                             if valid_load and meta1.get('competitor_name') != meta2.get('competitor_name'): st.error(f"Cannot compare snapshots: Competitors mismatch."); valid_load = False
+                             if valid_load and meta1.get('competitor_name') == MULTI_SITE_NAME: st.error("Snapshot comparison is pairwise; use Brand Trend for multi-site snapshots."); valid_load = False
                              if valid_load:
-                                 time_comp_competitor_name = meta1.get('competitor_name', 'Level Shoes'); time_comp_competitor_col = f"{time_comp_competitor_name.replace(' ', '')}_Count"
-                                 required_cols = ['Display_Brand', 'Ounass_Count', time_comp_competitor_col]
-                                 for i, df_check in enumerate([df1, df2]):
-                                     df_id = id1 if i == 0 else id2
-                                     for col in required_cols:
-                                          if col not in df_check.columns: st.error(f"Snapshot ID {df_id} is missing required column: '{col}'. Cannot compare."); valid_load = False; break
-                                     if not valid_load: break
+                                 ts1 = meta1['timestamp']; ts2 = meta2['timestamp']
+                                 try:
+                                     if isinstance(ts1, str): ts1 = datetime.fromisoformat(ts1.replace('Z', '+00:00'))
+                                     if isinstance(ts2, str): ts2 = datetime.fromisoformat(ts2.replace('Z', '+00:00'))
+                                     if pytz:
+                                         if ts1.tzinfo is None: ts1 = pytz.utc.localize(ts1)
+                                         if ts2.tzinfo is None: ts2 = pytz.utc.localize(ts2)
+                                     if ts1 > ts2: id1, id2, meta1, df1, meta2, df2 = id2, id1, meta2, df2, meta1, df1
+                                 except Exception as ts_parse_e: st.error(f"Error parsing timestamps for comparison: {ts_parse_e}"); valid_load = False
                                  if valid_load:
-                                     df_time = pd.merge(df1[required_cols], df2[required_cols], on='Display_Brand', how='outer', suffixes=('_T1', '_T2'))
-                                     count_cols_time = [f'Ounass_Count_T1', f'Ounass_Count_T2', f'{time_comp_competitor_col}_T1', f'{time_comp_competitor_col}_T2']
-                                     for col in count_cols_time:
-                                          if col in df_time.columns: df_time[col] = pd.to_numeric(df_time[col], errors='coerce').fillna(0).astype(int)
-                                          else: st.error(f"Internal Error: Expected column '{col}' missing after merge."); valid_load = False; break
+                                     time_comp_competitor_name = meta1.get('competitor_name', 'Level Shoes'); time_comp_competitor_col = f"{time_comp_competitor_name.replace(' ', '')}_Count"
+                                     required_cols = ['Display_Brand', 'Ounass_Count', time_comp_competitor_col]
+                                     for i, df_check in enumerate([df1, df2]):
+                                         df_id = id1 if i == 0 else id2
+                                         for col in required_cols:
+                                              if col not in df_check.columns: st.error(f"Snapshot ID {df_id} is missing required column: '{col}'. Cannot compare."); valid_load = False; break
+                                         if not valid_load: break
                                      if valid_load:
-                                         comp_col_t1 = f"{time_comp_competitor_col}_T1"; comp_col_t2 = f"{time_comp_competitor_col}_T2"
-                                         df_time['Ounass_Change'] = (df_time['Ounass_Count_T2'] - df_time['Ounass_Count_T1'])
-                                         df_time['Competitor_Change'] = (df_time[comp_col_t2] - df_time[comp_col_t1])
-                                         st.session_state.df_time_comparison = df_time; st.session_state.time_comp_meta1 = meta1; st.session_state.time_comp_meta2 = meta2
-                                         st.query_params.clear(); st.session_state.selections_by_group[url_key] = set(); st.rerun()
-                     else: st.warning("Please select exactly two snapshots from this group to compare.")
+                                         df_time = pd.merge(df1[required_cols], df2[required_cols], on='Display_Brand', how='outer', suffixes=('_T1', '_T2'))
+                                         count_cols_time = [f'Ounass_Count_T1', f'Ounass_Count_T2', f'{time_comp_competitor_col}_T1', f'{time_comp_competitor_col}_T2']
+                                         for col in count_cols_time:
+                                              if col in df_time.columns: df_time[col] = pd.to_numeric(df_time[col], errors='coerce').fillna(0).astype(int)
+                                              else: st.error(f"Internal Error: Expected column '{col}' missing after merge."); valid_load = False; break
+                                         if valid_load:
+                                             comp_col_t1 = f"{time_comp_competitor_col}_T1"; comp_col_t2 = f"{time_comp_competitor_col}_T2"
+                                             df_time['Ounass_Change'] = (df_time['Ounass_Count_T2'] - df_time['Ounass_Count_T1'])
+                                             df_time['Competitor_Change'] = (df_time[comp_col_t2] - df_time[comp_col_t1])
+                                             save_artifact('df_time_comparison', df_time); st.session_state.time_comp_meta1 = meta1; st.session_state.time_comp_meta2 = meta2
+                                             st.query_params.clear(); st.session_state.selections_by_group[url_key] = set(); st.session_state.trend_group = None; st.rerun()
+                         else: st.warning("Please select exactly two snapshots from this group to compare.")
+            if next_group_cursor is not None and st.button("Load more groups", key="more_groups_btn", use_container_width=True):
+                history_group_pages[history_filter] = group_pages_loaded + 1; st.rerun(scope="fragment")
+
+with st.sidebar: history_browser_panel()
 
 # --- OPTIMIZATION: Helper function for displaying single site results ---
 def display_single_site_results(df, site_name, processing_flag, input_provided_flag, process_button_pressed):
@@ -637,10 +717,21 @@ def display_single_site_results(df, site_name, processing_flag, input_provided_f
         except Exception as e: st.error(f"Could not generate download for {site_name}: {e}")
     elif not processing_flag and input_provided_flag:
          if process_button_pressed: st.warning(f"No data extracted from {site_name}.")
-         else: action = "Upload HTML File" if site_name == "Sephora" else "Enter URL"; st.info(f"{action} for {site_name} and click 'Process'.")
-    elif not input_provided_flag: action = "Upload HTML File" if site_name == "Sephora" else "Enter URL"; st.info(f"{action} for {site_name} if you wish to include it.")
+         else: action = "Enter URL" if is_url_site(site_name) else "Upload HTML File"; st.info(f"{action} for {site_name} and click 'Process'.")
+    elif not input_provided_flag: action = "Enter URL" if is_url_site(site_name) else "Upload HTML File"; st.info(f"{action} for {site_name} if you wish to include it.")
     elif processing_flag and (df is None or df.empty): st.warning(f"Data processed for {site_name}, but no valid brands were found matching the extraction rules.")
 
+def display_run_metrics(records):
+    """Collapsible per-stage timing breakdown of the last Process run."""
+    if not records: return
+    df_records = pd.DataFrame(records)
+    with st.expander(f"⏱️ Run timing breakdown ({df_records['seconds'].sum():.2f}s across {len(df_records)} stages)", expanded=False):
+        df_summary = df_records.groupby('stage', sort=False).agg(Count=('seconds', 'size'), Seconds=('seconds', 'sum'), Max_Seconds=('seconds', 'max')).reset_index().rename(columns={'stage': 'Stage'})
+        st.dataframe(df_summary.style.format({'Seconds': '{:.3f}', 'Max_Seconds': '{:.3f}'}), hide_index=True, use_container_width=True)
+        detail_cols = [col for col in ['stage', 'site', 'query', 'url', 'status', 'bytes', 'rows', 'seconds', 'peak_rss_bytes', 'attempts', 'error'] if col in df_records.columns]
+        st.dataframe(df_records[detail_cols], hide_index=True, use_container_width=True)
+        st.caption("Fetch/DB stages overlap when they run concurrently; parse peak memory is the worker process high-water RSS.")
+
 # --- Unified Display Function (Updated for Competitor) ---
 def display_all_results(df_ounass, df_competitor, competitor_name_arg, df_comparison_sorted, stats_title_prefix="Overall Statistics", is_saved_view=False, saved_meta=None):
     global process_button
@@ -649,7 +740,7 @@ def display_all_results(df_ounass, df_competitor, competitor_name_arg, df_compar
     if is_saved_view and saved_meta:
         comp_name_for_meta = saved_meta.get('competitor_name', 'Unknown Competitor'); ounass_url_for_meta = saved_meta.get('ounass_url', ''); competitor_input_for_meta = saved_meta.get('competitor_input', 'N/A')
         oun_g, oun_c = extract_info_from_url(ounass_url_for_meta); ls_g, ls_c = None, None
-        if comp_name_for_meta == "Level Shoes" and isinstance(competitor_input_for_meta, str) and competitor_input_for_meta.startswith('http'): ls_g, ls_c = extract_info_from_url(competitor_input_for_meta)
+        if is_url_site(comp_name_for_meta) and isinstance(competitor_input_for_meta, str) and competitor_input_for_meta.startswith('http'): ls_g, ls_c = extract_info_from_url(competitor_input_for_meta)
         if oun_g or ls_g: detected_gender = oun_g or ls_g;
         if oun_c or ls_c: detected_category = oun_c or ls_c
         ts = saved_meta.get('timestamp', 'N/A'); display_ts_str="N/A"
@@ -667,14 +758,14 @@ def display_all_results(df_ounass, df_competitor, competitor_name_arg, df_compar
         st.subheader(f"Viewing Saved Comparison (Ounass vs {comp_name_for_meta})")
         st.caption(f"Saved: {display_ts_str} (ID: {saved_meta.get('id', 'N/A')})")
         st.caption(f"Ounass URL: `{ounass_url_for_meta}`")
-        competitor_input_label = "URL" if comp_name_for_meta == "Level Shoes" else "File"
+        competitor_input_label = "URL" if is_url_site(comp_name_for_meta) else "File"
         st.caption(f"{comp_name_for_meta} {competitor_input_label}: `{competitor_input_for_meta}`")
     else:
         comp_name_for_meta = competitor_name_arg; ounass_url_for_meta = st.session_state.get('processed_ounass_url') or st.session_state.get('ounass_url_input')
-        if comp_name_for_meta == "Level Shoes": competitor_input_for_meta = st.session_state.get('levelshoes_url_input', '')
+        if is_url_site(comp_name_for_meta): competitor_input_for_meta = st.session_state.get('competitor_url_input', '')
         else: competitor_input_for_meta = st.session_state.get('competitor_input_identifier', '')
         if ounass_url_for_meta: g_live, c_live = extract_info_from_url(ounass_url_for_meta); detected_gender = g_live; detected_category = c_live
-        elif comp_name_for_meta == "Level Shoes" and competitor_input_for_meta: g_live, c_live = extract_info_from_url(competitor_input_for_meta); detected_gender = g_live; detected_category = c_live
+        elif is_url_site(comp_name_for_meta) and competitor_input_for_meta: g_live, c_live = extract_info_from_url(competitor_input_for_meta); detected_gender = g_live; detected_category = c_live
     if detected_gender and detected_category: stats_title = f"{stats_title_prefix}: Ounass vs {comp_name_for_meta} - {detected_gender} / {detected_category}"
     elif detected_gender: stats_title = f"{stats_title_prefix}: Ounass vs {comp_name_for_meta} - {detected_gender}"
     elif detected_category: stats_title = f"{stats_title_prefix}: Ounass vs {comp_name_for_meta} - {detected_category}"
@@ -688,74 +779,31 @@ def display_all_results(df_ounass, df_competitor, competitor_name_arg, df_compar
             if st.button("💾 Save", key=save_button_key, help=save_help, use_container_width=True, disabled=not can_save):
                 if save_comparison(ounass_url_for_meta, comp_name_for_meta, competitor_input_for_meta, df_comparison_sorted):
                     st.success(f"Comparison saved! ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
-                    load_saved_comparisons_meta.clear(); st.session_state.confirm_delete_id = None; st.rerun()
+                    clear_history_caches(); st.session_state.confirm_delete_id = None; st.rerun()
     else: st.subheader(stats_title)
-    df_o_safe = df_ounass if df_ounass is not None and not df_ounass.empty else pd.DataFrame(columns=['Brand', 'Count'])
-    df_c_safe = df_competitor if df_competitor is not None and not df_competitor.empty else pd.DataFrame(columns=['Brand', 'Count'])
     df_comp_safe = df_comparison_sorted if df_comparison_sorted is not None and not df_comparison_sorted.empty else pd.DataFrame()
-    if 'Count' in df_o_safe.columns: df_o_safe['Count'] = pd.to_numeric(df_o_safe['Count'], errors='coerce').fillna(0)
-    if 'Count' in df_c_safe.columns: df_c_safe['Count'] = pd.to_numeric(df_c_safe['Count'], errors='coerce').fillna(0)
-    total_ounass_brands = len(df_o_safe['Brand'].unique()) if 'Brand' in df_o_safe.columns else 0; total_ounass_products = int(df_o_safe['Count'].sum()) if 'Count' in df_o_safe.columns else 0
-    total_competitor_brands = len(df_c_safe['Brand'].unique()) if 'Brand' in df_c_safe.columns else 0; total_competitor_products = int(df_c_safe['Count'].sum()) if 'Count' in df_c_safe.columns else 0
-    common_brands_count = 0; ounass_only_count = 0; competitor_only_count = 0; competitor_count_col_name = f"{comp_name_for_meta.replace(' ', '')}_Count"
-    if not df_comp_safe.empty and 'Ounass_Count' in df_comp_safe.columns and competitor_count_col_name in df_comp_safe.columns:
-        df_comp_safe['Ounass_Count'] = pd.to_numeric(df_comp_safe['Ounass_Count'], errors='coerce').fillna(0)
-        df_comp_safe[competitor_count_col_name] = pd.to_numeric(df_comp_safe[competitor_count_col_name], errors='coerce').fillna(0)
-        if total_ounass_products == 0: total_ounass_products = int(df_comp_safe['Ounass_Count'].sum())
-        if total_competitor_products == 0: total_competitor_products = int(df_comp_safe[competitor_count_col_name].sum())
-        if total_ounass_brands == 0: total_ounass_brands = len(df_comp_safe[df_comp_safe['Ounass_Count'] > 0])
-        if total_competitor_brands == 0: total_competitor_brands = len(df_comp_safe[df_comp_safe[competitor_count_col_name] > 0])
-        common_brands_count = len(df_comp_safe[(df_comp_safe['Ounass_Count'] > 0) & (df_comp_safe[competitor_count_col_name] > 0)])
-        ounass_only_count = len(df_comp_safe[(df_comp_safe['Ounass_Count'] > 0) & (df_comp_safe[competitor_count_col_name] == 0)])
-        competitor_only_count = len(df_comp_safe[(df_comp_safe['Ounass_Count'] == 0) & (df_comp_safe[competitor_count_col_name] > 0)])
+    stats = comparison_stats(df_ounass, df_competitor, df_comp_safe, comp_name_for_meta); competitor_count_col_name = competitor_count_column(comp_name_for_meta)
     stat_col1, stat_col2, stat_col3 = st.columns(3)
-    with stat_col1: st.metric("Ounass Brands", f"{total_ounass_brands:,}"); st.metric("Ounass Products", f"{total_ounass_products:,}")
-    with stat_col2: st.metric(f"{comp_name_for_meta} Brands", f"{total_competitor_brands:,}"); st.metric(f"{comp_name_for_meta} Products", f"{total_competitor_products:,}")
+    with stat_col1: st.metric("Ounass Brands", f"{stats['ounass_brands']:,}"); st.metric("Ounass Products", f"{stats['ounass_products']:,}")
+    with stat_col2: st.metric(f"{comp_name_for_meta} Brands", f"{stats['competitor_brands']:,}"); st.metric(f"{comp_name_for_meta} Products", f"{stats['competitor_products']:,}")
     with stat_col3:
-        if not df_comp_safe.empty and 'Ounass_Count' in df_comp_safe.columns and competitor_count_col_name in df_comp_safe.columns: st.metric("Common Brands", f"{common_brands_count:,}"); st.metric("Ounass Only", f"{ounass_only_count:,}"); st.metric(f"{comp_name_for_meta} Only", f"{competitor_only_count:,}")
+        if stats['common_brands'] is not None: st.metric("Common Brands", f"{stats['common_brands']:,}"); st.metric("Ounass Only", f"{stats['ounass_only']:,}"); st.metric(f"{comp_name_for_meta} Only", f"{stats['competitor_only']:,}")
         else: st.metric("Common Brands", "N/A"); st.metric("Ounass Only", "N/A"); st.metric(f"{comp_name_for_meta} Only", "N/A")
-        ounass_input_exists = bool(st.session_state.get('ounass_url_input')); competitor_input_exists = bool(st.session_state.get('levelshoes_url_input') if comp_name_for_meta == "Level Shoes" else st.session_state.get('uploaded_sephora_html'))
+        ounass_input_exists = bool(st.session_state.get('ounass_url_input')); competitor_input_exists = bool(live_competitor_input(comp_name_for_meta))
         if not is_saved_view and (ounass_input_exists or competitor_input_exists): st.caption("Comparison requires processed data from *both* sites.")
     st.write(""); st.markdown("---")
     if not is_saved_view:
         col1, col2 = st.columns(2)
-        with col1: display_single_site_results(st.session_state.get('df_ounass'), "Ounass", st.session_state.get('df_ounass_processed', False), bool(st.session_state.get('ounass_url_input')), process_button)
-        with col2: competitor_input_provided = bool(st.session_state.get('levelshoes_url_input') if comp_name_for_meta=="Level Shoes" else st.session_state.get('uploaded_sephora_html')); display_single_site_results(st.session_state.get('df_competitor'), comp_name_for_meta, st.session_state.get('df_competitor_processed', False), competitor_input_provided, process_button)
+        with col1: display_single_site_results(load_artifact('df_ounass'), "Ounass", st.session_state.get('df_ounass_processed', False), bool(st.session_state.get('ounass_url_input')), process_button)
+        with col2: competitor_input_provided = bool(live_competitor_input(comp_name_for_meta)); display_single_site_results(load_artifact('df_competitor'), comp_name_for_meta, st.session_state.get('df_competitor_processed', False), competitor_input_provided, process_button)
     if not df_comp_safe.empty:
         if not is_saved_view: st.markdown("---")
         st.subheader(f"Ounass vs {comp_name_for_meta} Brand Comparison"); df_display_comp = df_comp_safe.copy(); df_display_comp.index += 1
         display_cols = ['Display_Brand', 'Ounass_Count', competitor_count_col_name, 'Difference']; missing_cols = [col for col in display_cols if col not in df_display_comp.columns]
         if missing_cols: st.warning(f"Comp table missing: {', '.join(missing_cols)}"); st.dataframe(df_display_comp, height=500, use_container_width=True)
         else: display_rename = {competitor_count_col_name: f"{comp_name_for_meta} Count"}; st.dataframe(df_display_comp[display_cols].rename(columns=display_rename), height=500, use_container_width=True)
-        st.markdown("---"); st.subheader("Visual Comparison"); viz_col1, viz_col2 = st.columns(2)
-        with viz_col1:
-            st.write("**Brand Overlap**"); pie_data = pd.DataFrame({'Category': ['Common Brands', 'Ounass Only', f'{comp_name_for_meta} Only'],'Count': [common_brands_count, ounass_only_count, competitor_only_count]}); pie_data = pie_data[pie_data['Count'] > 0]
-            if not pie_data.empty:
-                try: fig_pie = px.pie(pie_data, names='Category', values='Count', title="Brand Presence Distribution", color_discrete_sequence=px.colors.qualitative.Pastel); fig_pie.update_traces(textposition='inside', textinfo='percent+label+value'); st.plotly_chart(fig_pie, use_container_width=True)
-                except Exception as e: st.error(f"Error creating overlap chart: {e}")
-            else: st.info("No data available for overlap chart.")
-        with viz_col2:
-            st.write(f"**Top 10 Largest Differences (Ounass - {comp_name_for_meta})**")
-            if 'Difference' in df_comp_safe.columns and 'Display_Brand' in df_comp_safe.columns:
-                df_comp_safe['Difference'] = pd.to_numeric(df_comp_safe['Difference'], errors='coerce'); df_diff_valid = df_comp_safe.dropna(subset=['Difference'])
-                top_pos = df_diff_valid[df_diff_valid['Difference'] > 0].nlargest(5, 'Difference'); top_neg = df_diff_valid[df_diff_valid['Difference'] < 0].nsmallest(5, 'Difference'); top_diff = pd.concat([top_pos, top_neg]).sort_values('Difference', ascending=False)
-                if not top_diff.empty:
-                    try: fig_diff = px.bar(top_diff, x='Display_Brand', y='Difference', title=f"Largest Product Count Differences", labels={'Display_Brand': 'Brand', 'Difference': f'Difference (Ounass - {comp_name_for_meta})'}, color='Difference', color_continuous_scale=px.colors.diverging.RdBu); fig_diff.update_layout(xaxis_title=None); st.plotly_chart(fig_diff, use_container_width=True)
-                    except Exception as e: st.error(f"Error creating difference chart: {e}")
-                else: st.info("No significant differences found for the chart.")
-            else: st.info("Difference data unavailable for the chart.")
-        st.markdown("---"); st.subheader("Top 15 Brands Comparison (Total Products Combined)")
-        required_top_cols = ['Display_Brand', 'Ounass_Count', competitor_count_col_name]
-        if not df_comp_safe.empty and all(c in df_comp_safe.columns for c in required_top_cols):
-            df_comp_copy = df_comp_safe.copy(); df_comp_copy['Ounass_Count'] = pd.to_numeric(df_comp_copy['Ounass_Count'], errors='coerce').fillna(0); df_comp_copy[competitor_count_col_name] = pd.to_numeric(df_comp_copy[competitor_count_col_name], errors='coerce').fillna(0)
-            df_comp_copy['Total_Count'] = df_comp_copy['Ounass_Count'] + df_comp_copy[competitor_count_col_name]; top_n = 15; top_brands = df_comp_copy.nlargest(top_n, 'Total_Count')
-            if not top_brands.empty:
-                try:
-                    melted = top_brands.melt(id_vars='Display_Brand', value_vars=['Ounass_Count', competitor_count_col_name], var_name='Website', value_name='Product Count'); melted['Website'] = melted['Website'].replace({'Ounass_Count': 'Ounass', competitor_count_col_name: comp_name_for_meta})
-                    fig_top = px.bar(melted, x='Display_Brand', y='Product Count', color='Website', barmode='group', title=f"Top {top_n} Brands by Total Products (Combined)", labels={'Display_Brand': 'Brand'}, category_orders={"Display_Brand": top_brands['Display_Brand'].tolist()}); fig_top.update_layout(xaxis_title=None); st.plotly_chart(fig_top, use_container_width=True)
-                except Exception as e: st.error(f"Error creating Top {top_n} Brands chart: {e}")
-            else: st.info(f"Not enough data to display the Top {top_n} Brands chart.")
-        else: st.info(f"Comparison data is unavailable for the Top {top_n} Brands chart.")
+        st.markdown("---"); st.subheader("Visual Comparison")
+        comparison_charts_panel(get_default_store().put(df_comp_safe.copy()), comp_name_for_meta)
         st.markdown("---"); col_comp1, col_comp2 = st.columns(2); req_cols_exist = all(c in df_comp_safe.columns for c in ['Display_Brand', 'Ounass_Count', competitor_count_col_name, 'Difference'])
         with col_comp1:
             st.subheader("Brands in Ounass Only");
@@ -806,6 +854,28 @@ def display_all_results(df_ounass, df_competitor, competitor_name_arg, df_compar
     elif process_button and not is_saved_view: st.markdown("---"); st.warning(f"Comparison (Ounass vs {comp_name_for_meta}) could not be generated. Check individual site results.")
 
 
+@timed_panel('charts')
+def comparison_charts_panel(comparison_handle, competitor_name_arg):
+    """Comparison charts behind a toggle (figures and plotly are only built once it is on); toggling reruns only this panel."""
+    if not st.toggle("📊 Show charts", key="show_comparison_charts"): return
+    df_comp = get_default_store().get(comparison_handle); competitor_count_col_name = competitor_count_column(competitor_name_arg); figures = {}
+    if df_comp is not None and all(c in df_comp.columns for c in ['Display_Brand', 'Ounass_Count', competitor_count_col_name, 'Difference']):
+        try: figures = comparison_chart_figures(comparison_handle, df_comp, competitor_name_arg)
+        except Exception as e: st.error(f"Error creating comparison charts: {e}")
+    viz_col1, viz_col2 = st.columns(2)
+    with viz_col1:
+        st.write("**Brand Overlap**")
+        if figures.get('overlap') is not None: st.plotly_chart(figures['overlap'], use_container_width=True)
+        else: st.info("No data available for overlap chart.")
+    with viz_col2:
+        st.write(f"**Top 10 Largest Differences (Ounass - {competitor_name_arg})**")
+        if figures.get('differences') is not None: st.plotly_chart(figures['differences'], use_container_width=True)
+        else: st.info("No significant differences found for the chart.")
+    st.markdown("---"); st.subheader(f"Top {comparison_charts.TOP_BRANDS} Brands Comparison (Total Products Combined)")
+    if figures.get('top_brands') is not None: st.plotly_chart(figures['top_brands'], use_container_width=True)
+    else: st.info(f"Not enough data to display the Top {comparison_charts.TOP_BRANDS} Brands chart.")
+
+
 # --- Time Comparison Display Function (Updated for Competitor) ---
 def display_time_comparison_results(df_time_comp, meta1, meta2):
     st.markdown("---"); st.subheader("Snapshot Comparison Over Time")
@@ -829,7 +899,7 @@ def display_time_comparison_results(df_time_comp, meta1, meta2):
                            f"* **Snapshot 2 (Later):**   `{ts2_str}` (ID: {id2})")
     st.markdown(comparison_markdown)
     with st.expander("Show URLs/Inputs for Compared Snapshots"):
-        input_label1 = "URL" if meta1.get('competitor_name') == "Level Shoes" else "File"; input_label2 = "URL" if meta2.get('competitor_name') == "Level Shoes" else "File"
+        input_label1 = "URL" if is_url_site(meta1.get('competitor_name')) else "File"; input_label2 = "URL" if is_url_site(meta2.get('competitor_name')) else "File"
         st.caption(f"**Snap 1 ({ts1_str}):** O: `{meta1.get('ounass_url', 'N/A')}` | {meta1.get('competitor_name')}({input_label1}): `{meta1.get('competitor_input', 'N/A')}`")
         st.caption(f"**Snap 2 ({ts2_str}):** O: `{meta2.get('ounass_url', 'N/A')}` | {meta2.get('competitor_name')}({input_label2}): `{meta2.get('competitor_input', 'N/A')}`")
     st.markdown("---")
@@ -891,98 +961,202 @@ def display_time_comparison_results(df_time_comp, meta1, meta2):
     else: st.warning("Could not generate time comparison download: required data columns missing.")
 
 
-# --- Main Application Flow ---
-init_db()
-confirm_id = st.session_state.get('confirm_delete_id'); viewing_saved_id = st.query_params.get("view_id", [None])[0]
-if confirm_id:
-    st.warning(f"Are you sure you want to delete comparison ID {confirm_id}?"); col_confirm, col_cancel, _ = st.columns([1,1,3])
-    with col_confirm:
-        if st.button("Yes, Delete", type="primary", key=f"confirm_delete_{confirm_id}"):
-            if delete_comparison(confirm_id): st.success(f"Comparison ID {confirm_id} deleted.")
-            else: st.error(f"Deletion failed for ID {confirm_id}.")
-            st.session_state.confirm_delete_id = None; st.query_params.clear(); st.rerun()
-    with col_cancel:
-        if st.button("Cancel", key=f"cancel_delete_{confirm_id}"): st.session_state.confirm_delete_id = None; st.rerun()
-elif 'df_time_comparison' in st.session_state and not st.session_state.df_time_comparison.empty: display_time_comparison_results(st.session_state.df_time_comparison, st.session_state.get('time_comp_meta1',{}), st.session_state.get('time_comp_meta2',{}))
-elif viewing_saved_id:
-    saved_meta, saved_df = load_specific_comparison(viewing_saved_id)
-    if saved_meta and saved_df is not None: display_all_results(None, None, saved_meta.get('competitor_name', 'Level Shoes'), saved_df, stats_title_prefix="Saved Comparison Details", is_saved_view=True, saved_meta=saved_meta)
+# --- Multi-Site Display Function (Ounass vs all competitors in one matrix) ---
+def display_multi_site_results(df_multi, saved_meta=None):
+    sites = df_multi.attrs.get('sites') or [OUNASS_SITE]; is_saved_view = saved_meta is not None
+    if is_saved_view:
+        st.subheader(f"Viewing Saved Comparison (Ounass vs {MULTI_SITE_NAME})")
+        st.caption(f"Saved: {saved_meta.get('timestamp')} (ID: {saved_meta.get('id', 'N/A')}) | Ounass URL: `{saved_meta.get('ounass_url', '')}`")
+    if df_multi is None or df_multi.empty:
+        if not is_saved_view: st.info(f"Enter the Ounass URL and at least one competitor input, then click 'Process Ounass vs {MULTI_SITE_NAME}'.")
+        else: st.warning("This snapshot holds no brand data.")
+        return
+    title_col, save_col = st.columns([0.8, 0.2])
+    with title_col: st.subheader(f"{'Saved' if is_saved_view else 'Current'} Comparison: Ounass vs {', '.join(s for s in sites if s != OUNASS_SITE)}")
+    if not is_saved_view:
+        with save_col:
+            st.write("")
+            multi_ounass_url = st.session_state.get('processed_ounass_url') or st.session_state.get('ounass_url_input'); multi_input_ids = {site: st.session_state.multi_input_identifiers.get(site) for site in sites if site != OUNASS_SITE}
+            if st.button("💾 Save", key="save_live_comp_confirm_multi", help="Save current multi-site comparison", use_container_width=True, disabled=not multi_ounass_url):
+                if save_comparison(multi_ounass_url, MULTI_SITE_NAME, json.dumps(multi_input_ids, sort_keys=True), df_multi):
+                    st.success(f"Comparison saved! ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})"); st.session_state.confirm_delete_id = None; st.rerun()
+    count_cols = {site: competitor_count_column(site) for site in sites}
+    metric_cols = st.columns(len(sites) + 1)
+    for metric_col, site in zip(metric_cols, sites):
+        with metric_col: st.metric(f"{site} Brands", f"{int((df_multi[count_cols[site]] > 0).sum()):,}"); st.metric(f"{site} Products", f"{int(df_multi[count_cols[site]].sum()):,}")
+    with metric_cols[-1]: st.metric("On All Sites", f"{int((df_multi['Sites_Present'] == len(sites)).sum()):,}"); st.metric("Single Site Only", f"{int((df_multi['Sites_Present'] == 1).sum()):,}")
+    st.markdown("---")
+    df_matrix = df_multi[['Display_Brand'] + list(count_cols.values()) + ['Sites_Present', 'Total_Count']].rename(columns={'Display_Brand': 'Brand', **{col: site for site, col in count_cols.items()}, 'Sites_Present': 'Sites', 'Total_Count': 'Total'})
+    st.dataframe(df_matrix, hide_index=True, use_container_width=True, height=600)
+    st.download_button("Download Brand x Site Matrix (CSV)", df_matrix.to_csv(index=False).encode('utf-8'), file_name="ounass_vs_all_competitors.csv", mime='text/csv', key=f"multi_download_{'saved' if is_saved_view else 'live'}")
+    multi_site_chart_panel(get_default_store().put(df_matrix), tuple(sites))
+
+@timed_panel('charts')
+def multi_site_chart_panel(matrix_handle, sites):
+    """Brand x site bar chart behind a toggle; toggling reruns only this panel."""
+    if not st.toggle("📊 Show chart", key="show_multi_site_chart"): return
+    df_matrix = get_default_store().get(matrix_handle)
+    if df_matrix is None: st.info("Chart data is no longer in memory; click 'Process' again."); return
+    try: st.plotly_chart(multi_site_chart_figure(matrix_handle, df_matrix, list(sites)), use_container_width=True)
+    except Exception as e: st.error(f"Error creating multi-site chart: {e}")
+
+# --- Brand Trend Display Function (all snapshots of one group) ---
+@timed_panel('trend')
+def display_group_trend(group_key):
+    ounass_url_grp, comp_name_grp, comp_input_grp = group_key
+    st.markdown("---"); st.subheader(f"Brand Trend: Ounass vs {comp_name_grp}")
+    st.caption(f"Ounass: `{ounass_url_grp}` | {comp_name_grp}: `{comp_input_grp}`")
+    df_trend = load_group_trend(ounass_url_grp, comp_name_grp, comp_input_grp)
+    if df_trend.empty: st.info("No brand data stored for the snapshots in this group."); return
+    df_trend = df_trend.copy(); df_trend['timestamp'] = pd.to_datetime(df_trend['timestamp'], utc=True); df_trend['delta'] = df_trend['delta'].astype('Int64') # NULL for a brand's first snapshot
+    if pytz: df_trend['timestamp'] = df_trend['timestamp'].dt.tz_convert('Asia/Dubai')
+    snapshot_ids = df_trend.sort_values(['timestamp', 'snapshot_id'])['snapshot_id'].unique(); latest_id = snapshot_ids[-1]
+    st.write(f"Snapshots: {len(snapshot_ids)} ({df_trend['timestamp'].min():%Y-%m-%d %H:%M} → {df_trend['timestamp'].max():%Y-%m-%d %H:%M})")
+    trend_sites = set(df_trend['site']); site_options = ([OUNASS_SITE] if OUNASS_SITE in trend_sites else []) + sorted(trend_sites - {OUNASS_SITE}) # Multi-site groups have several competitors
+    trend_site = st.radio("Website", site_options, horizontal=True, key="trend_site_radio")
+    df_site = df_trend[df_trend['site'] == trend_site]
+    df_latest = df_site[df_site['snapshot_id'] == latest_id]
+    brand_options = sorted(df_site['display_brand'].unique(), key=str.lower)
+    top_brands = df_latest.sort_values('count', ascending=False)['display_brand'].head(10).tolist()
+    selected_brands = st.multiselect("Brands", brand_options, default=top_brands, key=f"trend_brands_{trend_site}")
+    if selected_brands:
+        try:
+            st.plotly_chart(comparison_charts.trend_figure(df_site[df_site['display_brand'].isin(selected_brands)], trend_site), use_container_width=True)
+        except Exception as e: st.error(f"Error creating trend chart: {e}")
+    else: st.info("Select one or more brands to chart.")
+    st.subheader("Changes in Latest Snapshot"); mv_col1, mv_col2 = st.columns(2)
+    movers = df_latest[df_latest['delta'].fillna(0) != 0][['display_brand', 'count', 'delta']].rename(columns={'display_brand': 'Brand', 'count': 'Count', 'delta': 'Change'})
+    with mv_col1: st.write("**Largest Increases**"); st.dataframe(movers[movers['Change'] > 0].sort_values('Change', ascending=False).head(15), hide_index=True, use_container_width=True)
+    with mv_col2: st.write("**Largest Decreases**"); st.dataframe(movers[movers['Change'] < 0].sort_values('Change').head(15), hide_index=True, use_container_width=True)
+    df_wide = df_site.pivot_table(index='display_brand', columns=['timestamp', 'snapshot_id'], values='count', aggfunc='sum', fill_value=0)
+    df_wide.columns = [f"{ts:%Y-%m-%d %H:%M} (ID: {snapshot_id})" for ts, snapshot_id in df_wide.columns]
+    with st.expander(f"All {trend_site} Counts by Snapshot"): st.dataframe(df_wide, use_container_width=True)
+    st.download_button(f"Download {trend_site} Trend (CSV)", df_wide.to_csv().encode('utf-8'), file_name=f"brand_trend_{trend_site.replace(' ', '_').lower()}.csv", mime='text/csv', key="trend_download")
+
+
+@timed_panel('time_comparison')
+def time_comparison_panel():
+    """Snapshot-vs-snapshot view of the frame built by the history browser (read from the artifact store)."""
+    df_time_comp = load_artifact('df_time_comparison')
+    if df_time_comp is None: st.warning("This snapshot comparison is no longer in memory; select the two snapshots again."); return
+    display_time_comparison_results(df_time_comp, st.session_state.get('time_comp_meta1',{}), st.session_state.get('time_comp_meta2',{}))
+
+@timed_panel('saved_view')
+def saved_comparison_panel(view_id):
+    """One saved snapshot (load_specific_comparison is cached, so panel reruns do not query the database)."""
+    saved_meta, saved_df = load_specific_comparison(view_id)
+    if saved_meta and saved_df is not None and saved_meta.get('competitor_name') == MULTI_SITE_NAME: display_multi_site_results(saved_df, saved_meta=saved_meta)
+    elif saved_meta and saved_df is not None: display_all_results(None, None, saved_meta.get('competitor_name', 'Level Shoes'), saved_df, stats_title_prefix="Saved Comparison Details", is_saved_view=True, saved_meta=saved_meta)
     else:
         if st.button("Clear Invalid Saved View URL & Go Back"): st.query_params.clear(); st.rerun()
+
+@timed_panel('results')
+def live_results_panel(competitor_name):
+    """Results of the last Process run; its frames come from the artifact store, so its reruns never touch inputs or history."""
+    if competitor_name == MULTI_SITE_NAME: display_multi_site_results(load_artifact('df_multi_comparison', pd.DataFrame())); return
+    display_all_results(load_artifact('df_ounass', empty_brand_frame()), load_artifact('df_competitor', empty_brand_frame()), competitor_name, load_artifact('df_comparison_sorted', pd.DataFrame()), stats_title_prefix="Current Comparison")
+    alias_review_panel(competitor_name)
+
+def alias_review_panel(site):
+    """Fuzzy matches of this session's comparison stay suggestions until confirmed here; only confirmed ones are stored and applied to later runs."""
+    suggestions = [suggestion for suggestion in st.session_state.alias_suggestions if suggestion[0] == site]
+    if not suggestions: return
+    aliases = load_brand_alias_index()
+    with st.expander(f"Suggested brand aliases ({len(suggestions)})"):
+        st.caption("Fuzzy matches used in this comparison. Confirm the correct pairs to store them as aliases for every future run.")
+        chosen = [suggestion for suggestion in suggestions
+                  if st.checkbox(f"{suggestion[1]} → {suggestion[3] or suggestion[2]} ({suggestion[4]:.0f})", key=f"alias_suggestion_{suggestion[0]}_{suggestion[1]}")]
+        col_save, col_dismiss = st.columns(2)
+        if col_save.button("Save selected aliases", disabled=not chosen or aliases is None):
+            aliases.confirm(chosen); save_learned_aliases(aliases)
+            st.session_state.alias_suggestions = [suggestion for suggestion in st.session_state.alias_suggestions if suggestion not in chosen]; st.rerun(scope="fragment")
+        if col_dismiss.button("Dismiss all suggestions"): st.session_state.alias_suggestions = [suggestion for suggestion in st.session_state.alias_suggestions if suggestion[0] != site]; st.rerun(scope="fragment")
+
+
+# --- Main Application Flow ---
+init_db()
+start_metrics_endpoint()
+viewing_saved_id = st.query_params.get("view_id", [None])[0]
+if st.session_state.df_time_comparison_handle: time_comparison_panel()
+elif st.session_state.get('trend_group'): display_group_trend(st.session_state.trend_group)
+elif viewing_saved_id: saved_comparison_panel(viewing_saved_id)
 else:
-    if process_button:
-        st.session_state.df_ounass = pd.DataFrame(columns=['Brand', 'Count', 'Brand_Cleaned']); st.session_state.df_competitor = pd.DataFrame(columns=['Brand', 'Count', 'Brand_Cleaned'])
-        st.session_state.ounass_data = []; st.session_state.competitor_data = []; st.session_state.df_comparison_sorted = pd.DataFrame()
-        st.session_state.processed_ounass_url = ''; st.session_state.df_ounass_processed = False; st.session_state.df_competitor_processed = False
-        ounass_processed_ok = False
-        if st.session_state.ounass_url_input:
-            with st.spinner("Processing Ounass URL..."):
-                st.session_state.processed_ounass_url = ensure_ounass_full_list_parameter(st.session_state.ounass_url_input); ounass_html_content = fetch_html_content(st.session_state.processed_ounass_url)
-                if ounass_html_content: st.session_state.ounass_data = ounass_extractor.get_processed_ounass_data(ounass_html_content)
-                if st.session_state.ounass_data:
+    if process_button and competitor_name == MULTI_SITE_NAME:
+        with pipeline_run(f"Ounass vs {MULTI_SITE_NAME}") as metrics_run:
+            # Ounass and every competitor with an input are fetched and parsed together, then joined once into a brand x site matrix.
+            save_artifact('df_multi_comparison', None); st.session_state.processed_ounass_url = ''
+            multi_inputs = {site: site_input for site, site_input in st.session_state.multi_inputs.items() if site in competitor_options and site_input}
+            if not st.session_state.ounass_url_input: st.warning("Ounass URL is required.")
+            elif not multi_inputs: st.warning("Provide at least one competitor URL or HTML file.")
+            else:
+                st.session_state.processed_ounass_url = get_site(OUNASS_SITE).normalize_url(st.session_state.ounass_url_input)
+                multi_urls = {OUNASS_SITE: st.session_state.processed_ounass_url, **{site: get_site(site).normalize_url(site_input) for site, site_input in multi_inputs.items() if is_url_site(site)}}
+                with st.spinner("Fetching pages..."): fetched_pages = dict(zip(multi_urls.values(), fetch_html_pages(tuple(multi_urls.values()))))
+                site_pages = {site: fetched_pages.get(multi_urls[site]) if site in multi_urls else get_default_store().get(multi_inputs[site]) for site in [OUNASS_SITE, *multi_inputs]}
+                parse_jobs = [(site_name, html, None if site_name in multi_urls else st.session_state.multi_input_digests.get(site_name, (None, None))[1]) for site_name, html in site_pages.items() if html]
+                parsed_pages = {}
+                if parse_jobs:
+                    with st.spinner("Parsing pages..."): parsed_pages = parse_html_pages(parse_jobs)
+                multi_frames = {}
+                for site_name in site_pages:
+                    df_site = build_site_frame(site_name, parsed_pages.get(site_name, []))
+                    if df_site is None: st.warning(f"Could not process {site_name} {get_site(site_name).input_label}."); df_site = empty_brand_frame()
+                    multi_frames[site_name] = df_site
+                if not multi_frames[OUNASS_SITE].empty and any(not multi_frames[site].empty for site in multi_inputs):
+                    with st.spinner(f"Generating Ounass vs {MULTI_SITE_NAME} comparison..."):
+                        try: brand_aliases = load_brand_alias_index(); save_artifact('df_multi_comparison', build_multi_comparison(multi_frames, aliases=brand_aliases))
+                        except Exception as merge_e: st.error(f"Error during multi-site comparison: {merge_e}")
+                else: print("Multi-site comparison skipped.")
+        st.session_state.last_run_metrics = metrics_run.records
+        st.rerun()
+    elif process_button:
+        with pipeline_run(f"Ounass vs {st.session_state.competitor_selection}") as metrics_run:
+            for artifact_key in ('df_ounass', 'df_competitor', 'ounass_data', 'competitor_data', 'df_comparison_sorted'): save_artifact(artifact_key, None)
+            ounass_data = []; competitor_data = []
+            st.session_state.processed_ounass_url = ''; st.session_state.df_ounass_processed = False; st.session_state.df_competitor_processed = False; st.session_state.alias_suggestions = []
+            ounass_processed_ok = False; competitor_name_live = st.session_state.competitor_selection
+            ounass_site = get_site(OUNASS_SITE); competitor_site = get_site(competitor_name_live); competitor_input_live = live_competitor_input(competitor_name_live)
+            # Both pages download in parallel; the parse steps below only read from `fetched_pages`.
+            urls_to_fetch = []; competitor_page_url = None
+            if st.session_state.ounass_url_input: st.session_state.processed_ounass_url = ounass_site.normalize_url(st.session_state.ounass_url_input); urls_to_fetch.append(st.session_state.processed_ounass_url)
+            if competitor_input_live and not competitor_site.is_upload: competitor_page_url = competitor_site.normalize_url(competitor_input_live); urls_to_fetch.append(competitor_page_url)
+            fetched_pages = {}
+            if urls_to_fetch:
+                with st.spinner("Fetching pages..."): fetched_pages = dict(zip(urls_to_fetch, fetch_html_pages(tuple(urls_to_fetch))))
+            # Ounass and competitor pages are parsed in parallel in the worker pool.
+            site_pages = {OUNASS_SITE: fetched_pages.get(st.session_state.processed_ounass_url),
+                          competitor_name_live: competitor_input_live if competitor_site.is_upload else fetched_pages.get(competitor_page_url)}
+            site_digests = {competitor_name_live: (st.session_state.uploaded_competitor_digest or (None, None))[1]} if competitor_site.is_upload else {}
+            parse_jobs = [(site_name, html, site_digests.get(site_name)) for site_name, html in site_pages.items() if html]
+            parsed_pages = {}
+            if parse_jobs:
+                with st.spinner("Parsing pages..."): parsed_pages = parse_html_pages(parse_jobs)
+            if st.session_state.ounass_url_input:
+                ounass_data = parsed_pages.get(OUNASS_SITE, []); save_artifact('ounass_data', ounass_data)
+                df_o = build_site_frame(OUNASS_SITE, ounass_data)
+                if df_o is not None: save_artifact('df_ounass', df_o); st.session_state.df_ounass_processed = True; ounass_processed_ok = True
+            else: st.warning("Ounass URL is required.")
+            competitor_processed_ok = False
+            if competitor_input_live:
+                if not competitor_site.is_upload: st.session_state.competitor_input_identifier = competitor_input_live
+                competitor_data = parsed_pages.get(competitor_name_live, []); save_artifact('competitor_data', competitor_data)
+                df_c = build_site_frame(competitor_name_live, competitor_data)
+                if df_c is not None: save_artifact('df_competitor', df_c); st.session_state.df_competitor_processed = True; competitor_processed_ok = True
+            else: st.warning(f"{competitor_name_live} {'HTML file upload' if competitor_site.is_upload else 'URL'} is required.")
+            if st.session_state.ounass_url_input and not ounass_processed_ok: st.warning("Could not process Ounass URL."); st.session_state.df_ounass_processed = False
+            if competitor_input_live and not competitor_processed_ok: st.warning(f"Could not process {competitor_name_live} {competitor_site.input_label}."); st.session_state.df_competitor_processed = False
+            if st.session_state.df_ounass_processed and st.session_state.df_competitor_processed:
+                with st.spinner(f"Generating Ounass vs {competitor_name_live} comparison..."):
                     try:
-                        df_o = pd.DataFrame(st.session_state.ounass_data)
-                        if not df_o.empty and 'Brand' in df_o.columns and 'Count' in df_o.columns:
-                             df_o['Count'] = pd.to_numeric(df_o['Count'], errors='coerce').fillna(0); df_o = df_o[df_o['Count'] > 0]
-                             if not df_o.empty: df_o['Brand_Cleaned'] = df_o['Brand'].apply(clean_brand_name); st.session_state.df_ounass = df_o; st.session_state.df_ounass_processed = True; ounass_processed_ok = True
-                             else: print("Warning: Ounass data filtered out.")
-                        else: print("Warning: Ounass DF invalid.")
-                    except Exception as e: st.error(f"Error creating Ounass DF: {e}")
-        else: st.warning("Ounass URL is required.")
-        competitor_processed_ok = False; competitor_name_live = st.session_state.competitor_selection
-        if competitor_name_live == "Level Shoes":
-            if st.session_state.levelshoes_url_input:
-                 with st.spinner("Processing Level Shoes URL..."):
-                    st.session_state.competitor_input_identifier = st.session_state.levelshoes_url_input; levelshoes_html_content = fetch_html_content(st.session_state.levelshoes_url_input)
-                    if levelshoes_html_content: st.session_state.competitor_data = levelshoes_extractor.get_processed_levelshoes_data(levelshoes_html_content)
-                    if st.session_state.competitor_data:
-                        try:
-                            df_ls = pd.DataFrame(st.session_state.competitor_data)
-                            if not df_ls.empty and 'Brand' in df_ls.columns and 'Count' in df_ls.columns:
-                                df_ls['Count'] = pd.to_numeric(df_ls['Count'], errors='coerce').fillna(0); df_ls = df_ls[df_ls['Count'] > 0]
-                                if not df_ls.empty: df_ls['Brand_Cleaned'] = df_ls['Brand'].apply(clean_brand_name); st.session_state.df_competitor = df_ls; st.session_state.df_competitor_processed = True; competitor_processed_ok = True
-                                else: print("Warning: Level Shoes data filtered out.")
-                            else: print("Warning: Level Shoes DF invalid.")
-                        except Exception as e: st.error(f"Error creating Level Shoes DF: {e}")
-            else: st.warning("Level Shoes URL is required.")
-        elif competitor_name_live == "Sephora":
-             sephora_html_to_process = st.session_state.get('uploaded_sephora_html')
-             if sephora_html_to_process:
-                  with st.spinner("Processing Sephora HTML File..."): st.session_state.competitor_data = sephora_extractor.get_processed_sephora_data(sephora_html_to_process)
-                  if st.session_state.competitor_data:
-                       try:
-                           df_s = pd.DataFrame(st.session_state.competitor_data)
-                           if not df_s.empty and 'Brand' in df_s.columns and 'Count' in df_s.columns:
-                                df_s['Count'] = pd.to_numeric(df_s['Count'], errors='coerce').fillna(0); df_s = df_s[df_s['Count'] > 0]
-                                if not df_s.empty: df_s['Brand_Cleaned'] = df_s['Brand'].apply(clean_brand_name); st.session_state.df_competitor = df_s; st.session_state.df_competitor_processed = True; competitor_processed_ok = True
-                                else: print("Warning: Sephora data filtered out.")
-                           else: print("Warning: Sephora DF invalid.")
-                       except Exception as e: st.error(f"Error creating Sephora DF: {e}")
-             else: st.warning("Sephora HTML file upload is required.")
-        if st.session_state.ounass_url_input and not ounass_processed_ok: st.warning("Could not process Ounass URL."); st.session_state.df_ounass_processed = False
-        competitor_input_provided_live = bool(st.session_state.levelshoes_url_input if competitor_name_live=="Level Shoes" else st.session_state.uploaded_sephora_html)
-        if competitor_input_provided_live and not competitor_processed_ok: input_type = "URL" if competitor_name_live == "Level Shoes" else "HTML File"; st.warning(f"Could not process {competitor_name_live} {input_type}."); st.session_state.df_competitor_processed = False
-        if st.session_state.df_ounass_processed and st.session_state.df_competitor_processed:
-            with st.spinner(f"Generating Ounass vs {competitor_name_live} comparison..."):
-                try:
-                    df_o = st.session_state.df_ounass[['Brand','Count','Brand_Cleaned']].copy(); df_c = st.session_state.df_competitor[['Brand','Count','Brand_Cleaned']].copy()
-                    competitor_suffix = f"_{competitor_name_live.replace(' ', '')}"
-                    df_comp = pd.merge(df_o, df_c, on='Brand_Cleaned', how='outer', suffixes=('_Ounass', competitor_suffix))
-                    ounass_count_col = 'Count_Ounass'; competitor_count_col = f'Count{competitor_suffix}'; ounass_brand_col = 'Brand_Ounass'; competitor_brand_col = f'Brand{competitor_suffix}'
-                    df_comp['Ounass_Count'] = pd.to_numeric(df_comp[ounass_count_col], errors='coerce').fillna(0).astype(int); final_competitor_count_col = f"{competitor_name_live.replace(' ','')}_Count"
-                    df_comp[final_competitor_count_col] = pd.to_numeric(df_comp[competitor_count_col], errors='coerce').fillna(0).astype(int); df_comp['Difference'] = df_comp['Ounass_Count'] - df_comp[final_competitor_count_col]
-                    df_comp['Display_Brand'] = df_comp[ounass_brand_col]
-                    if competitor_brand_col in df_comp.columns: df_comp['Display_Brand'] = df_comp['Display_Brand'].fillna(df_comp[competitor_brand_col])
-                    df_comp['Display_Brand'] = df_comp['Display_Brand'].fillna(df_comp['Brand_Cleaned']); df_comp['Display_Brand'].fillna("Unknown", inplace=True)
-                    final_cols_ordered = ['Display_Brand', 'Brand_Cleaned', 'Ounass_Count', final_competitor_count_col, 'Difference', ounass_brand_col, competitor_brand_col]
-                    for col in final_cols_ordered:
-                        if col not in df_comp.columns: df_comp[col] = np.nan
-                    df_comp['Total_Count'] = df_comp['Ounass_Count'] + df_comp[final_competitor_count_col]
-                    st.session_state.df_comparison_sorted = df_comp.sort_values(by=['Total_Count', 'Ounass_Count', 'Display_Brand'], ascending=[False, False, True]).reset_index(drop=True)[final_cols_ordered + ['Total_Count']]
-                except Exception as merge_e: st.error(f"Error during comparison merge: {merge_e}"); st.session_state.df_comparison_sorted = pd.DataFrame()
-        else: st.session_state.df_comparison_sorted = pd.DataFrame(); print("Comparison skipped.")
+                        brand_aliases = load_brand_alias_index()
+                        comparison_result = compare_brand_lists(ounass_data, competitor_data, competitor_name_live, fuzzy_threshold=st.session_state.fuzzy_threshold if st.session_state.fuzzy_match_enabled else None, aliases=brand_aliases)
+                        save_artifact('df_comparison_sorted', comparison_result.df_comparison); st.session_state.alias_suggestions = comparison_result.suggestions
+                    except Exception as merge_e: st.error(f"Error during comparison merge: {merge_e}"); save_artifact('df_comparison_sorted', None)
+            else: save_artifact('df_comparison_sorted', None); print("Comparison skipped.")
+        st.session_state.last_run_metrics = metrics_run.records
         st.rerun()
-    df_ounass_live = st.session_state.get('df_ounass'); df_competitor_live = st.session_state.get('df_competitor'); df_comparison_sorted_live = st.session_state.get('df_comparison_sorted'); live_competitor_name = st.session_state.competitor_selection
-    display_all_results(df_ounass_live, df_competitor_live, live_competitor_name, df_comparison_sorted_live, stats_title_prefix="Current Comparison")
+    live_results_panel(competitor_name)
+    display_run_metrics(st.session_state.last_run_metrics)
+record({'stage': 'render', 'panel': 'app', 'seconds': round(time.perf_counter() - app_render_start, 6)})
 
 # --- END OF UPDATED FILE ---
@@ -0,0 +1,359 @@
+"""Comparison pipeline shared by the Streamlit app and batch jobs (no Streamlit dependency)."""
+import numpy as np
+import pandas as pd
+
+from brand_matching import match_brands
+from pipeline_metrics import stage
+from utils import clean_brand_names
+
+OUNASS_SITE = 'Ounass'
+BRAND_FRAME_COLUMNS = ['Brand', 'Count', 'Brand_Cleaned']
+# Site-agnostic column layout persisted in the history store.
+SAVED_COLUMNS = ['Display_Brand', 'Ounass_Count', 'Competitor_Count', 'Difference', 'Brand_Cleaned', 'Brand_Ounass', 'Brand_Competitor']
+
+
+def competitor_column_suffix(competitor_name: str) -> str:
+    """'Level Shoes' -> 'LevelShoes' (used in column names such as LevelShoes_Count)."""
+    return competitor_name.replace(' ', '')
+
+
+def competitor_count_column(competitor_name: str) -> str:
+    return f"{competitor_column_suffix(competitor_name)}_Count"
+
+
+def empty_brand_frame() -> pd.DataFrame:
+    return pd.DataFrame(columns=BRAND_FRAME_COLUMNS)
+
+
+def build_brand_frame(records, site_name: str = 'Site', known_keys: dict = None) -> pd.DataFrame:
+    """
+    Turn extractor output (list of {'Brand', 'Count'}) into a frame with
+    numeric counts, zero-count rows dropped and a `Brand_Cleaned` merge key.
+    `known_keys` (raw brand name -> key, see snapshot_brand_keys) is reused
+    as-is; only names missing from it are cleaned.
+    Returns an empty frame when nothing usable remains.
+    """
+    if not records:
+        return empty_brand_frame()
+    df = pd.DataFrame(records)
+    if df.empty or 'Brand' not in df.columns or 'Count' not in df.columns:
+        print(f"Warning: {site_name} DF invalid.")
+        return empty_brand_frame()
+    df['Count'] = pd.to_numeric(df['Count'], errors='coerce').fillna(0)
+    df = df[df['Count'] > 0].copy()
+    if df.empty:
+        print(f"Warning: {site_name} data filtered out.")
+        return empty_brand_frame()
+    with stage('clean', site=site_name, rows=len(df)) as rec:
+        if known_keys:
+            keys = df['Brand'].map(known_keys); unknown = keys.isna()
+            rec['cleaned'] = int(unknown.sum())
+            if unknown.any(): keys.loc[unknown] = clean_brand_names(df.loc[unknown, 'Brand'])
+            df['Brand_Cleaned'] = keys
+        else:
+            df['Brand_Cleaned'] = clean_brand_names(df['Brand'])
+    return df
+
+
+def build_comparison(df_ounass: pd.DataFrame, df_competitor: pd.DataFrame, competitor_name: str, fuzzy_threshold: float = None, aliases=None,
+                     new_keys: set = None) -> pd.DataFrame:
+    """
+    Outer-join two brand frames on `Brand_Cleaned` and return the comparison
+    sorted by Total_Count / Ounass_Count / Display_Brand, with columns:
+      Display_Brand | Brand_Cleaned | Ounass_Count | <Competitor>_Count | Difference |
+      Brand_Ounass | Brand_<Competitor> | Total_Count
+    With `fuzzy_threshold` set, brands left one-sided by the exact join are paired
+    up by brand_matching (score >= threshold) and collapsed into one row keyed
+    by the Ounass `Brand_Cleaned`.
+    `aliases` (a brand_aliases.BrandAliasIndex) maps competitor keys with no exact
+    Ounass partner to a known alias's canonical key before the join. Fuzzy
+    matches are not added to it: they are returned as unconfirmed suggestions in
+    attrs['alias_suggestions'] as (site, alias_key, canonical_key, display_name, score)
+    for BrandAliasIndex.confirm().
+    `new_keys` (incremental runs) limits the fuzzy pass to runs where a one-sided
+    row has one of these keys; the other one-sided rows were already judged by
+    the snapshot the known keys came from, so only pass it when that snapshot's
+    match_settings equal this run's.
+    """
+    df_o = df_ounass[BRAND_FRAME_COLUMNS].copy(); df_c = df_competitor[BRAND_FRAME_COLUMNS].copy()
+    if aliases is not None and len(aliases):
+        df_c['Brand_Cleaned'] = aliases.resolve(competitor_name, df_c['Brand_Cleaned'], targets=df_o['Brand_Cleaned'])
+    competitor_suffix = f"_{competitor_column_suffix(competitor_name)}"
+    with stage('merge', site=competitor_name, rows=len(df_o) + len(df_c)):
+        df_comp = pd.merge(df_o, df_c, on='Brand_Cleaned', how='outer', suffixes=('_Ounass', competitor_suffix))
+    ounass_count_col = 'Count_Ounass'; competitor_count_col = f'Count{competitor_suffix}'; ounass_brand_col = 'Brand_Ounass'; competitor_brand_col = f'Brand{competitor_suffix}'
+    suggestions = []
+    if fuzzy_threshold is not None and (new_keys is None or _has_new_one_sided(df_comp, ounass_count_col, competitor_count_col, new_keys)):
+        df_comp, suggestions = _fuzzy_merge_one_sided(df_comp, ounass_count_col, competitor_count_col, ounass_brand_col, competitor_brand_col, fuzzy_threshold, competitor_name)
+    final_competitor_count_col = competitor_count_column(competitor_name)
+    df_comp['Ounass_Count'] = pd.to_numeric(df_comp[ounass_count_col], errors='coerce').fillna(0).astype(int)
+    df_comp[final_competitor_count_col] = pd.to_numeric(df_comp[competitor_count_col], errors='coerce').fillna(0).astype(int)
+    df_comp['Difference'] = df_comp['Ounass_Count'] - df_comp[final_competitor_count_col]
+    df_comp['Display_Brand'] = df_comp[ounass_brand_col]
+    if competitor_brand_col in df_comp.columns: df_comp['Display_Brand'] = df_comp['Display_Brand'].fillna(df_comp[competitor_brand_col])
+    df_comp['Display_Brand'] = df_comp['Display_Brand'].fillna(df_comp['Brand_Cleaned']).fillna("Unknown")
+    final_cols_ordered = ['Display_Brand', 'Brand_Cleaned', 'Ounass_Count', final_competitor_count_col, 'Difference', ounass_brand_col, competitor_brand_col]
+    for col in final_cols_ordered:
+        if col not in df_comp.columns: df_comp[col] = np.nan
+    df_comp['Total_Count'] = df_comp['Ounass_Count'] + df_comp[final_competitor_count_col]
+    df_result = df_comp.sort_values(by=['Total_Count', 'Ounass_Count', 'Display_Brand'], ascending=[False, False, True]).reset_index(drop=True)[final_cols_ordered + ['Total_Count']]
+    df_result.attrs['fuzzy_threshold'] = fuzzy_threshold  # saved with the snapshot (match_settings)
+    df_result.attrs['alias_suggestions'] = suggestions
+    return df_result
+
+
+def _has_new_one_sided(df_comp: pd.DataFrame, left_count_col: str, right_count_col: str, new_keys: set) -> bool:
+    one_sided = df_comp[right_count_col].isna() | df_comp[left_count_col].isna()
+    return bool(df_comp.loc[one_sided, 'Brand_Cleaned'].isin(new_keys).any())
+
+
+def _fuzzy_merge_one_sided(df_comp: pd.DataFrame, left_count_col: str, right_count_col: str, left_brand_col: str, right_brand_col: str, threshold: float,
+                           right_site: str = None) -> tuple[pd.DataFrame, list]:
+    """
+    Second pass over an outer merge: fold fuzzy-matched right-only rows into their
+    left-only partners. Returns the folded frame and the pairs as alias suggestions
+    (right_site, right key, left key, left brand name, score).
+    """
+    left_only = df_comp.index[df_comp[right_count_col].isna()]; right_only = df_comp.index[df_comp[left_count_col].isna()]
+    if left_only.empty or right_only.empty:
+        return df_comp, []
+    with stage('match', site=right_site, left=len(left_only), right=len(right_only)) as rec:
+        matches = match_brands(df_comp.loc[left_only, left_brand_col].tolist(), df_comp.loc[right_only, right_brand_col].tolist(),
+                               df_comp.loc[left_only, 'Brand_Cleaned'].tolist(), df_comp.loc[right_only, 'Brand_Cleaned'].tolist(), threshold=threshold)
+        rec['matches'] = len(matches)
+    if not matches:
+        return df_comp, []
+    print(f"Fuzzy matching paired {len(matches)} one-sided brands (threshold {threshold}).")
+    left_rows = left_only[[i for i, _, _ in matches]]; right_rows = right_only[[j for _, j, _ in matches]]
+    suggestions = [(right_site, df_comp.at[right_row, 'Brand_Cleaned'], df_comp.at[left_row, 'Brand_Cleaned'], df_comp.at[left_row, left_brand_col], score)
+                   for left_row, right_row, (_, _, score) in zip(left_rows, right_rows, matches)]
+    df_comp = df_comp.copy()
+    for col in (right_count_col, right_brand_col):
+        df_comp.loc[left_rows, col] = df_comp.loc[right_rows, col].to_numpy()
+    return df_comp.drop(index=right_rows), suggestions
+
+
+def to_saved_frame(df_comparison: pd.DataFrame, competitor_name: str) -> pd.DataFrame:
+    """
+    Rename site-specific competitor columns to the generic SAVED_COLUMNS layout.
+    Raises ValueError when no competitor count column can be identified.
+    """
+    df_to_save = df_comparison.copy()
+    rename_map = {}
+    actual_competitor_count_col = competitor_count_column(competitor_name)
+    actual_competitor_brand_col = f"Brand_{competitor_column_suffix(competitor_name)}"
+
+    if actual_competitor_count_col in df_to_save.columns: rename_map[actual_competitor_count_col] = 'Competitor_Count'
+    elif 'Competitor_Count' not in df_to_save.columns:
+        found_comp_col = next((col for col in df_to_save.columns if col.endswith('_Count') and col not in ['Ounass_Count', 'Total_Count']), None)
+        if found_comp_col: rename_map[found_comp_col] = 'Competitor_Count'
+        else: raise ValueError("Cannot find competitor count column.")
+
+    if actual_competitor_brand_col in df_to_save.columns: rename_map[actual_competitor_brand_col] = 'Brand_Competitor'
+    elif 'Brand_Competitor' not in df_to_save.columns:
+        found_brand_comp_col = next((col for col in df_to_save.columns if col.startswith('Brand_') and col not in ['Brand_Ounass', 'Brand_Cleaned']), None)
+        if found_brand_comp_col: rename_map[found_brand_comp_col] = 'Brand_Competitor'
+        else: df_to_save['Brand_Competitor'] = np.nan
+
+    df_to_save.rename(columns=rename_map, inplace=True)
+    for col in SAVED_COLUMNS:
+        if col not in df_to_save.columns: df_to_save[col] = np.nan
+    return df_to_save[SAVED_COLUMNS]
+
+
+def to_saved_json(df_comparison: pd.DataFrame, competitor_name: str) -> str:
+    """JSON records payload of the legacy comparisons.comparison_data column."""
+    return to_saved_frame(df_comparison, competitor_name).to_json(orient="records", date_format="iso", default_handler=str)
+
+
+# One snapshot_brands row per (comparison row, site the brand appears on).
+SNAPSHOT_ROW_FIELDS = ('position', 'site', 'brand_key', 'display_brand', 'raw_name', 'count')
+
+
+def _none_if_na(value):
+    return None if pd.isna(value) else value
+
+
+def to_snapshot_rows(df_comparison: pd.DataFrame, competitor_name: str) -> list[tuple]:
+    """
+    Flatten a comparison into SNAPSHOT_ROW_FIELDS tuples (same rule as the SQL
+    backfill in db_utils): an Ounass row when the brand is on Ounass, a
+    competitor row when it is on the competitor, and an empty Ounass row for a
+    brand on neither so no comparison row is lost.
+    """
+    df_saved = to_saved_frame(df_comparison, competitor_name)
+    ounass_counts = pd.to_numeric(df_saved['Ounass_Count'], errors='coerce').fillna(0).astype(int).tolist()
+    competitor_counts = pd.to_numeric(df_saved['Competitor_Count'], errors='coerce').fillna(0).astype(int).tolist()
+    rows = []
+    for position, (display_brand, brand_key, brand_ounass, brand_competitor, ounass_count, competitor_count) in enumerate(zip(
+            df_saved['Display_Brand'], df_saved['Brand_Cleaned'], df_saved['Brand_Ounass'], df_saved['Brand_Competitor'], ounass_counts, competitor_counts)):
+        display_brand = _none_if_na(display_brand); brand_key = _none_if_na(brand_key) or ''
+        brand_ounass = _none_if_na(brand_ounass); brand_competitor = _none_if_na(brand_competitor)
+        on_competitor = competitor_count > 0 or brand_competitor is not None
+        if ounass_count > 0 or brand_ounass is not None or not on_competitor:
+            rows.append((position, OUNASS_SITE, brand_key, display_brand, brand_ounass, ounass_count))
+        if on_competitor:
+            rows.append((position, competitor_name, brand_key, display_brand, brand_competitor, competitor_count))
+    return rows
+
+
+def from_snapshot_rows(rows) -> pd.DataFrame:
+    """Rebuild the SAVED_COLUMNS frame (in saved row order) from snapshot_brands rows."""
+    df = pd.DataFrame(list(rows), columns=list(SNAPSHOT_ROW_FIELDS))
+    if df.empty:
+        return pd.DataFrame(columns=SAVED_COLUMNS)
+    is_ounass = df['site'] == OUNASS_SITE
+    df_o = df[is_ounass].drop_duplicates('position').set_index('position'); df_c = df[~is_ounass].drop_duplicates('position').set_index('position')
+    df_saved = df.drop_duplicates('position').set_index('position').sort_index()[['display_brand', 'brand_key']]
+    df_saved.columns = ['Display_Brand', 'Brand_Cleaned']
+    df_saved['Ounass_Count'] = df_o['count'].reindex(df_saved.index).fillna(0).astype(int)
+    df_saved['Competitor_Count'] = df_c['count'].reindex(df_saved.index).fillna(0).astype(int)
+    df_saved['Difference'] = df_saved['Ounass_Count'] - df_saved['Competitor_Count']
+    df_saved['Brand_Ounass'] = df_o['raw_name'].reindex(df_saved.index)
+    df_saved['Brand_Competitor'] = df_c['raw_name'].reindex(df_saved.index)
+    return df_saved.reset_index(drop=True)[SAVED_COLUMNS]
+
+
+def snapshot_brand_keys(rows, fuzzy_pairs=()) -> dict:
+    """
+    site -> {raw brand name -> brand_key} from a previous snapshot's rows. The keys
+    carry that run's cleaning and confirmed-alias decisions, so passing them to
+    build_brand_frame(known_keys=...) reproduces its pairings without recomputing them.
+    Rows paired by that run's fuzzy pass (`fuzzy_pairs`, see snapshot_fuzzy_pairs) are
+    left out: those names are cleaned and matched again, as unconfirmed suggestions.
+    """
+    fuzzy_keys = {(site, canonical_key) for site, _, canonical_key in fuzzy_pairs or ()}
+    keys = {}
+    for _, site, brand_key, _, raw_name, _ in rows:
+        if raw_name is not None and brand_key and (site, brand_key) not in fuzzy_keys:
+            keys.setdefault(site, {})[raw_name] = brand_key
+    return keys
+
+
+def snapshot_fuzzy_pairs(df_comparison: pd.DataFrame) -> list[list]:
+    """[site, alias_key, canonical_key] of each fuzzy pair in a comparison, stored with its snapshot (comparisons.fuzzy_pairs)."""
+    return [[site, alias_key, canonical_key] for site, alias_key, canonical_key, _, _ in df_comparison.attrs.get('alias_suggestions', [])]
+
+
+def match_settings(fuzzy_threshold: float = None) -> dict:
+    """
+    Settings that decided a snapshot's pairings, stored with it (comparisons.match_settings).
+    An incremental run reuses a snapshot's keys only when its settings are equal.
+    """
+    return {'fuzzy_threshold': None if fuzzy_threshold is None else float(fuzzy_threshold)}
+
+
+def new_brand_keys(df_brands: pd.DataFrame, known_keys: dict = None) -> set:
+    """Merge keys of brands whose raw name is not in `known_keys` (i.e. were cleaned fresh)."""
+    if df_brands.empty:
+        return set()
+    return set(df_brands.loc[~df_brands['Brand'].isin(list(known_keys or ())), 'Brand_Cleaned'])
+
+
+# One snapshot_changes row per (site, brand_key) whose count differs from the base snapshot.
+SNAPSHOT_CHANGE_FIELDS = ('site', 'brand_key', 'display_brand', 'old_count', 'new_count')
+
+
+def snapshot_changes(previous_rows, rows) -> list[tuple]:
+    """
+    Compact delta between two snapshots' rows as SNAPSHOT_CHANGE_FIELDS tuples:
+    added brands have old_count 0, dropped brands new_count 0, unchanged brands
+    are left out.
+    """
+    def totals(snapshot_rows):
+        counts, names = {}, {}
+        for _, site, brand_key, display_brand, _, count in snapshot_rows:
+            counts[(site, brand_key)] = counts.get((site, brand_key), 0) + int(count)
+            names.setdefault((site, brand_key), display_brand)
+        return counts, names
+
+    old_counts, old_names = totals(previous_rows)
+    new_counts, new_names = totals(rows)
+    changes = []
+    for key in sorted(old_counts.keys() | new_counts.keys()):
+        old_count, new_count = old_counts.get(key, 0), new_counts.get(key, 0)
+        if old_count != new_count:
+            changes.append((*key, new_names.get(key) or old_names.get(key), old_count, new_count))
+    return changes
+
+
+# competitor_name of a snapshot that compares Ounass against several competitors at once.
+MULTI_SITE_NAME = 'All Competitors'
+
+
+def build_multi_comparison(frames: dict, aliases=None) -> pd.DataFrame:
+    """
+    Brand x site matrix over several brand frames (`frames`: site -> frame, Ounass
+    first), built with one stacked group-by instead of pairwise merges. Columns:
+      Display_Brand | Brand_Cleaned | <Site>_Count ... | Sites_Present | Total_Count | Brand_<Site> ...
+    and the site names in attrs['sites']. Counts of the same key within one site are summed. Competitor keys are mapped
+    through `aliases` against the Ounass keys, as in build_comparison; there is
+    no fuzzy pass.
+    """
+    sites = list(frames)
+    ounass_keys = frames[OUNASS_SITE]['Brand_Cleaned'] if OUNASS_SITE in frames else pd.Series(dtype=object)
+    parts = []
+    for site, df_site in frames.items():
+        df_site = df_site[BRAND_FRAME_COLUMNS].copy()
+        if aliases is not None and len(aliases) and site != OUNASS_SITE:
+            df_site['Brand_Cleaned'] = aliases.resolve(site, df_site['Brand_Cleaned'], targets=ounass_keys)
+        df_site['Site'] = site
+        parts.append(df_site)
+    with stage('merge', site=MULTI_SITE_NAME, rows=sum(len(part) for part in parts)):
+        stacked = pd.concat(parts, ignore_index=True)
+        stacked['Count'] = pd.to_numeric(stacked['Count'], errors='coerce').fillna(0)
+        grouped = stacked.groupby(['Brand_Cleaned', 'Site'], sort=False).agg(Count=('Count', 'sum'), Brand=('Brand', 'first'))
+        counts = grouped['Count'].unstack('Site').reindex(columns=sites).fillna(0).astype(int)
+        brands = grouped['Brand'].unstack('Site').reindex(columns=sites)
+    count_cols = [competitor_count_column(site) for site in sites]; brand_cols = [f"Brand_{competitor_column_suffix(site)}" for site in sites]
+    df_multi = pd.DataFrame({'Brand_Cleaned': counts.index}, index=counts.index)
+    df_multi['Display_Brand'] = brands.bfill(axis=1).iloc[:, 0].fillna(df_multi['Brand_Cleaned']).fillna("Unknown")
+    for site, count_col in zip(sites, count_cols): df_multi[count_col] = counts[site]
+    df_multi['Sites_Present'] = (counts > 0).sum(axis=1)
+    df_multi['Total_Count'] = counts.sum(axis=1)
+    for site, brand_col in zip(sites, brand_cols): df_multi[brand_col] = brands[site]
+    sort_cols, ascending = ['Total_Count', 'Display_Brand'], [False, True]
+    if OUNASS_SITE in sites: sort_cols.insert(1, competitor_count_column(OUNASS_SITE)); ascending.insert(1, False)
+    df_multi = df_multi.sort_values(by=sort_cols, ascending=ascending).reset_index(drop=True)[['Display_Brand', 'Brand_Cleaned'] + count_cols + ['Sites_Present', 'Total_Count'] + brand_cols]
+    df_multi.attrs['sites'] = sites
+    return df_multi
+
+
+def to_multi_snapshot_rows(df_multi: pd.DataFrame, sites) -> list[tuple]:
+    """
+    SNAPSHOT_ROW_FIELDS tuples for a multi-site matrix: one row per site a brand is
+    on, and an empty Ounass row for a brand on none, as to_snapshot_rows does.
+    """
+    rows = []
+    site_columns = [(site, competitor_count_column(site), f"Brand_{competitor_column_suffix(site)}") for site in sites]
+    for position, record in enumerate(df_multi.to_dict(orient='records')):
+        display_brand = _none_if_na(record['Display_Brand']); brand_key = _none_if_na(record['Brand_Cleaned']) or ''
+        site_rows = []
+        for site, count_col, brand_col in site_columns:
+            count = int(record.get(count_col) or 0); raw_name = _none_if_na(record.get(brand_col))
+            if count > 0 or raw_name is not None:
+                site_rows.append((position, site, brand_key, display_brand, raw_name, count))
+        rows.extend(site_rows or [(position, OUNASS_SITE, brand_key, display_brand, None, 0)])
+    return rows
+
+
+def from_multi_snapshot_rows(rows) -> pd.DataFrame:
+    """Rebuild a build_multi_comparison frame (in saved row order) from snapshot_brands rows."""
+    df = pd.DataFrame(list(rows), columns=list(SNAPSHOT_ROW_FIELDS))
+    if df.empty:
+        return pd.DataFrame(columns=['Display_Brand', 'Brand_Cleaned', 'Sites_Present', 'Total_Count'])
+    sites = list(dict.fromkeys(df['site']))
+    if OUNASS_SITE in sites: sites.remove(OUNASS_SITE); sites.insert(0, OUNASS_SITE)
+    by_site = df.drop_duplicates(['position', 'site']).set_index(['position', 'site'])
+    counts = by_site['count'].unstack('site').reindex(columns=sites).fillna(0).astype(int).sort_index()
+    brands = by_site['raw_name'].unstack('site').reindex(index=counts.index, columns=sites)
+    first = df.drop_duplicates('position').set_index('position').reindex(counts.index)
+    count_cols = [competitor_count_column(site) for site in sites]; brand_cols = [f"Brand_{competitor_column_suffix(site)}" for site in sites]
+    df_multi = pd.DataFrame({'Display_Brand': first['display_brand'], 'Brand_Cleaned': first['brand_key']}, index=counts.index)
+    for site, count_col in zip(sites, count_cols): df_multi[count_col] = counts[site]
+    df_multi['Sites_Present'] = (counts > 0).sum(axis=1)
+    df_multi['Total_Count'] = counts.sum(axis=1)
+    for site, brand_col in zip(sites, brand_cols): df_multi[brand_col] = brands[site]
+    df_multi = df_multi.reset_index(drop=True)
+    df_multi.attrs['sites'] = sites
+    return df_multi
@@ -0,0 +1,85 @@
+"""
+Chart frames and Plotly figures for the comparison views (no Streamlit dependency).
+
+plotly is only imported when the first figure is built, so a session that never
+opens a chart never pays for it. The derived frames (overlap counts, largest
+differences, melted top-N) are computed here once per comparison; the app
+memoizes the resulting figures by the comparison frame's content hash.
+"""
+import pandas as pd
+
+from comparison import OUNASS_SITE, competitor_count_column
+
+TOP_DIFFERENCES = 5  # largest positive and negative differences each
+TOP_BRANDS = 15
+MULTI_SITE_TOP_BRANDS = 20
+
+
+def _px():
+    import plotly.express as px
+    return px
+
+
+def overlap_frame(df_comparison: pd.DataFrame, competitor_name: str) -> pd.DataFrame:
+    """Category | Count rows for common / Ounass-only / competitor-only brands (empty categories dropped)."""
+    ounass = pd.to_numeric(df_comparison['Ounass_Count'], errors='coerce').fillna(0) > 0
+    competitor = pd.to_numeric(df_comparison[competitor_count_column(competitor_name)], errors='coerce').fillna(0) > 0
+    df_pie = pd.DataFrame({'Category': ['Common Brands', 'Ounass Only', f'{competitor_name} Only'],
+                           'Count': [int((ounass & competitor).sum()), int((ounass & ~competitor).sum()), int((~ounass & competitor).sum())]})
+    return df_pie[df_pie['Count'] > 0]
+
+
+def difference_frame(df_comparison: pd.DataFrame, top: int = TOP_DIFFERENCES) -> pd.DataFrame:
+    """The `top` largest positive and negative Differences, largest first."""
+    differences = pd.to_numeric(df_comparison['Difference'], errors='coerce')
+    df_diff = df_comparison.assign(Difference=differences).dropna(subset=['Difference'])
+    top_pos = df_diff[df_diff['Difference'] > 0].nlargest(top, 'Difference'); top_neg = df_diff[df_diff['Difference'] < 0].nsmallest(top, 'Difference')
+    return pd.concat([top_pos, top_neg]).sort_values('Difference', ascending=False)
+
+
+def top_brands_frame(df_comparison: pd.DataFrame, competitor_name: str, top_n: int = TOP_BRANDS) -> tuple[pd.DataFrame, list]:
+    """(Display_Brand | Website | Product Count rows, brand order) for the `top_n` brands by combined count."""
+    count_col = competitor_count_column(competitor_name)
+    df_counts = df_comparison[['Display_Brand']].assign(Ounass_Count=pd.to_numeric(df_comparison['Ounass_Count'], errors='coerce').fillna(0),
+                                                        **{count_col: pd.to_numeric(df_comparison[count_col], errors='coerce').fillna(0)})
+    top_brands = df_counts.assign(Total_Count=df_counts['Ounass_Count'] + df_counts[count_col]).nlargest(top_n, 'Total_Count')
+    melted = top_brands.melt(id_vars='Display_Brand', value_vars=['Ounass_Count', count_col], var_name='Website', value_name='Product Count')
+    melted['Website'] = melted['Website'].replace({'Ounass_Count': OUNASS_SITE, count_col: competitor_name})
+    return melted, top_brands['Display_Brand'].tolist()
+
+
+def comparison_figures(df_comparison: pd.DataFrame, competitor_name: str, top_n: int = TOP_BRANDS) -> dict:
+    """
+    {'overlap', 'differences', 'top_brands'} -> Plotly figure, or None when there is
+    nothing to chart. A chart whose columns are missing raises KeyError.
+    """
+    px = _px()
+    figures = {'overlap': None, 'differences': None, 'top_brands': None}
+    df_pie = overlap_frame(df_comparison, competitor_name)
+    if not df_pie.empty:
+        figures['overlap'] = px.pie(df_pie, names='Category', values='Count', title="Brand Presence Distribution", color_discrete_sequence=px.colors.qualitative.Pastel)
+        figures['overlap'].update_traces(textposition='inside', textinfo='percent+label+value')
+    df_diff = difference_frame(df_comparison)
+    if not df_diff.empty:
+        figures['differences'] = px.bar(df_diff, x='Display_Brand', y='Difference', title="Largest Product Count Differences",
+                                        labels={'Display_Brand': 'Brand', 'Difference': f'Difference (Ounass - {competitor_name})'},
+                                        color='Difference', color_continuous_scale=px.colors.diverging.RdBu)
+        figures['differences'].update_layout(xaxis_title=None)
+    melted, brand_order = top_brands_frame(df_comparison, competitor_name, top_n)
+    if not melted.empty:
+        figures['top_brands'] = px.bar(melted, x='Display_Brand', y='Product Count', color='Website', barmode='group', title=f"Top {top_n} Brands by Total Products (Combined)",
+                                       labels={'Display_Brand': 'Brand'}, category_orders={"Display_Brand": brand_order})
+        figures['top_brands'].update_layout(xaxis_title=None)
+    return figures
+
+
+def multi_site_figure(df_matrix: pd.DataFrame, sites, top_n: int = MULTI_SITE_TOP_BRANDS):
+    """Grouped bar chart of the first `top_n` rows of a Brand | <site>... matrix."""
+    df_top = df_matrix.head(top_n).melt(id_vars='Brand', value_vars=list(sites), var_name='Website', value_name='Product Count')
+    return _px().bar(df_top, x='Brand', y='Product Count', color='Website', barmode='group', title=f"Top {top_n} Brands by Total Product Count")
+
+
+def trend_figure(df_site: pd.DataFrame, site_name: str):
+    """Product count per snapshot, one line per display_brand."""
+    return _px().line(df_site, x='timestamp', y='count', color='display_brand', markers=True, title=f"{site_name} Product Count per Snapshot",
+                      labels={'timestamp': 'Snapshot', 'count': 'Product Count', 'display_brand': 'Brand'})
@@ -0,0 +1,150 @@
+"""
+Comparison engine: brand lists in, comparison frame and summary stats out (no Streamlit / plotly dependency).
+
+`compare_brand_lists` is the whole Ounass vs competitor step the app and the
+batch runner share: brand frames for both sides (comparison.build_brand_frame),
+the merge / Display_Brand / Total_Count / sort (comparison.build_comparison)
+and the headline numbers (`comparison_stats`). Results are memoized in a
+bounded LRU keyed on a sha256 of the inputs (brand lists, competitor, fuzzy
+threshold, known keys, alias index version), so a rerun with unchanged pages
+skips the merge entirely. Cached frames are handed out as copies; a cached
+result keeps its fuzzy pairs, so every hit returns the same alias suggestions.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+from comparison import OUNASS_SITE, build_brand_frame, build_comparison, competitor_count_column, new_brand_keys
+
+DEFAULT_CACHE_SIZE = 32
+ComparisonResult = namedtuple('ComparisonResult', ['df_ounass', 'df_competitor', 'df_comparison', 'stats', 'suggestions'])
+
+
+class ComparisonCache:
+    """Thread-safe LRU of content hash -> value."""
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_default_cache = ComparisonCache()
+
+
+def content_hash(*parts) -> str:
+    """sha256 over the JSON form of `parts` (brand lists, names, thresholds, key maps)."""
+    return hashlib.sha256(json.dumps(parts, default=str, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """sha256 of a frame's column names, index and values (for memoizing anything derived from it)."""
+    digest = hashlib.sha256(json.dumps([str(col) for col in df.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _records_key(records) -> list:
+    return [(record.get('Brand'), record.get('Count')) for record in records or []]
+
+
+def brand_frame(records, site_name: str, known_keys: dict = None, cache: ComparisonCache = None) -> pd.DataFrame:
+    """Memoized comparison.build_brand_frame (returns a copy)."""
+    cache = cache if cache is not None else _default_cache
+    key = content_hash('brand_frame', site_name, _records_key(records), known_keys)
+    df = cache.get(key)
+    if df is None:
+        df = build_brand_frame(records, site_name, known_keys=known_keys)
+        cache.put(key, df)
+    return df.copy()
+
+
+def comparison_stats(df_ounass, df_competitor, df_comparison, competitor_name: str) -> dict:
+    """
+    Headline numbers of a comparison: brands / products per side and the common /
+    one-sided brand counts (None without a comparison frame). Sides without a brand
+    frame (saved snapshots) fall back to the comparison frame's counts.
+    """
+    count_col = competitor_count_column(competitor_name)
+    stats = {}
+    for prefix, df_site in (('ounass', df_ounass), ('competitor', df_competitor)):
+        has_site = df_site is not None and not df_site.empty and 'Brand' in df_site.columns and 'Count' in df_site.columns
+        stats[f'{prefix}_brands'] = int(df_site['Brand'].nunique()) if has_site else 0
+        stats[f'{prefix}_products'] = int(pd.to_numeric(df_site['Count'], errors='coerce').fillna(0).sum()) if has_site else 0
+    stats.update(common_brands=None, ounass_only=None, competitor_only=None)
+    if df_comparison is None or df_comparison.empty or 'Ounass_Count' not in df_comparison.columns or count_col not in df_comparison.columns:
+        return stats
+    ounass_counts = pd.to_numeric(df_comparison['Ounass_Count'], errors='coerce').fillna(0)
+    competitor_counts = pd.to_numeric(df_comparison[count_col], errors='coerce').fillna(0)
+    if stats['ounass_products'] == 0: stats['ounass_products'] = int(ounass_counts.sum())
+    if stats['competitor_products'] == 0: stats['competitor_products'] = int(competitor_counts.sum())
+    if stats['ounass_brands'] == 0: stats['ounass_brands'] = int((ounass_counts > 0).sum())
+    if stats['competitor_brands'] == 0: stats['competitor_brands'] = int((competitor_counts > 0).sum())
+    stats['common_brands'] = int(((ounass_counts > 0) & (competitor_counts > 0)).sum())
+    stats['ounass_only'] = int(((ounass_counts > 0) & (competitor_counts == 0)).sum())
+    stats['competitor_only'] = int(((ounass_counts == 0) & (competitor_counts > 0)).sum())
+    return stats
+
+
+def compare_brand_lists(ounass_records, competitor_records, competitor_name: str, fuzzy_threshold: float = None,
+                        aliases=None, known_keys: dict = None, cache: ComparisonCache = None) -> ComparisonResult:
+    """
+    Compare two extractor outputs (lists of {'Brand', 'Count'}) and return a
+    ComparisonResult. `df_comparison` is empty when either side has no usable
+    brands. `fuzzy_threshold` / `aliases` are passed to build_comparison;
+    `known_keys` (site -> {raw name -> key}, comparison.snapshot_brand_keys) makes
+    the run incremental as in build_brand_frame / build_comparison(new_keys=...).
+    `suggestions` lists the run's unconfirmed fuzzy pairs (build_comparison attrs['alias_suggestions']);
+    they belong to the caller's run, not to the shared alias index.
+    """
+    cache = cache if cache is not None else _default_cache
+    key = content_hash('comparison', competitor_name, _records_key(ounass_records), _records_key(competitor_records), fuzzy_threshold,
+                       known_keys, None if aliases is None else (len(aliases), aliases.version))
+    cached = cache.get(key)
+    if cached is not None:
+        return ComparisonResult(*(df.copy() for df in cached[:3]), dict(cached.stats), list(cached.suggestions))
+    known_keys = known_keys or {}
+    df_ounass = brand_frame(ounass_records, OUNASS_SITE, known_keys=known_keys.get(OUNASS_SITE), cache=cache)
+    df_competitor = brand_frame(competitor_records, competitor_name, known_keys=known_keys.get(competitor_name), cache=cache)
+    df_comparison = pd.DataFrame()
+    if not df_ounass.empty and not df_competitor.empty:
+        new_keys = None
+        if known_keys:
+            new_keys = new_brand_keys(df_ounass, known_keys.get(OUNASS_SITE)) | new_brand_keys(df_competitor, known_keys.get(competitor_name))
+        df_comparison = build_comparison(df_ounass, df_competitor, competitor_name, fuzzy_threshold=fuzzy_threshold, aliases=aliases, new_keys=new_keys)
+    result = ComparisonResult(df_ounass, df_competitor, df_comparison, comparison_stats(df_ounass, df_competitor, df_comparison, competitor_name),
+                              tuple(df_comparison.attrs.get('alias_suggestions', ())))
+    cache.put(key, result)
+    return ComparisonResult(*(df.copy() for df in result[:3]), dict(result.stats), list(result.suggestions))
+
+
+def clear_cache() -> None:
+    _default_cache.clear()
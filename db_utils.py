@@ -0,0 +1,583 @@
+"""PostgreSQL helpers for the comparison history store (no Streamlit dependency)."""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2.extras import Json, execute_values
+
+from brand_aliases import ALIAS_SCHEMA_SQL
+from pipeline_metrics import stage
+
+try:
+    import pytz
+except ImportError:
+    pytz = None
+
+INIT_SCHEMA_SQL = """
+    DO $$
+    BEGIN
+        CREATE TABLE IF NOT EXISTS comparisons (
+            id SERIAL PRIMARY KEY, timestamp TIMESTAMPTZ NOT NULL, ounass_url TEXT NOT NULL,
+            levelshoes_url TEXT, comparison_data JSONB NOT NULL, comparison_name TEXT,
+            competitor_name TEXT, competitor_input TEXT
+        );
+        ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS competitor_name TEXT;
+        ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS competitor_input TEXT;
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name='comparisons' AND column_name='levelshoes_url' AND is_nullable='NO'
+        ) THEN
+           ALTER TABLE comparisons ALTER COLUMN levelshoes_url DROP NOT NULL;
+        END IF;
+     EXCEPTION
+        WHEN duplicate_object THEN RAISE NOTICE 'Table comparisons already exists.';
+        WHEN others THEN RAISE WARNING 'Error during DB init: %', SQLERRM;
+    END $$;
+"""
+
+# Normalized per-brand snapshot rows. comparison_data is only kept for legacy rows.
+# The primary key (snapshot_id, …) doubles as the per-snapshot lookup index;
+# snapshot_ts is denormalized from comparisons so brand trends are one index range scan.
+SNAPSHOT_SCHEMA_SQL = """
+    ALTER TABLE comparisons ALTER COLUMN comparison_data DROP NOT NULL;
+    CREATE TABLE IF NOT EXISTS snapshot_brands (
+        snapshot_id INTEGER NOT NULL REFERENCES comparisons(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL, site TEXT NOT NULL, brand_key TEXT NOT NULL,
+        display_brand TEXT, raw_name TEXT, count INTEGER NOT NULL, snapshot_ts TIMESTAMPTZ NOT NULL,
+        PRIMARY KEY (snapshot_id, position, site)
+    );
+    CREATE INDEX IF NOT EXISTS snapshot_brands_brand_ts ON snapshot_brands (brand_key, snapshot_ts);
+"""
+
+# Incremental runs record what changed against the group's previous snapshot
+# (comparison.snapshot_changes). snapshot_brands still holds every brand of every snapshot,
+# so a saved view or trend reads one snapshot instead of replaying a chain of deltas;
+# snapshot_changes only adds the changed brands (a few percent of a snapshot's rows) and
+# answers "what moved since last run" without diffing two snapshots.
+SNAPSHOT_CHANGES_SCHEMA_SQL = """
+    ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS base_snapshot_id INTEGER REFERENCES comparisons(id) ON DELETE SET NULL;
+    CREATE TABLE IF NOT EXISTS snapshot_changes (
+        snapshot_id INTEGER NOT NULL REFERENCES comparisons(id) ON DELETE CASCADE,
+        site TEXT NOT NULL, brand_key TEXT NOT NULL, display_brand TEXT,
+        old_count INTEGER NOT NULL, new_count INTEGER NOT NULL,
+        PRIMARY KEY (snapshot_id, site, brand_key)
+    );
+"""
+
+# One-time backfill of JSONB snapshots that have no snapshot_brands rows yet (same rule
+# as comparison.to_snapshot_rows). Legacy payloads may use LevelShoes_* column names.
+BACKFILL_SNAPSHOT_BRANDS_SQL = r"""
+    WITH pending AS (
+        SELECT c.id, c.timestamp, c.comparison_data,
+               COALESCE(c.competitor_name, CASE WHEN c.levelshoes_url IS NOT NULL THEN 'Level Shoes' ELSE 'Unknown Competitor' END) AS competitor
+        FROM comparisons c
+        WHERE c.comparison_data IS NOT NULL AND jsonb_typeof(c.comparison_data) = 'array'
+          AND NOT EXISTS (SELECT 1 FROM snapshot_brands s WHERE s.snapshot_id = c.id)
+    ), items AS (
+        SELECT p.id, p.timestamp, p.competitor, e.ord - 1 AS position,
+               e.elem->>'Display_Brand' AS display_brand, COALESCE(e.elem->>'Brand_Cleaned', '') AS brand_key,
+               e.elem->>'Brand_Ounass' AS brand_ounass,
+               COALESCE(e.elem->>'Brand_Competitor', e.elem->>'Brand_LevelShoes') AS brand_competitor,
+               e.elem->>'Ounass_Count' AS ounass_raw,
+               COALESCE(e.elem->>'Competitor_Count', e.elem->>'LevelShoes_Count') AS competitor_raw
+        FROM pending p CROSS JOIN LATERAL jsonb_array_elements(p.comparison_data) WITH ORDINALITY AS e(elem, ord)
+    ), counted AS (
+        SELECT items.*,
+               CASE WHEN ounass_raw ~ '^-?[0-9]+(\.[0-9]+)?$' THEN round(ounass_raw::numeric)::int ELSE 0 END AS ounass_count,
+               CASE WHEN competitor_raw ~ '^-?[0-9]+(\.[0-9]+)?$' THEN round(competitor_raw::numeric)::int ELSE 0 END AS competitor_count
+        FROM items
+    )
+    INSERT INTO snapshot_brands (snapshot_id, position, site, brand_key, display_brand, raw_name, count, snapshot_ts)
+    SELECT id, position, 'Ounass', brand_key, display_brand, brand_ounass, ounass_count, timestamp FROM counted
+    WHERE ounass_count > 0 OR brand_ounass IS NOT NULL OR NOT (competitor_count > 0 OR brand_competitor IS NOT NULL)
+    UNION ALL
+    SELECT id, position, competitor, brand_key, display_brand, brand_competitor, competitor_count, timestamp FROM counted
+    WHERE competitor_count > 0 OR brand_competitor IS NOT NULL
+"""
+
+# SQL mirror of snapshot_group_key() over a comparisons row (legacy rows only have levelshoes_url);
+# stored as the generated columns group_competitor / group_input (NULLIF'd since migration 9, so an
+# empty input and a missing one are the same group, as in history_groups_key).
+GROUP_COMPETITOR_SQL = "COALESCE(NULLIF(competitor_name, ''), CASE WHEN NULLIF(levelshoes_url, '') IS NOT NULL THEN 'Level Shoes' END, 'Unknown')"
+GROUP_INPUT_SQL = f"""CASE WHEN NULLIF(competitor_name, '') IS NULL AND NULLIF(levelshoes_url, '') IS NULL THEN 'N/A'
+                          WHEN NULLIF(competitor_input, '') IS NULL AND {GROUP_COMPETITOR_SQL} = 'Level Shoes' THEN levelshoes_url
+                          ELSE competitor_input END"""
+
+# Rows of `comparisons c` in one history group; the input parameter gets the same '' -> NULL
+# normalisation as group_input. Spelled as equality / IS NULL (IS NOT DISTINCT FROM is not
+# indexable) so comparisons_group_key covers the whole key.
+GROUP_MATCH_SQL = """c.ounass_url = %(ounass_url)s AND c.group_competitor = %(competitor_name)s
+          AND (c.group_input = NULLIF(%(competitor_input)s, '') OR (c.group_input IS NULL AND NULLIF(%(competitor_input)s, '') IS NULL))"""
+
+# Indexes behind the history sidebar: group member lookups and the newest-first keyset scan.
+HISTORY_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS comparisons_history_group ON comparisons (ounass_url, competitor_name, competitor_input, timestamp);
+    CREATE INDEX IF NOT EXISTS comparisons_timestamp_id ON comparisons (timestamp DESC, id DESC);
+"""
+
+# Stored group key on comparisons plus a trigger-maintained history_groups summary (one row per
+# group with its snapshot count and newest snapshot), so the sidebar pages through groups without
+# aggregating comparisons. Inserts bump the summary; deletes recount the group off comparisons_group_key.
+GROUP_KEY_INDEX_SQL = "CREATE INDEX IF NOT EXISTS comparisons_group_key ON comparisons (ounass_url, group_competitor, group_input, timestamp DESC, id DESC);"
+HISTORY_GROUPS_BACKFILL_SQL = """
+    INSERT INTO history_groups (ounass_url, group_competitor, group_input, snapshot_count, latest_ts, latest_id)
+    SELECT DISTINCT ON (ounass_url, group_competitor, COALESCE(group_input, ''))
+           ounass_url, group_competitor, group_input,
+           COUNT(*) OVER (PARTITION BY ounass_url, group_competitor, COALESCE(group_input, '')), timestamp, id
+    FROM comparisons
+    ORDER BY ounass_url, group_competitor, COALESCE(group_input, ''), timestamp DESC, id DESC
+    ON CONFLICT DO NOTHING;
+"""
+HISTORY_GROUPS_SCHEMA_SQL = f"""
+    ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS group_competitor TEXT GENERATED ALWAYS AS ({GROUP_COMPETITOR_SQL}) STORED;
+    ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS group_input TEXT GENERATED ALWAYS AS ({GROUP_INPUT_SQL}) STORED;
+    {GROUP_KEY_INDEX_SQL}
+    DROP INDEX IF EXISTS comparisons_history_group;
+    CREATE TABLE IF NOT EXISTS history_groups (
+        ounass_url TEXT NOT NULL, group_competitor TEXT NOT NULL, group_input TEXT,
+        snapshot_count INTEGER NOT NULL, latest_ts TIMESTAMPTZ NOT NULL, latest_id INTEGER NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS history_groups_key ON history_groups (ounass_url, group_competitor, COALESCE(group_input, ''));
+    CREATE INDEX IF NOT EXISTS history_groups_latest ON history_groups (latest_ts DESC, latest_id DESC);
+    {HISTORY_GROUPS_BACKFILL_SQL}
+    CREATE OR REPLACE FUNCTION history_groups_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO history_groups AS h (ounass_url, group_competitor, group_input, snapshot_count, latest_ts, latest_id)
+            VALUES (NEW.ounass_url, NEW.group_competitor, NEW.group_input, 1, NEW.timestamp, NEW.id)
+            ON CONFLICT (ounass_url, group_competitor, COALESCE(group_input, '')) DO UPDATE
+            SET snapshot_count = h.snapshot_count + 1,
+                latest_ts = CASE WHEN (NEW.timestamp, NEW.id) > (h.latest_ts, h.latest_id) THEN NEW.timestamp ELSE h.latest_ts END,
+                latest_id = CASE WHEN (NEW.timestamp, NEW.id) > (h.latest_ts, h.latest_id) THEN NEW.id ELSE h.latest_id END;
+            RETURN NEW;
+        END IF;
+        WITH grp AS (
+            SELECT c.id, c.timestamp FROM comparisons c
+            WHERE c.ounass_url = OLD.ounass_url AND c.group_competitor = OLD.group_competitor
+              AND (c.group_input = OLD.group_input OR (c.group_input IS NULL AND OLD.group_input IS NULL))
+        ), latest AS (
+            SELECT (SELECT COUNT(*) FROM grp) AS snapshot_count, grp.timestamp, grp.id FROM grp
+            ORDER BY grp.timestamp DESC, grp.id DESC LIMIT 1
+        )
+        UPDATE history_groups h SET snapshot_count = latest.snapshot_count, latest_ts = latest.timestamp, latest_id = latest.id
+        FROM latest
+        WHERE h.ounass_url = OLD.ounass_url AND h.group_competitor = OLD.group_competitor
+          AND COALESCE(h.group_input, '') = COALESCE(OLD.group_input, '');
+        IF NOT FOUND THEN
+            DELETE FROM history_groups h
+            WHERE h.ounass_url = OLD.ounass_url AND h.group_competitor = OLD.group_competitor
+              AND COALESCE(h.group_input, '') = COALESCE(OLD.group_input, '');
+        END IF;
+        RETURN OLD;
+    END $$;
+    DROP TRIGGER IF EXISTS comparisons_history_groups ON comparisons;
+    CREATE TRIGGER comparisons_history_groups AFTER INSERT OR DELETE ON comparisons
+        FOR EACH ROW EXECUTE FUNCTION history_groups_sync();
+"""
+
+HISTORY_GROUP_PAGE_SIZE = 25
+HISTORY_SNAPSHOT_PAGE_SIZE = 20
+
+# One page of history groups, newest group first, read off history_groups and paged by keyset
+# on (latest_ts, latest_id); latest_id is unique per group, so it is a total order.
+HISTORY_GROUPS_SQL = """
+    SELECT h.ounass_url, h.group_competitor, h.group_input, h.snapshot_count, h.latest_ts, h.latest_id
+    FROM history_groups h
+    WHERE (%(search)s IS NULL OR h.ounass_url ILIKE %(search)s OR h.group_competitor ILIKE %(search)s OR h.group_input ILIKE %(search)s)
+      AND (%(competitor)s IS NULL OR h.group_competitor = %(competitor)s)
+      AND (%(after_ts)s::timestamptz IS NULL OR (h.latest_ts, h.latest_id) < (%(after_ts)s::timestamptz, %(after_id)s))
+    ORDER BY h.latest_ts DESC, h.latest_id DESC
+    LIMIT %(limit)s
+"""
+HISTORY_GROUP_COLUMNS = ['ounass_url', 'competitor_name', 'competitor_input', 'snapshot_count', 'latest_ts', 'latest_id']
+
+# Snapshots of one group, newest first, paged by keyset on (timestamp, id).
+GROUP_SNAPSHOTS_SQL = f"""
+    SELECT c.id, c.timestamp FROM comparisons c
+    WHERE {GROUP_MATCH_SQL}
+      AND (%(before_ts)s::timestamptz IS NULL OR (c.timestamp, c.id) < (%(before_ts)s::timestamptz, %(before_id)s))
+    ORDER BY c.timestamp DESC, c.id DESC
+    LIMIT %(limit)s
+"""
+
+# Per-brand counts for every snapshot of a group on a dense snapshot x (site, brand) grid, so a
+# brand missing from a snapshot counts 0; delta is the change since the previous snapshot.
+BRAND_TREND_SQL = f"""
+    WITH grp AS (
+        SELECT c.id, c.timestamp FROM comparisons c
+        WHERE {GROUP_MATCH_SQL}
+    ), counts AS (
+        SELECT s.snapshot_id, s.site, s.brand_key, SUM(s.count) AS count
+        FROM snapshot_brands s JOIN grp g ON g.id = s.snapshot_id
+        GROUP BY s.snapshot_id, s.site, s.brand_key
+    ), brands AS (
+        SELECT DISTINCT ON (s.site, s.brand_key) s.site, s.brand_key, COALESCE(s.display_brand, s.brand_key) AS display_brand
+        FROM snapshot_brands s JOIN grp g ON g.id = s.snapshot_id
+        ORDER BY s.site, s.brand_key, g.timestamp DESC, g.id DESC
+    ), grid AS (
+        SELECT g.id AS snapshot_id, g.timestamp, b.site, b.brand_key, b.display_brand, COALESCE(ct.count, 0) AS count
+        FROM grp g CROSS JOIN brands b
+        LEFT JOIN counts ct ON ct.snapshot_id = g.id AND ct.site = b.site AND ct.brand_key = b.brand_key
+    )
+    SELECT snapshot_id, timestamp, site, brand_key, display_brand, count, count - LAG(count) OVER w AS delta
+    FROM grid
+    WINDOW w AS (PARTITION BY site, brand_key ORDER BY timestamp, snapshot_id)
+    ORDER BY site, brand_key, timestamp, snapshot_id
+"""
+BRAND_TREND_COLUMNS = ['snapshot_id', 'timestamp', 'site', 'brand_key', 'display_brand', 'count', 'delta']
+
+
+def get_database_url():
+    """Connection string for batch jobs (the app prefers Streamlit secrets)."""
+    return os.environ.get("DATABASE_URL")
+
+
+def connect(db_url: str):
+    """Open a new connection; raises psycopg2.OperationalError on failure."""
+    return psycopg2.connect(db_url, sslmode=os.environ.get("DATABASE_SSLMODE", "require"))
+
+
+DEFAULT_POOL_MIN = 1
+DEFAULT_POOL_MAX = 8
+POOL_WAIT_TIMEOUT = 30  # seconds to wait for a free pooled connection
+HEALTH_CHECK_INTERVAL = 30  # pooled connections idle longer than this are pinged before reuse
+
+
+class PooledConnection:
+    """A pooled psycopg2 connection; close() hands it back to the pool instead of closing it."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._conn, name)
+
+    @property
+    def closed(self):
+        return 1 if self._conn is None else self._conn.closed
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections to one database. getconn() blocks (up to
+    `wait_timeout`) when all `maxconn` connections are in use and pings
+    connections that sat idle longer than `health_check_interval`, replacing
+    dead ones transparently.
+    """
+
+    def __init__(self, db_url: str, minconn: int = DEFAULT_POOL_MIN, maxconn: int = DEFAULT_POOL_MAX,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL, wait_timeout: float = POOL_WAIT_TIMEOUT):
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self.wait_timeout = wait_timeout
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, db_url, sslmode=os.environ.get("DATABASE_SSLMODE", "require"))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._returned_at = {}  # id(conn) -> time.monotonic() when last handed back
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        returned_at = self._returned_at.get(id(conn))
+        if returned_at is None or time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self) -> PooledConnection:
+        """Check out a healthy connection; raises psycopg2.OperationalError / pool.PoolError."""
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise psycopg2.pool.PoolError(f"No pooled connection became free within {self.wait_timeout}s")
+        try:
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return PooledConnection(self, conn)
+                self._returned_at.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("Could not obtain a healthy database connection from the pool")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn) -> None:
+        """Return a raw connection, rolling back any open transaction (broken ones are discarded)."""
+        close = bool(conn.closed)
+        if not close and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try: conn.rollback()
+            except psycopg2.Error: close = True
+        try:
+            if close: self._returned_at.pop(id(conn), None)
+            else: self._returned_at[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def closeall(self) -> None:
+        self._pool.closeall()
+        self._returned_at.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_url: str, **pool_kwargs) -> ConnectionPool:
+    """Process-wide pool per database URL, for batch jobs and other non-Streamlit callers."""
+    with _pools_lock:
+        if db_url not in _pools:
+            _pools[db_url] = ConnectionPool(db_url, **pool_kwargs)
+        return _pools[db_url]
+
+
+def snapshot_timestamp() -> datetime:
+    """Snapshot clock – always Dubai time (UTC+4, no DST) when pytz is available."""
+    if pytz is not None:
+        return datetime.now(pytz.timezone("Asia/Dubai"))
+    return datetime.now()
+
+
+# Deleting a snapshot nulls base_snapshot_id on the snapshots diffed against it; without this index that is a full scan.
+BASE_SNAPSHOT_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS comparisons_base_snapshot ON comparisons (base_snapshot_id) WHERE base_snapshot_id IS NOT NULL;
+"""
+
+# Matching settings a snapshot was built with (comparison.match_settings); NULL for snapshots
+# saved before it was recorded, which incremental runs never reuse keys from.
+MATCH_SETTINGS_SCHEMA_SQL = """
+    ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS match_settings JSONB;
+"""
+
+# Fuzzy pairs of a snapshot (comparison.snapshot_fuzzy_pairs); an incremental run does not reuse
+# their keys, since they are suggestions until confirmed. NULL on snapshots saved before it existed.
+FUZZY_PAIRS_SCHEMA_SQL = """
+    ALTER TABLE comparisons ADD COLUMN IF NOT EXISTS fuzzy_pairs JSONB;
+"""
+
+# group_input stored '' for an empty competitor input while history_groups_key folds '' into NULL,
+# so one summary row could stand for two GROUP_MATCH_SQL groups. Rebuild the column (and its
+# index, dropped with it) with '' stored as NULL, then the summary from it.
+GROUP_INPUT_NULLIF_SQL = f"""
+    ALTER TABLE comparisons DROP COLUMN IF EXISTS group_input;
+    ALTER TABLE comparisons ADD COLUMN group_input TEXT GENERATED ALWAYS AS (NULLIF({GROUP_INPUT_SQL}, '')) STORED;
+    {GROUP_KEY_INDEX_SQL}
+    TRUNCATE history_groups;
+    {HISTORY_GROUPS_BACKFILL_SQL}
+"""
+
+# Ordered (version, description, statements). Append new steps, never edit applied ones;
+# every step is idempotent so databases created by the old init_schema upgrade cleanly.
+SCHEMA_MIGRATIONS = [
+    (1, "comparisons table", [INIT_SCHEMA_SQL]),
+    (2, "snapshot_brands + JSONB backfill", [SNAPSHOT_SCHEMA_SQL, BACKFILL_SNAPSHOT_BRANDS_SQL]),
+    (3, "brand alias tables", [ALIAS_SCHEMA_SQL]),
+    (4, "history sidebar indexes", [HISTORY_INDEX_SQL]),
+    (5, "snapshot_changes + base_snapshot_id", [SNAPSHOT_CHANGES_SCHEMA_SQL]),
+    (6, "base_snapshot_id index", [BASE_SNAPSHOT_INDEX_SQL]),
+    (7, "stored group key + history_groups summary", [HISTORY_GROUPS_SCHEMA_SQL]),
+    (8, "comparisons.match_settings", [MATCH_SETTINGS_SCHEMA_SQL]),
+    (9, "empty group_input stored as NULL", [GROUP_INPUT_NULLIF_SQL]),
+    (10, "comparisons.fuzzy_pairs", [FUZZY_PAIRS_SCHEMA_SQL]),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+SCHEMA_MIGRATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+MIGRATION_LOCK_KEY = 7201840317  # pg_advisory_xact_lock key: one migrating process at a time
+
+
+def schema_version(conn) -> int:
+    """Highest applied migration (0 for a database that predates schema_migrations). Read-only."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            version = 0
+        else:
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+            version = cur.fetchone()[0]
+    conn.rollback()  # end the read-only transaction so the pooled connection goes back idle
+    return version
+
+
+def migrate(conn) -> list[int]:
+    """
+    Apply pending SCHEMA_MIGRATIONS in one transaction and return their versions
+    (empty when the schema is current, which costs a single catalog lookup).
+    Concurrent callers serialize on an advisory lock. Commits on success.
+    """
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return []
+    applied = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+            cur.execute(SCHEMA_MIGRATIONS_TABLE_SQL)
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+            current = cur.fetchone()[0]  # re-read under the lock: another process may have migrated meanwhile
+            for version, description, statements in SCHEMA_MIGRATIONS:
+                if version <= current: continue
+                for sql in statements:
+                    cur.execute(sql)
+                    if sql is BACKFILL_SNAPSHOT_BRANDS_SQL and cur.rowcount > 0: print(f"Migrated {cur.rowcount} snapshot brand rows from JSONB snapshots.")
+                cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description))
+                applied.append(version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if applied: print(f"Applied schema migrations {applied} (now at version {SCHEMA_VERSION}).")
+    return applied
+
+
+def insert_comparison(conn, ounass_url, competitor_name, competitor_input, brand_rows, timestamp=None,
+                      base_snapshot_id=None, changes=None, match_settings: dict = None, fuzzy_pairs: list = None) -> int:
+    """
+    Insert one comparison snapshot and its snapshot_brands rows
+    (comparison.to_snapshot_rows tuples) and return its id. With `base_snapshot_id`,
+    `changes` (comparison.snapshot_changes tuples) are stored as its delta against
+    that snapshot. `match_settings` (comparison.match_settings) records how brands
+    were paired and `fuzzy_pairs` (comparison.snapshot_fuzzy_pairs) which pairs the
+    fuzzy pass made. Commits on success.
+    """
+    timestamp = timestamp or snapshot_timestamp()
+    ls_url_to_save = competitor_input if competitor_name == "Level Shoes" else None
+    with stage('db_save', rows=len(brand_rows), changes=len(changes or [])), conn.cursor() as cur:
+        sql = """INSERT INTO comparisons (timestamp, ounass_url, levelshoes_url, comparison_data, comparison_name, competitor_name, competitor_input, base_snapshot_id, match_settings, fuzzy_pairs) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id"""
+        cur.execute(sql, (timestamp, ounass_url, ls_url_to_save, None, None, competitor_name, competitor_input, base_snapshot_id,
+                          Json(match_settings) if match_settings is not None else None, Json(fuzzy_pairs) if fuzzy_pairs is not None else None))
+        new_id = cur.fetchone()[0]
+        execute_values(cur, """INSERT INTO snapshot_brands (snapshot_id, position, site, brand_key, display_brand, raw_name, count, snapshot_ts) VALUES %s""",
+                       [(new_id, *row, timestamp) for row in brand_rows], page_size=1000)
+        if base_snapshot_id is not None and changes:
+            execute_values(cur, """INSERT INTO snapshot_changes (snapshot_id, site, brand_key, display_brand, old_count, new_count) VALUES %s""",
+                           [(new_id, *change) for change in changes], page_size=1000)
+        conn.commit()
+    return new_id
+
+
+def snapshot_group_key(ounass_url, competitor_name, competitor_input, levelshoes_url=None) -> tuple:
+    """(ounass_url, competitor, competitor input) history group of a snapshot; legacy rows without competitor columns are Level Shoes."""
+    comp_name = competitor_name; comp_input = competitor_input
+    if not comp_name and levelshoes_url: comp_name = 'Level Shoes'
+    if not comp_input and comp_name == 'Level Shoes': comp_input = levelshoes_url
+    if not comp_name: comp_name = "Unknown"; comp_input = "N/A"
+    return (ounass_url, comp_name, comp_input)
+
+
+def load_history_groups(conn, search=None, competitor=None, after=None, limit=HISTORY_GROUP_PAGE_SIZE) -> tuple[list[tuple], tuple | None]:
+    """
+    One page of history groups as HISTORY_GROUP_COLUMNS rows from the history_groups summary.
+    `search` is a case-insensitive substring of the Ounass URL / competitor / competitor input,
+    `after` the (latest_ts, latest_id) keyset cursor returned for the previous page; groups
+    come newest first. Returns (rows, next cursor or None).
+    """
+    search = (search or '').strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    params = {'search': f"%{search}%" if search else None, 'competitor': competitor or None,
+              'after_ts': None, 'after_id': None, 'limit': limit + 1}
+    if after is not None: params.update(after_ts=after[0], after_id=after[1])
+    with stage('db_load', query='history_groups') as rec, conn.cursor() as cur:
+        cur.execute(HISTORY_GROUPS_SQL, params)
+        rows = cur.fetchall(); rec['rows'] = len(rows)
+    if len(rows) <= limit: return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1][4], rows[-1][5])
+
+
+def load_group_snapshots(conn, ounass_url, competitor_name, competitor_input, before=None, limit=HISTORY_SNAPSHOT_PAGE_SIZE) -> tuple[list[tuple], tuple | None]:
+    """One newest-first page of (id, timestamp) snapshots in a group; returns (rows, next cursor or None)."""
+    params = {'ounass_url': ounass_url, 'competitor_name': competitor_name, 'competitor_input': competitor_input,
+              'before_ts': None, 'before_id': None, 'limit': limit + 1}
+    if before is not None: params.update(before_ts=before[1], before_id=before[0])
+    with stage('db_load', query='group_snapshots') as rec, conn.cursor() as cur:
+        cur.execute(GROUP_SNAPSHOTS_SQL, params)
+        rows = cur.fetchall(); rec['rows'] = len(rows)
+    if len(rows) <= limit: return rows, None
+    rows = rows[:limit]
+    return rows, tuple(rows[-1])
+
+
+def load_latest_snapshot(conn, ounass_url, competitor_name, competitor_input) -> tuple[int | None, list[tuple], dict | None, list | None]:
+    """(id, snapshot_brands rows, match_settings, fuzzy_pairs) of the newest snapshot in a group, or (None, [], None, None) when it has none."""
+    with stage('db_load', query='latest_snapshot'), conn.cursor() as cur:
+        cur.execute(f"""SELECT c.id, c.match_settings, c.fuzzy_pairs FROM comparisons c WHERE {GROUP_MATCH_SQL} ORDER BY c.timestamp DESC, c.id DESC LIMIT 1""",
+                    {'ounass_url': ounass_url, 'competitor_name': competitor_name, 'competitor_input': competitor_input})
+        row = cur.fetchone()
+    if row is None: return None, [], None, None
+    return row[0], load_snapshot_brands(conn, row[0]), row[1], row[2]
+
+
+def load_brand_trend(conn, ounass_url, competitor_name, competitor_input) -> list[tuple]:
+    """BRAND_TREND_COLUMNS rows for every snapshot in a group, computed in one query."""
+    with stage('db_load', query='brand_trend') as rec, conn.cursor() as cur:
+        cur.execute(BRAND_TREND_SQL, {'ounass_url': ounass_url, 'competitor_name': competitor_name, 'competitor_input': competitor_input})
+        rows = cur.fetchall(); rec['rows'] = len(rows)
+        return rows
+
+
+def load_snapshot_brands(conn, snapshot_id) -> list[tuple]:
+    """snapshot_brands rows of one snapshot as comparison.SNAPSHOT_ROW_FIELDS tuples, in saved order."""
+    with stage('db_load', query='snapshot_brands') as rec, conn.cursor() as cur:
+        cur.execute("""SELECT position, site, brand_key, display_brand, raw_name, count FROM snapshot_brands
+                       WHERE snapshot_id = %s ORDER BY position, site""", (snapshot_id,))
+        rows = cur.fetchall(); rec['rows'] = len(rows)
+        return rows
+
+
+def main(argv=None) -> int:
+    """`python db_utils.py migrate` (run at deploy time) / `python db_utils.py status` against DATABASE_URL."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Comparison history store schema migrations.")
+    parser.add_argument('command', choices=['migrate', 'status'])
+    args = parser.parse_args(argv)
+    db_url = get_database_url()
+    if not db_url:
+        print("DATABASE_URL is not set.")
+        return 1
+    conn = connect(db_url)
+    try:
+        if args.command == 'migrate':
+            applied = migrate(conn)
+            if not applied: print(f"Schema is current (version {SCHEMA_VERSION}).")
+        else:
+            print(f"Schema version {schema_version(conn)} of {SCHEMA_VERSION}.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+"""
+Registry of the sites the comparison pipeline can extract brand counts from.
+
+Each site declares how its input is provided (a PLP URL, or an uploaded /
+saved HTML file), an optional URL normalizer and the parse function that turns
+the page into [{'Brand', 'Count'}]. Both are named as "module:function" and
+only imported on first use, so importing the registry (or starting the app)
+never loads a parser that is not used. The app, the batch runner and the parse
+worker pool all run the same generic pipeline over whatever is registered here.
+"""
+import importlib
+
+INPUT_URL = 'url'
+INPUT_UPLOAD = 'upload'
+OUNASS_SITE = 'Ounass'
+
+
+def _load(target: str):
+    module_name, attr = target.split(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class SiteExtractor:
+    """One registered site; `parser` / `normalizer` resolve their "module:function" targets lazily."""
+
+    def __init__(self, name: str, input_type: str, parse: str, normalize_url: str = None,
+                 placeholder: str = '', upload_types: tuple = ('html', 'htm'), help: str = None, version: str = '1'):
+        if input_type not in (INPUT_URL, INPUT_UPLOAD):
+            raise ValueError(f"input_type must be '{INPUT_URL}' or '{INPUT_UPLOAD}', not '{input_type}'")
+        self.name = name
+        self.input_type = input_type
+        self.parse_target = parse
+        self.normalize_target = normalize_url
+        self.placeholder = placeholder
+        self.upload_types = upload_types
+        self.help = help
+        self.version = version
+        self._parser = None
+        self._normalizer = None
+
+    def __repr__(self):
+        return f"SiteExtractor({self.name!r}, {self.input_type!r}, {self.parse_target!r})"
+
+    @property
+    def is_upload(self) -> bool:
+        return self.input_type == INPUT_UPLOAD
+
+    @property
+    def input_label(self) -> str:
+        """'URL' or 'HTML File', for messages such as "Could not process Sephora HTML File"."""
+        return "HTML File" if self.is_upload else "URL"
+
+    @property
+    def cache_tag(self) -> str:
+        """Identifies the parser's output format in parse-result cache keys; bump `version` when it changes."""
+        return f"{self.parse_target}@{self.version}"
+
+    def parser(self):
+        if self._parser is None:
+            self._parser = _load(self.parse_target)
+        return self._parser
+
+    def parse(self, html_content) -> list:
+        return self.parser()(html_content)
+
+    def normalize_url(self, url: str) -> str:
+        if not self.normalize_target or not url:
+            return url
+        if self._normalizer is None:
+            self._normalizer = _load(self.normalize_target)
+        return self._normalizer(url)
+
+
+_SITES = {}
+
+
+def register_site(name: str, input_type: str, parse: str, **options) -> SiteExtractor:
+    """
+    Register (or replace) a site. Register at import time of this module or of a
+    module the parse workers import as well, so spawned workers see it too.
+    """
+    _SITES[name] = SiteExtractor(name, input_type, parse, **options)
+    return _SITES[name]
+
+
+def get_site(name: str) -> SiteExtractor:
+    """Raises ValueError for an unregistered site."""
+    if name not in _SITES:
+        raise ValueError(f"Unknown site '{name}'. Expected one of: {', '.join(_SITES)}")
+    return _SITES[name]
+
+
+def site_names() -> list[str]:
+    return list(_SITES)
+
+
+def competitor_names() -> list[str]:
+    """Registered sites Ounass can be compared against, in registration order."""
+    return [name for name in _SITES if name != OUNASS_SITE]
+
+
+register_site(OUNASS_SITE, INPUT_URL, 'ounass_extractor:_process_ounass_html_internal',
+              normalize_url='utils:ensure_ounass_full_list_parameter', placeholder="https://www.ounass.ae/...")
+register_site("Level Shoes", INPUT_URL, 'levelshoes_extractor:_process_levelshoes_html_internal',
+              placeholder="https://www.levelshoes.com/...")
+register_site("Sephora", INPUT_UPLOAD, 'sephora_extractor:_process_sephora_html_internal',
+              help="Save the Sephora PLP page (Ctrl+S or Cmd+S -> 'Webpage, HTML Only') and upload it here.")
@@ -0,0 +1,175 @@
+"""
+HTTP fetch layer shared by the Streamlit app and batch jobs.
+
+All downloads go through `AsyncFetcher`: one pooled aiohttp session
+(HTTP/1.1 keep-alive), a global connection cap plus per-host concurrency
+caps, and retries with jittered exponential backoff on 429 / 5xx and
+network errors. Pages are revalidated against the on-disk `HtmlCache`
+(ETag / Last-Modified), so unchanged pages cost a 304. `fetch_all` /
+`fetch_html` are synchronous wrappers for callers that are not themselves
+async (Streamlit script, batch runner).
+"""
+import asyncio
+import random
+from urllib.parse import urlparse
+
+import aiohttp
+
+from html_cache import get_default_cache
+from pipeline_metrics import stage
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Connection': 'keep-alive',
+    'DNT': '1',
+    'Upgrade-Insecure-Requests': '1',
+}
+DEFAULT_TIMEOUT = 30  # seconds, per attempt
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_PER_HOST_LIMIT = 4
+DEFAULT_MAX_RETRIES = 3
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_DEFAULT_CACHE = object()  # sentinel: use html_cache.get_default_cache()
+
+
+class FetchError(Exception):
+    """A URL could not be fetched (after retries, if the failure was retryable)."""
+
+    def __init__(self, url: str, message: str, status: int = None):
+        super().__init__(f"{message} ({url})")
+        self.url = url
+        self.status = status
+
+
+class AsyncFetcher:
+    """
+    Pooled async downloader. Use as an async context manager:
+
+        async with AsyncFetcher(per_host_limit=2) as fetcher:
+            pages = await fetcher.fetch_many(urls)
+
+    `host_limits` overrides the per-host cap for specific hostnames.
+    `cache` is an HtmlCache (default: the process-wide one) or None to disable.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS, per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 host_limits: dict = None, timeout: float = DEFAULT_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = 0.5, backoff_max: float = 20.0, headers: dict = None, cache=_DEFAULT_CACHE):
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.host_limits = {host.lower(): limit for host, limit in (host_limits or {}).items()}
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.headers = headers or DEFAULT_HEADERS
+        self.cache = get_default_cache() if cache is _DEFAULT_CACHE else cache
+        self._session = None
+        self._host_semaphores = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(connector=connector, headers=self.headers,
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    def _semaphore_for(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.host_limits.get(host, self.per_host_limit))
+        return self._host_semaphores[host]
+
+    def _backoff_delay(self, attempt: int, retry_after: str = None) -> float:
+        """Full-jitter exponential backoff; a numeric Retry-After header wins (capped at backoff_max)."""
+        if retry_after and retry_after.strip().isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def fetch(self, url: str) -> str:
+        """Return the decoded body of `url`; raises FetchError."""
+        if not url:
+            raise ValueError("URL cannot be empty.")
+        with stage('fetch', url=url) as rec:
+            try:
+                body = await self._fetch(url, rec)
+            except FetchError as e:
+                rec['status'] = e.status
+                raise
+            rec['bytes'] = len(body)
+            return body
+
+    async def _fetch(self, url: str, rec: dict) -> str:
+        host = (urlparse(url).hostname or '').lower()
+        cached = None
+        if self.cache is not None:
+            try: cached = self.cache.lookup(url)
+            except Exception as e: print(f"Warning: HTML cache lookup failed for {url}: {e}")
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            rec['attempts'] = attempt + 1
+            retry_after = None
+            try:
+                async with self._semaphore_for(host):
+                    request_headers = cached.conditional_headers() if cached else None
+                    async with self._session.get(url, headers=request_headers) as response:
+                        if response.status == 304 and cached:
+                            body = await asyncio.to_thread(self.cache.read_body, cached)
+                            if body is not None:
+                                rec['status'] = 304
+                                return body
+                            cached = None  # blob evicted/corrupt – fall through to an unconditional retry
+                            last_error = FetchError(url, "Cached body missing after 304", status=304)
+                        elif response.status < 400:
+                            body = await response.text(errors='replace')
+                            if self.cache is not None:
+                                try: await asyncio.to_thread(self.cache.store, url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+                                except Exception as e: print(f"Warning: HTML cache store failed for {url}: {e}")
+                            rec['status'] = response.status
+                            return body
+                        elif response.status not in RETRY_STATUSES:
+                            raise FetchError(url, f"HTTP error {response.status} {response.reason}", status=response.status)
+                        else:
+                            retry_after = response.headers.get('Retry-After')
+                            last_error = FetchError(url, f"HTTP error {response.status} {response.reason}", status=response.status)
+            except asyncio.TimeoutError:
+                last_error = FetchError(url, f"Timeout after {self.timeout}s")
+            except aiohttp.ClientError as e:
+                last_error = FetchError(url, f"Connection error: {e}")
+            if attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, retry_after)
+                print(f"Fetch retry {attempt + 1}/{self.max_retries} for {url} in {delay:.1f}s: {last_error}")
+                await asyncio.sleep(delay)
+        raise last_error
+
+    async def fetch_many(self, urls) -> list:
+        """Fetch all URLs concurrently; each result is the body or the exception raised for that URL."""
+        return await asyncio.gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+
+
+def fetch_all(urls, **fetcher_kwargs) -> list:
+    """
+    Synchronous entry point: download `urls` in parallel and return a list
+    aligned with `urls` holding either the body (str) or the Exception.
+    Duplicate URLs are only downloaded once.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+
+    async def _run():
+        async with AsyncFetcher(**fetcher_kwargs) as fetcher:
+            return await fetcher.fetch_many(unique_urls)
+
+    results = dict(zip(unique_urls, asyncio.run(_run()))) if unique_urls else {}
+    return [results[url] for url in urls]
+
+
+def fetch_html(url: str, **fetcher_kwargs) -> str:
+    """Download a single URL; raises ValueError / FetchError."""
+    result = fetch_all([url], **fetcher_kwargs)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
@@ -0,0 +1,202 @@
+"""
+Persistent on-disk HTML cache used by the fetch layer.
+
+Layout under the cache directory:
+  index.sqlite               – URL entries (normalized URL -> content digest + validators),
+                               blob sizes, hit/miss counters
+  objects/ab/abcdef….gz      – gzip-compressed page bodies, stored once per SHA-256 digest
+
+Entries are revalidated with If-None-Match / If-Modified-Since, so a repeat
+fetch of an unchanged page costs a 304. The total compressed size is kept
+under `max_bytes` by evicting least-recently-used URL entries.
+"""
+import gzip
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'combined_extractor', 'html')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+COUNTERS = ('hits', 'misses', 'stored', 'evicted')  # hit = 304 served from disk, miss = full download
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        url_key TEXT PRIMARY KEY, digest TEXT NOT NULL, etag TEXT, last_modified TEXT,
+        fetched_at REAL NOT NULL, last_access REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+    CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER NOT NULL);
+    CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+def normalize_url(url: str) -> str:
+    """Cache key: lowercase scheme/host, default ports and fragment dropped, query parameters sorted."""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    port = parsed.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, parsed.path or '/', parsed.params, query, ''))
+
+
+def content_digest(body: str) -> str:
+    return hashlib.sha256(body.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+class CacheEntry:
+    """Validators stored for a cached URL."""
+
+    def __init__(self, url_key, digest, etag, last_modified):
+        self.url_key = url_key
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag: headers['If-None-Match'] = self.etag
+        if self.last_modified: headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HtmlCache:
+    """Content-addressed, size-bounded page cache (safe to share between processes)."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived SQLite connection: commit on success, always close."""
+        db = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, 'objects', digest[:2], f"{digest}.gz")
+
+    def _bump(self, db, name: str, amount: int = 1):
+        db.execute("INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+    def lookup(self, url: str):
+        """Return the CacheEntry for `url`, or None when the URL was never cached."""
+        url_key = normalize_url(url)
+        with self._connect() as db:
+            row = db.execute("SELECT digest, etag, last_modified FROM entries WHERE url_key = ?", (url_key,)).fetchone()
+        return CacheEntry(url_key, *row) if row else None
+
+    def read_body(self, entry: CacheEntry):
+        """Decompressed body for a revalidated entry (counts a hit), or None if the blob is gone."""
+        try:
+            with gzip.open(self._blob_path(entry.digest), 'rb') as fh:
+                body = fh.read().decode('utf-8', errors='surrogatepass')
+        except (OSError, EOFError):
+            return None
+        with self._connect() as db:
+            db.execute("UPDATE entries SET last_access = ? WHERE url_key = ?", (time.time(), entry.url_key))
+            self._bump(db, 'hits')
+        return body
+
+    def store(self, url: str, body: str, etag: str = None, last_modified: str = None) -> str:
+        """Cache a freshly downloaded body (counts a miss) and return its digest."""
+        digest = content_digest(body)
+        path = self._blob_path(digest)
+        url_key = normalize_url(url)
+        now = time.time()
+        with self._connect() as db:
+            self._bump(db, 'misses')
+            if not (etag or last_modified):
+                return digest  # nothing to revalidate with – a cached copy would never be reused
+            previous = db.execute("SELECT digest FROM entries WHERE url_key = ?", (url_key,)).fetchone()
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with gzip.open(tmp_path, 'wb', compresslevel=6) as fh:
+                    fh.write(body.encode('utf-8', errors='surrogatepass'))
+                os.replace(tmp_path, path)
+                self._bump(db, 'stored')
+            db.execute("INSERT OR REPLACE INTO blobs (digest, size) VALUES (?, ?)", (digest, os.path.getsize(path)))
+            db.execute("""INSERT INTO entries (url_key, digest, etag, last_modified, fetched_at, last_access) VALUES (?, ?, ?, ?, ?, ?)
+                          ON CONFLICT(url_key) DO UPDATE SET digest = excluded.digest, etag = excluded.etag,
+                          last_modified = excluded.last_modified, fetched_at = excluded.fetched_at, last_access = excluded.last_access""",
+                       (url_key, digest, etag, last_modified, now, now))
+            if previous and previous[0] != digest:
+                self._drop_blob_if_unreferenced(db, previous[0])
+        self.evict()
+        return digest
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until stored blobs fit in max_bytes; returns entries removed."""
+        removed = 0
+        with self._connect() as db:
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            for url_key, digest in db.execute("SELECT url_key, digest FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM entries WHERE url_key = ?", (url_key,))
+                removed += 1
+                total -= self._drop_blob_if_unreferenced(db, digest)
+            self._bump(db, 'evicted', removed)
+        return removed
+
+    def _drop_blob_if_unreferenced(self, db, digest: str) -> int:
+        """Delete a blob no URL entry points at any more; returns the bytes freed."""
+        if db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return 0
+        size = db.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        try: os.remove(self._blob_path(digest))
+        except OSError: pass
+        return size[0] if size else 0
+
+    def stats(self) -> dict:
+        """Counters plus current entry count and compressed size in bytes."""
+        with self._connect() as db:
+            values = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            size = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        result = {name: values.get(name, 0) for name in COUNTERS}
+        result.update(entries=entries, bytes=size)
+        return result
+
+
+_default_cache = None
+_unusable_cache_dir = None  # directory the default cache could not be created in (not retried)
+
+
+def get_default_cache():
+    """
+    Process-wide cache configured from HTML_CACHE_DIR / HTML_CACHE_MAX_MB.
+    Set HTML_CACHE_DIR to an empty string to disable caching (returns None).
+    A cache directory that cannot be created or opened (e.g. a read-only home on
+    a hosted server) also disables caching, with a warning, instead of raising.
+    """
+    global _default_cache, _unusable_cache_dir
+    cache_dir = os.environ.get('HTML_CACHE_DIR', DEFAULT_CACHE_DIR)
+    if not cache_dir or cache_dir == _unusable_cache_dir:
+        return None
+    if _default_cache is None or _default_cache.cache_dir != cache_dir:
+        max_bytes = int(float(os.environ.get('HTML_CACHE_MAX_MB', DEFAULT_MAX_BYTES / (1024 * 1024))) * 1024 * 1024)
+        try:
+            _default_cache = HtmlCache(cache_dir, max_bytes=max_bytes)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: HTML cache disabled, could not use {cache_dir}: {e}")
+            _unusable_cache_dir = cache_dir
+            return None
+    return _default_cache
@@ -1,12 +1,93 @@
-import streamlit as st
 from bs4 import BeautifulSoup
 import json
+import re
+from parse_pool import parse_page
+try:
+    import ijson
+    # Only worth it with the C backend; the pure-Python backend is far slower than json.loads.
+    _HAS_FAST_IJSON = ijson.backend in ('yajl2_c', 'yajl2_cffi')
+except ModuleNotFoundError:
+    _HAS_FAST_IJSON = False
+
+PARSER_MODES = ('auto', 'stream', 'json', 'soup')
+ROOT_QUERY_PREFIX = 'props.pageProps.__APOLLO_STATE__.ROOT_QUERY'
+_NEXT_DATA_OPEN = re.compile(r'<script\b[^>]*?\sid\s*=\s*["\']__NEXT_DATA__["\'][^>]*>', re.IGNORECASE)
+_NEXT_DATA_OPEN_BYTES = re.compile(_NEXT_DATA_OPEN.pattern.encode(), re.IGNORECASE)
+
+
+def _find_next_data_payload(html_content):
+    """Slice the __NEXT_DATA__ script body out of the page by offset (str or bytes in, same type out); None if absent."""
+    is_bytes = isinstance(html_content, (bytes, bytearray))
+    match = (_NEXT_DATA_OPEN_BYTES if is_bytes else _NEXT_DATA_OPEN).search(html_content)
+    if not match:
+        return None
+    end = html_content.find(b'</script>' if is_bytes else '</script>', match.end())
+    if end == -1:
+        return None
+    payload = html_content[match.end():end]
+    return payload if payload.strip() else None
+
+
+def _product_list_key(root_query):
+    """First ROOT_QUERY key starting with _productList; fallback (prefix changed, same structure): first containing '_productList:({'."""
+    keys = list(root_query)
+    return (next((key for key in keys if key.startswith('_productList')), None)
+            or next((key for key in keys if '_productList:({' in key), None))
+
+
+def _product_list_facets_streaming(payload):
+    """
+    Walk the JSON incrementally down to ROOT_QUERY -> _productList -> facets without
+    building the rest of the Apollo state. Returns the facets list, or None if not found.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    fallback_facets = None
+    for key, value in ijson.kvitems(payload, ROOT_QUERY_PREFIX, use_float=True):
+        if key.startswith('_productList'):
+            return value.get('facets', [])
+        if fallback_facets is None and '_productList:({' in key:
+            fallback_facets = value.get('facets', [])
+    return fallback_facets
 
 # Note: Keep warnings/errors inside for now, but ideally, return specific values
 # and handle UI messages in the main app based on the return.
 # Cache decorator moved to the wrapper function.
-def _process_levelshoes_html_internal(html_content):
-    """Internal logic to parse Level Shoes HTML using __NEXT_DATA__."""
+def _process_levelshoes_html_internal(html_content, mode='auto'):
+    """
+    Internal logic to parse Level Shoes HTML using __NEXT_DATA__.
+    mode: 'stream' (slice the script payload, incremental JSON walk – needs ijson),
+    'json' (slice the payload, json.loads), 'soup' (full BeautifulSoup DOM) or
+    'auto' (stream if available, then json, falling back to soup if the payload
+    cannot be located or decoded).
+    """
+    if mode not in PARSER_MODES:
+        raise ValueError(f"Unknown Level Shoes parser mode '{mode}'. Expected one of: {', '.join(PARSER_MODES)}")
+    if mode == 'soup':
+        return _process_levelshoes_html_soup(html_content)
+
+    payload = _find_next_data_payload(html_content)
+    if payload is not None:
+        if mode == 'stream' or (mode == 'auto' and _HAS_FAST_IJSON):
+            try:
+                facets = _product_list_facets_streaming(payload)
+                if facets is not None:
+                    return _brands_from_facets(facets)
+            except Exception as e:
+                print(f"Warning (LevelShoes Extractor): Streaming JSON walk failed ({e}); decoding full __NEXT_DATA__.")
+        try:
+            if isinstance(payload, (bytes, bytearray)):
+                payload = payload.decode('utf-8', errors='ignore')
+            return _brands_from_next_data(json.loads(payload))
+        except json.JSONDecodeError:
+            print("Warning (LevelShoes Extractor): Sliced __NEXT_DATA__ payload is not valid JSON; falling back to full parse.")
+    if isinstance(html_content, (bytes, bytearray)):
+        html_content = html_content.decode('utf-8', errors='ignore')
+    return _process_levelshoes_html_soup(html_content)
+
+
+def _process_levelshoes_html_soup(html_content):
+    """Full-DOM path: locate __NEXT_DATA__ with BeautifulSoup."""
     data_extracted = []
     try:
         soup = BeautifulSoup(html_content, 'html.parser')
@@ -21,7 +102,20 @@ def _process_levelshoes_html_internal(html_content):
             print("Error (LevelShoes Extractor): __NEXT_DATA__ script tag content is empty.")
             return data_extracted # Return empty list, can't proceed
 
-        data = json.loads(json_data_str)
+        return _brands_from_next_data(json.loads(json_data_str))
+
+    except json.JSONDecodeError:
+        print("Error (LevelShoes Extractor): Failed to decode JSON data from __NEXT_DATA__. Page content might be corrupted or incomplete.")
+        return [] # Return empty list on JSON error
+    except Exception as e:
+        print(f"Error (LevelShoes Extractor): Unexpected error during processing - {e}")
+        return []
+
+
+def _brands_from_next_data(data):
+    """Navigate decoded __NEXT_DATA__ to the product list facets and extract brands."""
+    data_extracted = []
+    try:
         # Navigate through the nested structure safely using .get()
         apollo_state = data.get('props', {}).get('pageProps', {}).get('__APOLLO_STATE__', {})
         if not apollo_state:
@@ -34,10 +128,7 @@ def _process_levelshoes_html_internal(html_content):
             return data_extracted
 
         # Find the product list key dynamically (it often contains filter parameters)
-        product_list_key = next((key for key in root_query if key.startswith('_productList')), None)
-        # Fallback if the prefix changes but the structure is similar
-        if not product_list_key:
-             product_list_key = next((key for key in root_query if '_productList:({' in key), None)
+        product_list_key = _product_list_key(root_query)
 
         if not product_list_key:
             print("Error (LevelShoes Extractor): Could not find product list data key (starting with _productList or containing _productList:({ ) in ROOT_QUERY.")
@@ -48,56 +139,8 @@ def _process_levelshoes_html_internal(html_content):
         product_list_data = root_query.get(product_list_key, {})
         facets = product_list_data.get('facets', []) # Get facets list
 
-        if not facets:
-            # This might not be an error if a page simply has no filters, but it's worth noting.
-            print("Warning (LevelShoes Extractor): No 'facets' (filters) found in product list data.")
-            return data_extracted # Return empty, as we can't find the designer facet
-
-        # Find the 'brand' or 'Designer' facet
-        designer_facet = None
-        for facet in facets:
-            # Check both 'key' and 'label' for flexibility, case-insensitive
-            facet_key = facet.get('key', '').lower()
-            facet_label = facet.get('label', '').lower()
-            if facet_key == 'brand' or facet_label == 'designer':
-                 designer_facet = facet
-                 break # Found it, no need to check further
-
-        if not designer_facet:
-            available_facets = [(f.get('key'), f.get('label')) for f in facets]
-            print(f"Error (LevelShoes Extractor): 'brand' or 'Designer' facet not found. Available facets (key, label): {available_facets}")
-            return data_extracted # Return empty, can't find designers
-
-        designer_options = designer_facet.get('options', [])
-        if not designer_options:
-            print("Warning (LevelShoes Extractor): 'Designer/brand' facet found, but it contains no options (brands).")
-            return data_extracted # Return empty, no brands listed
-
-        # Extract brand names and counts from the options
-        for option in designer_options:
-             name = option.get('name')
-             count = option.get('count')
-             # Ensure both name and count are present and count is convertible to int
-             if name is not None and count is not None:
-                 try:
-                     brand_count = int(count)
-                     # Clean up name and filter out common non-brand entries
-                     upper_name = name.upper()
-                     if "VIEW ALL" not in upper_name and "SHOW M" not in upper_name and "SHOW L" not in upper_name:
-                         data_extracted.append({'Brand': name.strip(), 'Count': brand_count})
-                 except (ValueError, TypeError):
-                     print(f"Warning (LevelShoes Extractor): Could not convert count '{count}' for brand '{name}' to an integer. Skipping.")
-                     continue # Skip this brand if count is invalid
-
-        # Optional: Log if extraction completed but found nothing after filtering
-        # if not data_extracted and designer_options:
-            # print("Warning (LevelShoes Extractor): Designer options processed, but no valid brand data remained after filtering.")
-
-        return data_extracted
+        return _brands_from_facets(facets)
 
-    except json.JSONDecodeError:
-        print("Error (LevelShoes Extractor): Failed to decode JSON data from __NEXT_DATA__. Page content might be corrupted or incomplete.")
-        return [] # Return empty list on JSON error
     except (AttributeError, KeyError, TypeError, IndexError) as e:
         # Catch errors related to navigating the expected JSON structure
         print(f"Error (LevelShoes Extractor): Problem navigating the JSON structure - {e}. The website structure might have changed.")
@@ -111,13 +154,63 @@ def _process_levelshoes_html_internal(html_content):
         # print(traceback.format_exc())
         return []
 
-@st.cache_data
-def get_processed_levelshoes_data(html_content):
-    """Cached function to process Level Shoes HTML content."""
+
+def _brands_from_facets(facets):
+    """Pick the brand/Designer facet and turn its options into [{'Brand', 'Count'}]."""
+    data_extracted = []
+    if not facets:
+        # This might not be an error if a page simply has no filters, but it's worth noting.
+        print("Warning (LevelShoes Extractor): No 'facets' (filters) found in product list data.")
+        return data_extracted # Return empty, as we can't find the designer facet
+
+    # Find the 'brand' or 'Designer' facet
+    designer_facet = None
+    for facet in facets:
+        # Check both 'key' and 'label' for flexibility, case-insensitive
+        facet_key = facet.get('key', '').lower()
+        facet_label = facet.get('label', '').lower()
+        if facet_key == 'brand' or facet_label == 'designer':
+             designer_facet = facet
+             break # Found it, no need to check further
+
+    if not designer_facet:
+        available_facets = [(f.get('key'), f.get('label')) for f in facets]
+        print(f"Error (LevelShoes Extractor): 'brand' or 'Designer' facet not found. Available facets (key, label): {available_facets}")
+        return data_extracted # Return empty, can't find designers
+
+    designer_options = designer_facet.get('options', [])
+    if not designer_options:
+        print("Warning (LevelShoes Extractor): 'Designer/brand' facet found, but it contains no options (brands).")
+        return data_extracted # Return empty, no brands listed
+
+    # Extract brand names and counts from the options
+    for option in designer_options:
+         name = option.get('name')
+         count = option.get('count')
+         # Ensure both name and count are present and count is convertible to int
+         if name is not None and count is not None:
+             try:
+                 brand_count = int(count)
+                 # Clean up name and filter out common non-brand entries
+                 upper_name = name.upper()
+                 if "VIEW ALL" not in upper_name and "SHOW M" not in upper_name and "SHOW L" not in upper_name:
+                     data_extracted.append({'Brand': name.strip(), 'Count': brand_count})
+             except (ValueError, TypeError):
+                 print(f"Warning (LevelShoes Extractor): Could not convert count '{count}' for brand '{name}' to an integer. Skipping.")
+                 continue # Skip this brand if count is invalid
+
+    # Optional: Log if extraction completed but found nothing after filtering
+    # if not data_extracted and designer_options:
+        # print("Warning (LevelShoes Extractor): Designer options processed, but no valid brand data remained after filtering.")
+
+    return data_extracted
+
+def get_processed_levelshoes_data(html_content, digest=None):
+    """Process Level Shoes HTML content through the parse-result cache (`digest`: the page's precomputed sha256)."""
     print("Processing LevelShoes HTML...") # Log processing start
     if not html_content:
         print("Warning (LevelShoes Extractor): get_processed_levelshoes_data received empty HTML.")
         return []
-    processed_data = _process_levelshoes_html_internal(html_content)
+    processed_data = parse_page("Level Shoes", html_content, digest)
     print(f"LevelShoes processing finished. Found {len(processed_data)} brands.") # Log processing end
     return processed_data
@@ -1,13 +1,146 @@
 
-import streamlit as st
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import re
 
+from extractor_registry import OUNASS_SITE
+from parse_pool import parse_page
+
+COUNT_PATTERN = re.compile(r'\((\d+)\)')
+PARSER_MODES = ('auto', 'stream', 'soup')
+
+
+class _StopParsing(Exception):
+    """Raised from the streaming parser once the Designer facet has been read."""
+
+
+class _DesignerFacetParser(HTMLParser):
+    """
+    Event-based scan for the Designer `section.Facet`.
+    Only the current facet section's links are buffered; everything else in
+    the page is skipped as it streams past, and parsing stops at the end of
+    the Designer section.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.data = None              # set once the Designer facet is complete
+        self._section_depth = 0       # >0 while inside a Facet section (nested sections counted)
+        self._is_designer = False
+        self._header_depth = 0
+        self._header_text = []
+        self._items = []              # (name, count_text) for the current facet section
+        self._in_link = False
+        self._link_has_name = False
+        self._span_roles = []         # stack of 'name' / 'count' / None for open spans inside a link
+        self._name_parts = []
+        self._count_parts = []
+
+    @staticmethod
+    def _classes(attrs):
+        for key, value in attrs:
+            if key == 'class' and value:
+                return value.split()
+        return ()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'section':
+            if self._section_depth:
+                self._section_depth += 1
+            elif 'Facet' in self._classes(attrs):
+                self._section_depth = 1; self._is_designer = False; self._items = []
+            return
+        if not self._section_depth:
+            return
+        if tag == 'header':
+            self._header_depth += 1
+        elif tag == 'a' and 'FacetLink' in self._classes(attrs):
+            self._in_link = True; self._link_has_name = False; self._span_roles = []
+            self._name_parts = []; self._count_parts = []
+        elif tag == 'span' and self._in_link:
+            classes = self._classes(attrs)
+            if 'FacetLink-count' in classes and 'name' in self._span_roles:
+                self._span_roles.append('count')
+            elif 'FacetLink-name' in classes and not self._link_has_name and 'name' not in self._span_roles:
+                self._link_has_name = True; self._span_roles.append('name')
+            else:
+                self._span_roles.append(None)
+
+    def handle_endtag(self, tag):
+        if not self._section_depth:
+            return
+        if tag == 'section':
+            self._section_depth -= 1
+            if not self._section_depth and self._is_designer:
+                self.data = self._items
+                raise _StopParsing()
+        elif tag == 'header' and self._header_depth:
+            self._header_depth -= 1
+            if not self._header_depth:
+                if 'Designer' in ''.join(self._header_text).strip(): self._is_designer = True
+                self._header_text = []
+        elif tag == 'span' and self._in_link and self._span_roles:
+            self._span_roles.pop()
+        elif tag == 'a' and self._in_link:
+            self._in_link = False
+            if self._link_has_name:
+                self._items.append((''.join(self._name_parts).strip(), ''.join(self._count_parts).strip() or "(0)"))
+
+    def handle_data(self, data):
+        if not self._section_depth:
+            return
+        if self._header_depth:
+            self._header_text.append(data)
+        if self._in_link and self._span_roles:
+            if 'count' in self._span_roles: self._count_parts.append(data)
+            elif 'name' in self._span_roles: self._name_parts.append(data)
+
+
+def _process_ounass_html_streaming(html_content):
+    """
+    Streaming extraction of the Designer facet (no full DOM).
+    Returns None when the Designer section could not be found, so callers can fall back to the soup parser.
+    """
+    parser = _DesignerFacetParser()
+    try:
+        parser.feed(html_content)
+        parser.close()
+    except _StopParsing:
+        pass
+    if parser.data is None:
+        return None
+    data = []
+    for designer_name, count_text in parser.data:
+        match = COUNT_PATTERN.search(count_text)
+        count = int(match.group(1)) if match else 0
+        if designer_name and "SHOW" not in designer_name.upper():
+            data.append({'Brand': designer_name, 'Count': count})
+    return data
+
 # Note: Keep warnings/errors inside for now, but ideally, return specific values
 # and handle UI messages in the main app based on the return.
 # Cache decorator moved to the wrapper function.
-def _process_ounass_html_internal(html_content):
-    """Internal logic to parse Ounass HTML."""
+def _process_ounass_html_internal(html_content, mode='auto'):
+    """
+    Internal logic to parse Ounass HTML.
+    mode: 'stream' (event-based Designer facet scan), 'soup' (full BeautifulSoup tree)
+    or 'auto' (stream, falling back to soup when the streaming scan finds nothing).
+    """
+    if mode not in PARSER_MODES:
+        raise ValueError(f"Unknown Ounass parser mode '{mode}'. Expected one of: {', '.join(PARSER_MODES)}")
+    if mode != 'soup':
+        try:
+            data = _process_ounass_html_streaming(html_content)
+        except Exception as e:
+            print(f"Warning (Ounass Extractor): Streaming parse failed ({e}); falling back to full parse.")
+            data = None
+        if data or mode == 'stream':
+            return data or []
+    return _process_ounass_html_soup(html_content)
+
+
+def _process_ounass_html_soup(html_content):
+    """Full-DOM parse of Ounass HTML with BeautifulSoup."""
     soup = BeautifulSoup(html_content, 'html.parser'); data = []
     try:
         # Try finding the header first, more specific
@@ -51,15 +184,12 @@ def _process_ounass_html_internal(html_content):
                             count_text = count_span.text.strip() if count_span else "(0)" # Default count if span not found
 
                             # --- Extract Name ---
-                            # To get the name without the count, clone the name_span and remove the count_span from the clone
-                            temp_name_span = BeautifulSoup(str(name_span), 'html.parser').find(class_='FacetLink-name')
-                            temp_count_span = temp_name_span.find(class_='FacetLink-count')
-                            if temp_count_span:
-                                temp_count_span.decompose() # Remove the count part
-                            designer_name = temp_name_span.text.strip() # Get remaining text
+                            # Join the name span's strings, skipping those that belong to the count span
+                            count_strings = {id(s) for s in count_span.strings} if count_span else set()
+                            designer_name = ''.join(s for s in name_span.strings if id(s) not in count_strings).strip()
 
                             # --- Extract Count ---
-                            match = re.search(r'\((\d+)\)', count_text) # Regex to find digits in parentheses
+                            match = COUNT_PATTERN.search(count_text) # Regex to find digits in parentheses
                             count = int(match.group(1)) if match else 0
 
                             # Add to data if name is valid and not a filter option
@@ -84,13 +214,12 @@ def _process_ounass_html_internal(html_content):
 
     return data
 
-@st.cache_data
-def get_processed_ounass_data(html_content):
-    """Cached function to process Ounass HTML content."""
+def get_processed_ounass_data(html_content, digest=None):
+    """Process Ounass HTML content through the parse-result cache (`digest`: the page's precomputed sha256)."""
     print("Processing Ounass HTML...") # Log processing start
     if not html_content:
         print("Warning (Ounass Extractor): get_processed_ounass_data received empty HTML.")
         return []
-    processed_data = _process_ounass_html_internal(html_content)
+    processed_data = parse_page(OUNASS_SITE, html_content, digest)
     print(f"Ounass processing finished. Found {len(processed_data)} brands.") # Log processing end
     return processed_data
@@ -0,0 +1,344 @@
+"""
+Process-pool parse stage shared by the Streamlit app and batch jobs.
+
+BeautifulSoup parses of multi-MB pages hold the GIL, so running them on the
+Streamlit script thread stalls every other session on the server. `ParsePool`
+runs the extractors in worker processes instead: raw HTML goes in as UTF-8
+bytes, the compact [{'Brand', 'Count'}] list comes back. Workers are started
+with `spawn` (the server process is multi-threaded) and recycled after
+`max_tasks_per_worker` parses. Each page's timeout runs from when a worker
+picks it up; a page that overruns it gets the pool replaced by a fresh one for
+new calls, and the old pool is terminated once its other pages are collected.
+Sites come from extractor_registry; their parser modules are imported inside
+the worker on first use. `PARSE_WORKERS=0` parses inline (debugging, single-core hosts).
+Each page is recorded as a 'parse' stage (pipeline_metrics) with the parse time
+and the worker's peak RSS measured inside the worker.
+
+Results are cached in a memory-bounded `ParseResultCache` keyed by (site, parser
+version, page digest). Callers that already know a page's digest (computed once
+when it was fetched or uploaded) pass it as a third job element, so a page is
+never rehashed; only the compact brand lists are kept.
+"""
+import atexit
+import hashlib
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from extractor_registry import get_site
+from html_cache import content_digest
+from pipeline_metrics import record
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_PARSE_TIMEOUT = 60  # seconds per page, counted from when a worker starts it
+DEFAULT_MAX_TASKS_PER_WORKER = 50
+DEFAULT_PARSE_CACHE_BYTES = 32 * 1024 * 1024  # estimated size of cached brand lists
+_DEFAULT_CACHE = object()  # sentinel: use get_default_parse_cache()
+_POLL_INTERVAL = 0.05  # seconds between checks of a pending page's start time
+
+
+class ParseError(Exception):
+    """A page could not be parsed (timeout, crashed worker, or the parser raised)."""
+
+    def __init__(self, site: str, message: str):
+        super().__init__(f"{message} ({site})")
+        self.site = site
+
+
+def _peak_rss_bytes():
+    """High-water RSS of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+_started_queue = None  # worker side: where _run_job reports (job id, start time)
+
+
+def _init_worker(started_queue) -> None:
+    global _started_queue
+    _started_queue = started_queue
+
+
+def _run_job(job_id: int, func, args: tuple):
+    """Worker entry point: report the job's start (the parent times it from here), then run it."""
+    _started_queue.put((job_id, time.time()))
+    return func(*args)
+
+
+def _parse_in_worker(site: str, html_bytes: bytes) -> tuple:
+    """Decode the page and run the site's parser (in a worker). Returns (brands, seconds, peak_rss_bytes)."""
+    start = time.perf_counter()
+    brands = get_site(site).parse(html_bytes.decode('utf-8', errors='ignore'))
+    return brands, time.perf_counter() - start, _peak_rss_bytes()
+
+
+def _record_parse(site: str, html, seconds: float, peak_rss: int = None, result=None, cached: bool = False) -> None:
+    record({'stage': 'parse', 'site': site, 'bytes': len(html or b''), 'seconds': round(seconds, 6),
+            'peak_rss_bytes': peak_rss, 'brands': len(result) if isinstance(result, list) else None, 'cached': cached,
+            'error': str(result) if isinstance(result, ParseError) else None})
+
+
+def page_digest(html) -> str:
+    """SHA-256 of a page (str pages as UTF-8, the same digest html_cache stores bodies under)."""
+    return hashlib.sha256(html).hexdigest() if isinstance(html, bytes) else content_digest(html or '')
+
+
+def _result_size(brands: list) -> int:
+    """Rough in-memory size of a [{'Brand', 'Count'}] list (dict + strings + ints)."""
+    return 64 + sum(200 + len(str(brand.get('Brand', ''))) for brand in brands)
+
+
+class ParseResultCache:
+    """
+    LRU of parse results keyed by (site, SiteExtractor.cache_tag, page digest),
+    evicting least-recently-used entries once their estimated size exceeds
+    `max_bytes`. Thread-safe; hands out shallow copies.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_PARSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (brands, size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(site: str, html, digest: str = None) -> tuple:
+        return (site, get_site(site).cache_tag, digest or page_digest(html))
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return list(entry[0])
+
+    def put(self, key: tuple, brands: list) -> None:
+        size = _result_size(brands)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None: self.size -= previous[1]
+            self._entries[key] = (list(brands), size); self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False); self.size -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear(); self.size = 0
+
+
+def _as_bytes(html) -> bytes:
+    return html if isinstance(html, bytes) else (html or '').encode('utf-8')
+
+
+class _WorkerPool:
+    """
+    One multiprocessing pool plus the start times its workers report. A retired
+    pool takes no new jobs and is terminated once no caller waits on it any more.
+    """
+
+    def __init__(self, workers: int, max_tasks_per_worker: int):
+        context = multiprocessing.get_context('spawn')
+        self._started_queue = context.Queue()
+        self._pool = context.Pool(workers, initializer=_init_worker, initargs=(self._started_queue,), maxtasksperchild=max_tasks_per_worker)
+        self._job_ids = itertools.count()
+        self._started = {}  # job id -> time.time() the worker started it
+        self._waiting = 0   # submitted jobs not yet released by their caller
+        self.retired = False
+        self._lock = threading.Lock()
+
+    def submit(self, func, args: tuple) -> tuple:
+        """Queue func(*args); returns (job id, AsyncResult). Release the job id once done with it."""
+        with self._lock:
+            job_id = next(self._job_ids); self._waiting += 1
+        return job_id, self._pool.apply_async(_run_job, (job_id, func, args))
+
+    def start_time(self, job_id: int):
+        """When a worker started the job (time.time()), or None while it is still queued."""
+        with self._lock:
+            while True:
+                try: started_id, started_at = self._started_queue.get_nowait()
+                except queue.Empty: break
+                self._started[started_id] = started_at
+            return self._started.get(job_id)
+
+    def release(self, job_id: int) -> None:
+        with self._lock:
+            self._started.pop(job_id, None); self._waiting -= 1
+            idle = self.retired and self._waiting == 0
+        if idle: self.terminate()
+
+    def retire(self) -> None:
+        with self._lock:
+            if self.retired: return
+            self.retired = True; idle = self._waiting == 0
+        if idle: self.terminate()
+
+    def terminate(self) -> None:
+        self._pool.terminate()
+        self._started_queue.close()
+
+
+class ParsePool:
+    """
+    Pool of parser processes. `parse_all([(site, html), ...])` parses all pages
+    concurrently and returns a list aligned with the input holding either the
+    parsed list or the ParseError for that page. A job may carry the page's
+    digest as a third element. Pages found in `cache` (default: the process-wide
+    ParseResultCache; None disables) are not parsed again. With `workers=0`
+    pages are parsed inline on the calling thread.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, timeout: float = DEFAULT_PARSE_TIMEOUT,
+                 max_tasks_per_worker: int = DEFAULT_MAX_TASKS_PER_WORKER, cache=_DEFAULT_CACHE):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.cache = get_default_parse_cache() if cache is _DEFAULT_CACHE else cache
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _submit(self, site: str, html_bytes: bytes) -> tuple:
+        """Queue a parse on the current worker pool (started on first use); returns (pool, job id, AsyncResult)."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = _WorkerPool(self.workers, self.max_tasks_per_worker)
+            return (self._pool, *self._pool.submit(_parse_in_worker, (site, html_bytes)))
+
+    def _replace(self, pool) -> None:
+        """Retire `pool` (stuck worker) so new calls start a fresh one; it is terminated once its other pages are collected."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+            pool.retire()
+
+    def parse_all(self, jobs) -> list:
+        jobs = [(job[0], job[1], job[2] if len(job) > 2 else None) for job in jobs]
+        for site, _, _ in jobs: get_site(site)  # unknown sites raise here, without importing any parser
+        if self.cache is None:
+            return self._parse_jobs([(site, html) for site, html, _ in jobs])
+        keys = [self.cache.key(site, html, digest) for site, html, digest in jobs]
+        results = [self.cache.get(key) for key in keys]
+        for (site, html, _), result in zip(jobs, results):
+            if result is not None: _record_parse(site, html, 0.0, result=result, cached=True)
+        misses = [i for i, result in enumerate(results) if result is None]
+        for i, result in zip(misses, self._parse_jobs([jobs[i][:2] for i in misses])):
+            results[i] = result
+            if not isinstance(result, ParseError): self.cache.put(keys[i], result)
+        return results
+
+    def _parse_jobs(self, jobs) -> list:
+        if not jobs:
+            return []
+        if self.workers <= 0:
+            return [self._parse_inline(site, html) for site, html in jobs]
+        payloads = [(site, _as_bytes(html)) for site, html in jobs]
+        submitted = [self._submit(*payload) for payload in payloads]
+        results = []
+        for (site, html), payload, job in zip(jobs, payloads, submitted):
+            result, seconds, peak_rss = self._collect(payload, *job)
+            results.append(result)
+            _record_parse(site, html, seconds, peak_rss, result)
+        return results
+
+    def _collect(self, payload: tuple, pool, job_id: int, pending) -> tuple:
+        """
+        Wait for one submitted parse; returns (brands or ParseError, seconds, peak_rss).
+        The timeout runs from when a worker started the page. A page still queued
+        on a retired pool is moved to the current one.
+        """
+        site = payload[0]
+        try:
+            while not pending.ready():
+                started = pool.start_time(job_id)
+                if started is None and pool.retired:
+                    pool.release(job_id)
+                    pool, job_id, pending = self._submit(*payload)
+                elif started is not None and time.time() - started > self.timeout:
+                    print("Warning (ParsePool): replacing parser workers after a timeout.")
+                    self._replace(pool)
+                    return ParseError(site, f"Parse timed out after {self.timeout}s"), time.time() - started, None
+                else:
+                    pending.wait(_POLL_INTERVAL)
+            try:
+                return pending.get()
+            except Exception as e:
+                started = pool.start_time(job_id)
+                return ParseError(site, f"Parser failed: {e}"), time.time() - started if started else 0.0, None
+        finally:
+            pool.release(job_id)
+
+    def _parse_inline(self, site: str, html):
+        start = time.perf_counter()
+        try:
+            result = get_site(site).parse(html.decode('utf-8', errors='ignore') if isinstance(html, bytes) else html or '')
+        except Exception as e:
+            result = ParseError(site, f"Parser failed: {e}")
+        _record_parse(site, html, time.perf_counter() - start, _peak_rss_bytes(), result)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+_default_cache = None
+_default_cache_lock = threading.Lock()  # separate from _default_pool_lock: ParsePool() takes it while that one is held
+
+
+def get_default_parse_cache() -> ParseResultCache:
+    """Process-wide parse-result cache (size from PARSE_CACHE_MAX_BYTES)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ParseResultCache(int(os.environ.get("PARSE_CACHE_MAX_BYTES", DEFAULT_PARSE_CACHE_BYTES)))
+        return _default_cache
+
+
+def get_default_parse_pool() -> ParsePool:
+    """Process-wide parse pool (size from PARSE_WORKERS); its workers are terminated at exit."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            workers = int(os.environ.get("PARSE_WORKERS", DEFAULT_WORKERS))
+            timeout = float(os.environ.get("PARSE_TIMEOUT", DEFAULT_PARSE_TIMEOUT))
+            _default_pool = ParsePool(workers=workers, timeout=timeout)
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+def parse_all(jobs, pool: ParsePool = None) -> list:
+    """Parse [(site, html[, digest]), ...] on `pool` (default: the process-wide one); see ParsePool.parse_all."""
+    return (pool or get_default_parse_pool()).parse_all(jobs)
+
+
+def parse_page(site: str, html, digest: str = None) -> list:
+    """Parse one page inline through the process-wide parse-result cache; raises ParseError."""
+    result = ParsePool(workers=0).parse_all([(site, html, digest)])[0]
+    if isinstance(result, ParseError):
+        raise result
+    return result
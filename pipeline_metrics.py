@@ -0,0 +1,148 @@
+"""
+Stage-level instrumentation for the comparison pipeline (no Streamlit dependency).
+
+Each stage (fetch, parse, clean, match, merge, db_save, db_load) is timed with
+`stage(name, **fields)`; the record is
+
+  * appended to the current `PipelineRun` (see `pipeline_run`), which the app
+    shows as a per-run breakdown,
+  * written to stderr as one JSON line (disable with PIPELINE_METRICS_LOG=0),
+  * added to process-wide per-stage totals, rendered in the Prometheus text
+    format by `render_prometheus()` and optionally served over HTTP by
+    `start_metrics_server(port)`. Records carrying a `panel` (the app's
+    per-fragment 'render' stages) get their own series, labelled by panel.
+
+The current run is a context variable, so fetcher / db_utils / parse_pool
+record into it without the run being passed around.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_LOG_JSON = os.environ.get("PIPELINE_METRICS_LOG", "1") != "0"
+_current_run = contextvars.ContextVar('pipeline_run', default=None)
+LABEL_FIELDS = ('panel',)  # record fields that split a stage's totals into labelled series
+_totals = {}  # (stage, *LABEL_FIELDS values) -> {'count', 'seconds', 'bytes', 'errors'}
+_totals_lock = threading.Lock()
+
+
+class PipelineRun:
+    """Stage records of one comparison run, in completion order."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = time.time()
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self) -> list[dict]:
+        """Per-stage totals (count, seconds, bytes) in first-seen order."""
+        stages = {}
+        for record in self.records:
+            row = stages.setdefault(record['stage'], {'stage': record['stage'], 'count': 0, 'seconds': 0.0, 'bytes': 0})
+            row['count'] += 1; row['seconds'] += record.get('seconds', 0.0); row['bytes'] += record.get('bytes') or 0
+        return list(stages.values())
+
+
+@contextmanager
+def pipeline_run(label: str):
+    """Collect every stage recorded inside the block into a new PipelineRun."""
+    run = PipelineRun(label)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+
+
+def current_run():
+    return _current_run.get()
+
+
+def record(record: dict) -> None:
+    """Store a finished stage record ({'stage', 'seconds', ...}) everywhere it is reported."""
+    run = _current_run.get()
+    if run is not None:
+        record.setdefault('run', run.label)
+        run.add(record)
+    with _totals_lock:
+        key = (record['stage'], *(record.get(field) for field in LABEL_FIELDS))
+        totals = _totals.setdefault(key, {'count': 0, 'seconds': 0.0, 'bytes': 0, 'errors': 0})
+        totals['count'] += 1; totals['seconds'] += record.get('seconds', 0.0); totals['bytes'] += record.get('bytes') or 0
+        totals['errors'] += 1 if record.get('error') else 0
+    if _LOG_JSON:
+        print(json.dumps({'event': 'pipeline_stage', 'ts': round(time.time(), 3), **record}, default=str), file=sys.stderr)
+
+
+@contextmanager
+def stage(name: str, **fields):
+    """
+    Time the block as stage `name`. Yields the record dict so the block can add
+    fields (rows, bytes, status, ...); an exception is recorded as `error` and re-raised.
+    """
+    rec = {'stage': name, **fields}
+    start = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec['error'] = type(e).__name__
+        raise
+    finally:
+        rec['seconds'] = round(time.perf_counter() - start, 6)
+        record(rec)
+
+
+def _label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key: tuple) -> str:
+    """'stage="…",panel="…"' for a _totals key; unset label fields are left out."""
+    pairs = [('stage', key[0]), *((field, value) for field, value in zip(LABEL_FIELDS, key[1:]) if value is not None)]
+    return ','.join(f'{name}="{_label_value(value)}"' for name, value in pairs)
+
+
+def render_prometheus() -> str:
+    """Process-wide per-stage (and per-panel) totals in the Prometheus text exposition format."""
+    with _totals_lock:
+        totals = {key: dict(values) for key, values in _totals.items()}
+    lines = []
+    for metric, key, kind, help_text in (
+            ('pipeline_stage_total', 'count', 'counter', 'Completed pipeline stages.'),
+            ('pipeline_stage_seconds_total', 'seconds', 'counter', 'Wall-clock seconds spent per stage.'),
+            ('pipeline_stage_bytes_total', 'bytes', 'counter', 'Bytes handled per stage (page sizes for fetch/parse).'),
+            ('pipeline_stage_errors_total', 'errors', 'counter', 'Stages that raised.')):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{{_labels(labels)}}} {values[key]}' for labels, values in sorted(totals.items(), key=lambda item: tuple(str(part or '') for part in item[0]))]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404); return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve render_prometheus() at http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='pipeline-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,23 @@
+from brand_aliases import BrandAliasIndex
+from comparison_engine import ComparisonCache, compare_brand_lists
+
+
+def test_fuzzy_suggestions_stay_with_the_run_until_confirmed():
+    aliases = BrandAliasIndex()
+    ounass = [{'Brand': 'Christian Louboutin', 'Count': 3}]
+    competitor = [{'Brand': 'Christian Louboutinn', 'Count': 2}]
+    result = compare_brand_lists(ounass, competitor, 'Sephora', fuzzy_threshold=90, aliases=aliases, cache=ComparisonCache())
+    assert len(result.df_comparison) == 1
+    assert [s[:3] for s in result.suggestions] == [('Sephora', 'CHRISTIANLOUBOUTINN', 'CHRISTIANLOUBOUTIN')]
+    assert aliases.lookup('Sephora', 'CHRISTIANLOUBOUTINN') is None
+    assert aliases.pending == 0 and aliases.version == 0
+
+    assert aliases.confirm(result.suggestions) == 1
+    assert aliases.lookup('Sephora', 'CHRISTIANLOUBOUTINN') == 'CHRISTIANLOUBOUTIN'
+    assert aliases.pending == 1 and aliases.version == 1
+
+
+def test_confirming_a_known_alias_keeps_the_index_version():
+    aliases = BrandAliasIndex({('Sephora', 'DIORA'): 'DIOR'})
+    aliases.confirm([('Sephora', 'DIORA', 'DIOR', 'Dior', 99.0)])
+    assert aliases.pending == 1 and aliases.version == 0
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import brand_matching
+from brand_matching import custom_scorer, match_brands
+
+
+@pytest.fixture(autouse=True, params=['rapidfuzz', 'thefuzz'])
+def backend(request, monkeypatch):
+    """Run every test with the rapidfuzz batch scorer and with the thefuzz fallback."""
+    if request.param == 'thefuzz':
+        monkeypatch.setattr(brand_matching, '_HAS_RAPIDFUZZ', False)
+    return request.param
+
+
+def test_short_name_prefers_token_match_over_substring():
+    # "DIOR" is a substring of "DIORA", but only "CHRISTIAN DIOR" contains it as a word.
+    matches = match_brands(['Dior'], ['Diora', 'Christian Dior'], threshold=90)
+    assert [(i, j) for i, j, _ in matches] == [(0, 1)]
+
+
+def test_substring_of_similar_length_is_not_a_match():
+    assert match_brands(['Dior'], ['Diora'], threshold=90) == []
+    assert custom_scorer('DIOR', 'DIORA') < 90
+
+
+def test_near_identical_names_still_match():
+    matches = match_brands(['Christian Louboutin', 'Tom Ford'], ['Tom Ford Beauty', 'Christian Louboutinn'], threshold=90)
+    assert sorted((i, j) for i, j, _ in matches) == [(0, 1), (1, 0)]
+
+
+def test_backends_score_processed_names_alike(monkeypatch):
+    pairs = [('Dior', 'Diora'), ('dior', 'Christian Dior'), ('TOM-FORD', 'tom ford beauty'), ('Saint Laurent', 'SAINT LAURENT PARIS')]
+    left, right = [a for a, _ in pairs], [b for _, b in pairs]
+    idx = np.arange(len(pairs))
+    monkeypatch.setattr(brand_matching, '_HAS_RAPIDFUZZ', True)
+    fast = brand_matching.score_pairs(left, right, idx, idx)
+    monkeypatch.setattr(brand_matching, '_HAS_RAPIDFUZZ', False)
+    fallback = brand_matching.score_pairs(left, right, idx, idx)
+    assert list(fast[0]) == list(fallback[0]) and list(fast[1]) == list(fallback[1])
@@ -0,0 +1,41 @@
+from brand_aliases import BrandAliasIndex
+from comparison import match_settings, snapshot_brand_keys, snapshot_fuzzy_pairs, to_snapshot_rows
+from comparison_engine import ComparisonCache, compare_brand_lists
+
+
+def test_comparison_records_its_match_settings():
+    ounass = [{'Brand': 'Christian Louboutin', 'Count': 3}]
+    competitor = [{'Brand': 'Christian Louboutinn', 'Count': 2}]
+    cache = ComparisonCache()
+    fuzzy = compare_brand_lists(ounass, competitor, 'Sephora', fuzzy_threshold=90, cache=cache).df_comparison
+    exact = compare_brand_lists(ounass, competitor, 'Sephora', cache=cache).df_comparison
+    assert len(fuzzy) == 1 and len(exact) == 2
+    assert match_settings(fuzzy.attrs.get('fuzzy_threshold')) == match_settings(90.0)
+    assert match_settings(exact.attrs.get('fuzzy_threshold')) == match_settings()
+    cached = compare_brand_lists(ounass, competitor, 'Sephora', fuzzy_threshold=90, cache=cache).df_comparison
+    assert cached.attrs['fuzzy_threshold'] == 90
+
+
+def test_cached_comparison_keeps_its_fuzzy_suggestions():
+    ounass = [{'Brand': 'Christian Louboutin', 'Count': 3}]
+    competitor = [{'Brand': 'Christian Louboutinn', 'Count': 2}]
+    aliases, cache = BrandAliasIndex(), ComparisonCache()
+    first = compare_brand_lists(ounass, competitor, 'Sephora', fuzzy_threshold=90, aliases=aliases, cache=cache)
+    assert [s[1:3] for s in first.suggestions] == [('CHRISTIANLOUBOUTINN', 'CHRISTIANLOUBOUTIN')]
+    first.suggestions.clear()  # e.g. dismissed in the review panel
+    rerun = compare_brand_lists(ounass, competitor, 'Sephora', fuzzy_threshold=90, aliases=aliases, cache=cache)
+    assert cache.hits == 1 and len(rerun.df_comparison) == 1
+    assert [s[1:3] for s in rerun.suggestions] == [('CHRISTIANLOUBOUTINN', 'CHRISTIANLOUBOUTIN')]
+
+
+def test_incremental_run_rematches_fuzzy_pairs_instead_of_reusing_them():
+    ounass = [{'Brand': 'Christian Louboutin', 'Count': 3}, {'Brand': 'Gucci', 'Count': 1}]
+    competitor = [{'Brand': 'Christian Louboutinn', 'Count': 2}, {'Brand': 'Gucci', 'Count': 4}]
+    first = compare_brand_lists(ounass, competitor, 'Sephora', fuzzy_threshold=90, cache=ComparisonCache())
+    rows, fuzzy_pairs = to_snapshot_rows(first.df_comparison, 'Sephora'), snapshot_fuzzy_pairs(first.df_comparison)
+    assert fuzzy_pairs == [['Sephora', 'CHRISTIANLOUBOUTINN', 'CHRISTIANLOUBOUTIN']]
+    known_keys = snapshot_brand_keys(rows, fuzzy_pairs)
+    assert known_keys['Sephora'] == {'Gucci': 'GUCCI'}
+    assert known_keys['Ounass'] == {'Christian Louboutin': 'CHRISTIANLOUBOUTIN', 'Gucci': 'GUCCI'}
+    rerun = compare_brand_lists(ounass, competitor, 'Sephora', fuzzy_threshold=90, known_keys=known_keys, cache=ComparisonCache())
+    assert len(rerun.df_comparison) == 2 and rerun.suggestions == first.suggestions
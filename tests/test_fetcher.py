@@ -0,0 +1,89 @@
+import asyncio
+from collections import defaultdict
+
+from aiohttp import web
+
+from fetcher import AsyncFetcher, FetchError
+from html_cache import HtmlCache
+
+
+async def _serve(handler, test):
+    """Run `test(port)` against a stub server listening on a free local port."""
+    app = web.Application()
+    app.router.add_get('/{path:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        return await test(port)
+    finally:
+        await runner.cleanup()
+
+
+def test_per_host_limits_cap_concurrent_requests():
+    active, peak = defaultdict(int), defaultdict(int)
+
+    async def handler(request):
+        host = request.host.split(':')[0]
+        active[host] += 1
+        peak[host] = max(peak[host], active[host])
+        await asyncio.sleep(0.05)
+        active[host] -= 1
+        return web.Response(text='ok')
+
+    async def test(port):
+        urls = [f"http://{host}:{port}/{i}" for host in ('127.0.0.1', 'localhost') for i in range(6)]
+        async with AsyncFetcher(per_host_limit=2, host_limits={'localhost': 1}, cache=None) as fetcher:
+            return await fetcher.fetch_many(urls)
+
+    assert asyncio.run(_serve(handler, test)) == ['ok'] * 12
+    assert peak == {'127.0.0.1': 2, 'localhost': 1}
+
+
+def test_retries_honour_retry_after_then_give_up():
+    calls = defaultdict(int)
+
+    async def handler(request):
+        path = request.match_info['path']
+        calls[path] += 1
+        if path == 'flaky' and calls[path] <= 2:
+            return web.Response(status=429 if calls[path] == 1 else 503, headers={'Retry-After': '0'})
+        if path == 'down':
+            return web.Response(status=503, headers={'Retry-After': '0'})
+        if path == 'missing':
+            return web.Response(status=404)
+        return web.Response(text=path)
+
+    async def test(port):
+        async with AsyncFetcher(max_retries=2, backoff_max=0.5, cache=None) as fetcher:
+            return await fetcher.fetch_many([f"http://127.0.0.1:{port}/{path}" for path in ('flaky', 'down', 'missing')])
+
+    flaky, down, missing = asyncio.run(_serve(handler, test))
+    assert flaky == 'flaky' and calls['flaky'] == 3
+    assert isinstance(down, FetchError) and down.status == 503 and calls['down'] == 3
+    assert isinstance(missing, FetchError) and missing.status == 404 and calls['missing'] == 1
+
+
+def test_unchanged_page_is_revalidated_and_served_from_cache(tmp_path):
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304, headers={'ETag': '"v1"'})
+        return web.Response(text='<html>brands</html>', headers={'ETag': '"v1"'})
+
+    cache = HtmlCache(str(tmp_path / 'html'))
+
+    async def test(port):
+        bodies = []
+        for _ in range(2):
+            async with AsyncFetcher(cache=cache) as fetcher:
+                bodies.append(await fetcher.fetch(f"http://127.0.0.1:{port}/page"))
+        return bodies
+
+    assert asyncio.run(_serve(handler, test)) == ['<html>brands</html>'] * 2
+    assert seen == [None, '"v1"']
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
@@ -0,0 +1,21 @@
+import html_cache
+from fetcher import AsyncFetcher
+
+
+def test_unusable_cache_dir_disables_the_default_cache(tmp_path, monkeypatch, capsys):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    monkeypatch.setattr(html_cache, '_default_cache', None)
+    monkeypatch.setattr(html_cache, '_unusable_cache_dir', None)
+    monkeypatch.setenv('HTML_CACHE_DIR', str(blocker / 'html'))
+    assert html_cache.get_default_cache() is None
+    assert AsyncFetcher().cache is None
+    assert capsys.readouterr().out.count('HTML cache disabled') == 1
+
+
+def test_default_cache_follows_html_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(html_cache, '_default_cache', None)
+    monkeypatch.setenv('HTML_CACHE_DIR', str(tmp_path / 'html'))
+    cache = html_cache.get_default_cache()
+    assert cache is not None and cache.cache_dir == str(tmp_path / 'html')
+    assert html_cache.get_default_cache() is cache
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import parse_pool
+from extractor_registry import OUNASS_SITE
+
+
+def test_default_pool_builds_without_deadlock(monkeypatch):
+    monkeypatch.setattr(parse_pool, '_default_pool', None)
+    monkeypatch.setattr(parse_pool, '_default_cache', None)
+    monkeypatch.setenv('PARSE_WORKERS', '0')
+    built = []
+    worker = threading.Thread(target=lambda: built.append(parse_pool.get_default_parse_pool()), daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert built, "get_default_parse_pool() did not return (lock re-entered?)"
+    assert built[0].cache is parse_pool.get_default_parse_cache()
+    assert parse_pool.get_default_parse_pool() is built[0]
+
+
+def test_parse_all_serves_repeat_pages_from_cache():
+    pool = parse_pool.ParsePool(workers=0, cache=parse_pool.ParseResultCache())
+    parsed = []
+
+    def fake_parse(jobs):
+        parsed.extend(jobs)
+        return [[{'Brand': 'DIOR', 'Count': 3}] for _ in jobs]
+
+    pool._parse_jobs = fake_parse
+    first = pool.parse_all([(OUNASS_SITE, '<html>a</html>')])
+    second = pool.parse_all([(OUNASS_SITE, '<html>a</html>', parse_pool.page_digest('<html>a</html>'))])
+    assert first == second == [[{'Brand': 'DIOR', 'Count': 3}]]
+    assert len(parsed) == 1
+    assert pool.cache.hits == 1
+
+
+def test_parse_result_cache_evicts_by_size():
+    cache = parse_pool.ParseResultCache(max_bytes=1000)
+    brands = [{'Brand': 'X' * 10, 'Count': 1}] * 2
+    for i in range(10):
+        cache.put((OUNASS_SITE, 'tag', str(i)), brands)
+    assert cache.size <= 1000
+    assert cache.get((OUNASS_SITE, 'tag', '0')) is None
+    assert cache.get((OUNASS_SITE, 'tag', '9')) == brands
+
+
+def _sleepy_parse(site, html_bytes):
+    time.sleep(float(html_bytes))
+    return [{'Brand': site, 'Count': 1}], float(html_bytes), None
+
+
+def test_timeout_counts_from_start_and_spares_other_pages(monkeypatch):
+    started_pools, terminated = [], []
+
+    class RecordingWorkerPool(parse_pool._WorkerPool):
+        def __init__(self, *args):
+            super().__init__(*args); started_pools.append(self)
+
+        def terminate(self):
+            terminated.append(self); super().terminate()
+
+    monkeypatch.setattr(parse_pool, '_parse_in_worker', _sleepy_parse)
+    monkeypatch.setattr(parse_pool, '_WorkerPool', RecordingWorkerPool)
+    pool = parse_pool.ParsePool(workers=2, timeout=1.0, cache=None)
+    try:
+        # 'stuck' holds one worker; the others queue on the second and each finishes within
+        # its own timeout, though the last ones end well after 1s from submission.
+        results = pool._parse_jobs([('stuck', b'30'), ('a', b'0.6'), ('b', b'0.6'), ('c', b'0.6')])
+        assert isinstance(results[0], parse_pool.ParseError) and 'timed out' in str(results[0])
+        assert results[1:] == [[{'Brand': site, 'Count': 1}] for site in 'abc']
+        assert started_pools[0].retired and terminated == [started_pools[0]]
+        assert pool._parse_jobs([('d', b'0')]) == [[{'Brand': 'd', 'Count': 1}]]
+        assert pool._pool is started_pools[-1] and not pool._pool.retired
+    finally:
+        pool.close()
@@ -0,0 +1,15 @@
+import pipeline_metrics
+from pipeline_metrics import record, render_prometheus
+
+
+def test_render_stages_are_labelled_per_panel(monkeypatch):
+    monkeypatch.setattr(pipeline_metrics, '_totals', {})
+    record({'stage': 'render', 'panel': 'inputs', 'seconds': 0.25})
+    record({'stage': 'render', 'panel': 'inputs', 'seconds': 0.5})
+    record({'stage': 'render', 'panel': 'history', 'seconds': 1.0})
+    record({'stage': 'fetch', 'seconds': 2.0, 'bytes': 10, 'error': 'TimeoutError'})
+    text = render_prometheus()
+    assert 'pipeline_stage_total{stage="render",panel="inputs"} 2' in text
+    assert 'pipeline_stage_seconds_total{stage="render",panel="history"} 1.0' in text
+    assert 'pipeline_stage_errors_total{stage="fetch"} 1' in text
+    assert 'pipeline_stage_total{stage="render"}' not in text
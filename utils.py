@@ -1,11 +1,12 @@
-"""Utility helpers shared by extractor modules and Streamlit app (v2)."""
+"""Utility helpers shared by extractor modules, the Streamlit app and batch jobs (v2)."""
+import numpy as np
 import pandas as pd
 import re
-try:
-    from thefuzz import process
-    _HAS_FUZZ = True
-except ModuleNotFoundError:
-    _HAS_FUZZ = False
+import unicodedata
+from functools import lru_cache
+from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
+
+from brand_matching import DEFAULT_THRESHOLD, match_brands
 
 def _clean(name: str) -> str:
     """Remove non‑alphanumerics and uppercase – used as merge key."""
@@ -14,13 +15,15 @@ def _clean(name: str) -> str:
 def merge_brand_frames(df_left: pd.DataFrame,
                        df_right: pd.DataFrame,
                        left_label: str = 'Ounass',
-                       right_label: str = 'Competitor') -> pd.DataFrame:
+                       right_label: str = 'Competitor',
+                       fuzzy_threshold: float = DEFAULT_THRESHOLD) -> pd.DataFrame:
     """
     Merge two ‹Designer, Count› dataframes and output:
       Designer | Count_<left_label> | Count_<right_label> | Delta
     - Uses a simple normalised key for first pass.
     - Optionally performs fuzzy matching **only** for rows still unmatched
-      (requires `thefuzz`; if missing, skips fuzzy step).
+      (brand_matching; `fuzzy_threshold=None` skips the fuzzy step, as does a
+      missing `rapidfuzz`/`thefuzz`).
     """
     # ── Normalise keys ──────────────────────────────────────────────────────────
     df_l = df_left.copy()
@@ -35,27 +38,22 @@ def merge_brand_frames(df_left: pd.DataFrame,
                       suffixes=(f'_{left_label}', f'_{right_label}'))
 
     # ── Optional fuzzy for leftover NaNs ────────────────────────────────────────
-    if _HAS_FUZZ:
-        left_missing = merged['Designer_'+left_label].isna()
-        right_missing = merged['Designer_'+right_label].isna()
-
-        if left_missing.any():
-            choices = df_l['Designer'].tolist()
-            for idx in merged[left_missing].index:
-                cand, score = process.extractOne(merged.at[idx, 'Designer_'+right_label], choices)
-                if score >= 90:
-                    row_match = df_l.loc[df_l['Designer'] == cand].iloc[0]
-                    merged.at[idx, 'Designer_'+left_label] = row_match['Designer']
-                    merged.at[idx, 'Count_'+left_label] = row_match['Count']
-
-        if right_missing.any():
-            choices = df_r['Designer'].tolist()
-            for idx in merged[right_missing].index:
-                cand, score = process.extractOne(merged.at[idx, 'Designer_'+left_label], choices)
-                if score >= 90:
-                    row_match = df_r.loc[df_r['Designer'] == cand].iloc[0]
-                    merged.at[idx, 'Designer_'+right_label] = row_match['Designer']
-                    merged.at[idx, 'Count_'+right_label] = row_match['Count']
+    # One-to-one: each right-only row is folded into at most one left-only row.
+    if fuzzy_threshold is not None:
+        left_only = merged.index[merged['Designer_'+right_label].isna()]
+        right_only = merged.index[merged['Designer_'+left_label].isna()]
+        if len(left_only) and len(right_only):
+            matches = match_brands(merged.loc[left_only, 'Designer_'+left_label].tolist(),
+                                   merged.loc[right_only, 'Designer_'+right_label].tolist(),
+                                   merged.loc[left_only, 'key'].tolist(),
+                                   merged.loc[right_only, 'key'].tolist(),
+                                   threshold=fuzzy_threshold)
+            if matches:
+                left_rows = left_only[[i for i, _, _ in matches]]
+                right_rows = right_only[[j for _, j, _ in matches]]
+                for col in ('Designer_'+right_label, 'Count_'+right_label):
+                    merged.loc[left_rows, col] = merged.loc[right_rows, col].to_numpy()
+                merged = merged.drop(index=right_rows)
 
     # ── Final tidy‑up ───────────────────────────────────────────────────────────
     merged['Designer'] = merged['Designer_'+left_label].combine_first(merged['Designer_'+right_label])
@@ -65,3 +63,101 @@ def merge_brand_frames(df_left: pd.DataFrame,
     result = merged[['Designer', f'Count_{left_label}', f'Count_{right_label}']]
     result['Delta'] = result[f'Count_{left_label}'] - result[f'Count_{right_label}']
     return result.sort_values('Delta', ascending=False).reset_index(drop=True)
+
+
+# Common suffixes/qualifiers removed when they appear as the last word(s) of a brand name
+BRAND_SUFFIXES_TO_REMOVE = frozenset({
+    "BEAUTY", "PERFUMES", "PARFUMS", "FRAGRANCES", "FRAGRANCE",
+    "COSMETICS", "MAKEUP", "MAQUILLAGE", "SKINCARE", "HAIRCARE",
+    "COLLECTION", "BEAUTE", "PROFESSIONAL", "PROFESSIONNEL",
+    # Add more specific ones if needed, e.g., "COUTURE"
+    "COUTURE",
+})
+# Hyphen/dot/ampersand/brackets/slashes/quotes/qmarks -> space; apostrophes and trademark/copyright symbols dropped
+_BRAND_PUNCT_TABLE = str.maketrans({**{c: ' ' for c in '.&-()[]{}<>/"?'}, **{c: None for c in "'®™©"}})
+_NON_ALNUM_ASCII = re.compile(r'[^A-Za-z0-9]+')
+BRAND_KEY_CACHE_SIZE = 65536  # distinct brand names memoized per process
+
+
+def clean_brand_name(brand_name):
+    """Cleans brand names for better matching across sources."""
+    if not isinstance(brand_name, str) or not brand_name:
+        return "" # Return empty string for non-strings or empty input
+    return _clean_brand_name_cached(brand_name)
+
+
+@lru_cache(maxsize=BRAND_KEY_CACHE_SIZE)
+def _clean_brand_name_cached(brand_name: str) -> str:
+    # 1. NFKC Normalization: Handles compatibility characters and improves standardization (no-op for ASCII).
+    if brand_name.isascii():
+        normalized = brand_name
+    else:
+        try:
+            normalized = unicodedata.normalize('NFKC', brand_name)
+        except Exception as e:
+            print(f"Warning: NFKC normalization failed for '{brand_name}': {e}")
+            normalized = brand_name # Fallback to original on error
+
+    # 2. Convert to Uppercase for case-insensitive operations
+    words = normalized.upper().split()
+
+    # 3./4. Remove suffixes while they are the last word (always keep the first word)
+    end = len(words)
+    while end > 1 and words[end - 1] in BRAND_SUFFIXES_TO_REMOVE:
+        end -= 1
+    cleaned_suffix_removed = " ".join(words[:end])
+
+    # 5. Basic punctuation and symbol removal, then consolidate whitespace
+    cleaned_punct = " ".join(cleaned_suffix_removed.translate(_BRAND_PUNCT_TABLE).split())
+
+    # 6. Decompose accents and remove non-ASCII characters (NFKD method)
+    if cleaned_punct.isascii():
+        cleaned_ascii = cleaned_punct
+    else:
+        try:
+            cleaned_ascii = unicodedata.normalize('NFKD', cleaned_punct).encode('ascii', 'ignore').decode('utf-8')
+        except Exception as e:
+            print(f"Warning: ASCII conversion failed for '{cleaned_punct}': {e}")
+            cleaned_ascii = cleaned_punct # Fallback
+
+    # 7. Final step: Remove ALL remaining spaces and non-alphanumeric characters for the merge key
+    if cleaned_ascii.isascii():
+        final_key = _NON_ALNUM_ASCII.sub('', cleaned_ascii)
+    else:
+        final_key = ''.join(c for c in cleaned_ascii if c.isalnum())
+
+    # Handle edge case: if result is empty string after all cleaning
+    if not final_key:
+        # Fallback: just alphanumeric from the original uppercase name
+        return ''.join(c for c in brand_name.upper() if c.isalnum())
+
+    return final_key
+
+
+def clean_brand_names(values: pd.Series) -> pd.Series:
+    """
+    Vectorized `clean_brand_name` for a Series: each distinct value is cleaned
+    once and the keys are mapped back by position (same result as `.apply`).
+    """
+    if values.empty:
+        return values.apply(clean_brand_name)
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    keys = np.array([clean_brand_name(value) for value in uniques], dtype=object)
+    return pd.Series(keys[codes], index=values.index, name=values.name).infer_objects()
+
+
+def ensure_ounass_full_list_parameter(url: str) -> str:
+    """Force `fh_maxdisplaynrvalues_designer=-1` on Ounass URLs so the Designer facet lists every brand."""
+    param_key = 'fh_maxdisplaynrvalues_designer'; param_value = '-1'
+    try:
+        if not url or 'ounass' not in urlparse(url).netloc.lower(): return url
+    except Exception: print(f"Warning: Could not parse Ounass URL: {url}"); return url
+    try:
+        parsed_url = urlparse(url); query_params = parse_qs(parsed_url.query, keep_blank_values=True)
+        needs_update = (param_key not in query_params or not query_params[param_key] or query_params[param_key][0] != param_value)
+        if needs_update:
+            query_params[param_key] = [param_value]; new_query_string = urlencode(query_params, doseq=True)
+            url_components = list(parsed_url); url_components[4] = new_query_string
+            new_url = urlunparse(url_components); print(f"Updated Ounass URL with param: {new_url}"); return new_url
+        else: return url
+    except Exception as e: print(f"Warning: Error processing Ounass URL parameters: {e}"); return url